@@ -0,0 +1,94 @@
+"""
+AdviceCache keeps disaster prevention advice per earthquake.
+
+The advice depends only on the quake, yet right after a felt quake many
+users ask /eq_latest for the same EarthquakeNo within minutes. Advice is
+cached by the CWA earthquake ID (TTL + LRU via cachetools), and
+concurrent misses for one ID share a single generation (single-flight):
+the first caller generates, the others wait for its result.
+
+precompute() generates advice for a new quake in the background, so it is
+usually cached before anyone asks. Fallback advice (model not ready, queue
+busy) is returned but not cached, so a later request can do better.
+"""
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from cachetools import TTLCache
+
+
+class AdviceCache:
+    def __init__(self, generate: Callable[..., str], fallback: str = "", maxsize: int = 256,
+                 ttl: float = 7 * 86400, wait_timeout: Optional[float] = 120) -> None:
+        """generate(eq, **kwargs) produces the advice; `fallback` is what it returns when it could not."""
+        self.generate = generate
+        self.fallback = fallback
+        self.wait_timeout = wait_timeout
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.precomputed = 0
+
+    def get(self, eq: dict, **kwargs) -> str:
+        """Return the advice for eq, generating it at most once per earthquake ID."""
+        key = eq.get("ID")
+        if key is None:
+            return self.generate(eq, **kwargs)
+        key = str(key)
+        with self._lock:
+            advice = self._cache.get(key)
+            if advice is not None:
+                self.hits += 1
+                return advice
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.shared += 1
+        if not owner:
+            try:
+                return future.result(timeout=self.wait_timeout)
+            except Exception:
+                return self.fallback
+
+        try:
+            advice = self.generate(eq, **kwargs)
+        except Exception as e:
+            advice = self.fallback
+            print(f"Disaster prevention advice for {key} failed: {e}")
+        with self._lock:
+            if advice and advice != self.fallback:
+                self._cache[key] = advice
+            self._in_flight.pop(key, None)
+        future.set_result(advice)
+        return advice
+
+    def precompute(self, eq: dict, **kwargs) -> None:
+        """Generate advice for eq in a background thread unless it is cached or being generated."""
+        key = eq.get("ID")
+        if key is None:
+            return
+        with self._lock:
+            if str(key) in self._cache or str(key) in self._in_flight:
+                return
+            self.precomputed += 1
+        print(f"--- Precomputing disaster prevention advice for earthquake {key} ---")
+        threading.Thread(target=self.get, args=(eq,), kwargs=kwargs, name="advice-precompute", daemon=True).start()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "cached": len(self._cache),
+                "in_flight": len(self._in_flight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "precomputed": self.precomputed,
+            }
@@ -1,64 +1,159 @@
 # ai_service.py - Enhanced AI service for earthquake queries
+import base64
 import json
 import os
 import re
+import threading
+import time
 import requests
 from datetime import datetime, timedelta
 from gradio_client import Client
 
 from .config import MCP_SERVER_URL
+from .config import LLM_QUEUE_DEADLINE, ADVICE_CACHE_SIZE, ADVICE_CACHE_TTL, EQ_CONTEXT_TOKENS
+from .config import MCP_POOL_SIZE, MCP_CACHE_SIZE, MCP_CACHE_TTL, MCP_CACHE_TTL_RECENT
+from .config import LLM_CACHE_SIZE, LLM_CACHE_TTL, LLM_CACHE_TTL_RELATIVE, LLM_CACHE_DB
+from .config import (LLM_BACKENDS, OPENAI_COMPAT_MODEL, OPENAI_COMPAT_API_KEY, LLM_HEDGE_PERCENTILE,
+                     LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MAX_DELAY)
+from .config import (RAG_ENABLED, VECTOR_INDEX_DIR, RAG_TOP_K, RAG_MIN_SCORE, RAG_CONTEXT_TOKENS,
+                     VECTOR_IVF_MIN, VECTOR_IVF_LISTS, VECTOR_IVF_PROBES)
+from .mcp_pool import GradioClientPool, QueryCache
+from .tokens import estimate_tokens, truncate_to_tokens
+from .eq_context import build_earthquake_context
+from .eq_intents import IntentRouter
+from .advice_cache import AdviceCache
+from .response_cache import ResponseCache, cache_key
+from .vector_index import VectorIndex
+from .knowledge import seed_passages, earthquake_report_passage
+from .llm_scheduler import (LLM_PRIORITY_ALERT, LLM_PRIORITY_INTERACTIVE, LLM_PRIORITY_BACKGROUND,
+                            LLMUnavailable, get_llm_scheduler)
+from .model_readiness import ModelReadiness
+from .llm_router import LLMBackend, LLMRouter, parse_backends
+from .cwa_service import significant_store
 
 # Ollama server configuration
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://ollama.zeabur.internal:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:270m")
 OLLAMA_PROMPT_TEMPLATE = "Context:\n{context}\n\nQuestion: {prompt}\n\nPlease provide a concise and informative answer based on the context provided."
 
+# Sampling options shared by chat and earthquake answers
+OLLAMA_GENERATE_OPTIONS = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "top_k": 40,
+    "num_predict": 256,
+}
+
 # Model for disaster prevention advice
 OLLAMA_DISASTER_MODEL = os.getenv("OLLAMA_DISASTER_MODEL", "gemma3:120m")
 
+# Multimodal model for photos; empty disables image questions
+OLLAMA_VISION_MODEL = os.getenv("OLLAMA_VISION_MODEL", "")
+
+# Embedding model for retrieval (RAG_ENABLED)
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+
+# Seconds a question's embedding waits for an LLM slot; after that it is answered without retrieval
+RAG_QUERY_DEADLINE = 2.0
+
 # Timeout settings
-MODEL_PULL_TIMEOUT = 120  # Timeout for model pulling in seconds
+MODEL_PULL_TIMEOUT = 120  # Seconds without pull progress (or for a warm-up) before giving up
+
+# How long Ollama keeps a model loaded after a request, and whether models are pulled and warmed
+# in the background at startup ("0" assumes they are already available and never waits for them)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_READINESS_CHECK = os.getenv("OLLAMA_READINESS_CHECK", "1")
 
 # Default disaster prevention advice (fallback)
 DEFAULT_DISASTER_ADVICE = "請保持冷靜，注意餘震，並確保周圍環境安全。"
 
-# Track if model has been pulled
-_ollama_model_pulled = False
-_disaster_model_pulled = False
+# Answer given while the chat model is still being downloaded or loaded
+MODEL_NOT_READY_MESSAGE = "⏳ AI 模型正在準備中（{state}），請稍後再試。"
+
+# Answer given when a request could not get a generation slot in time
+MODEL_BUSY_MESSAGE = "⏳ AI 服務目前忙碌中，請稍後再試。"
+
+# Pulls and warms the models in the background; requests never wait for a download
+model_readiness = ModelReadiness(
+    OLLAMA_BASE_URL,
+    [OLLAMA_MODEL, OLLAMA_DISASTER_MODEL] + ([OLLAMA_VISION_MODEL] if OLLAMA_VISION_MODEL else []),
+    keep_alive=OLLAMA_KEEP_ALIVE,
+    pull_timeout=MODEL_PULL_TIMEOUT,
+    enabled=OLLAMA_READINESS_CHECK == "1",
+    embedding_models=[OLLAMA_EMBED_MODEL] if RAG_ENABLED == "1" else (),
+)
+
+# Answers to repeated prompts are served without a generation
+response_cache = ResponseCache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, relative_ttl=LLM_CACHE_TTL_RELATIVE,
+                               db_path=LLM_CACHE_DB)
+
+# The primary Ollama server first, then any LLM_BACKENDS that slow or failing requests move to
+llm_router = LLMRouter(
+    [LLMBackend(OLLAMA_BASE_URL)] + parse_backends(LLM_BACKENDS, OPENAI_COMPAT_MODEL, OPENAI_COMPAT_API_KEY),
+    hedge_percentile=LLM_HEDGE_PERCENTILE, min_hedge_delay=LLM_HEDGE_MIN_DELAY, max_hedge_delay=LLM_HEDGE_MAX_DELAY,
+)
+
+# Default Taiwan search box: latitude, longitude and depth (km) ranges
+TAIWAN_BBOX = (21.0, 26.0, 119.0, 123.0)
+TAIWAN_DEPTH_RANGE = (0.0, 100.0)
+
+# Gradio clients are kept and reused; results are cached by the normalized query
+mcp_client_pool = GradioClientPool(lambda: Client(src=MCP_SERVER_URL), size=MCP_POOL_SIZE)
+mcp_query_cache = QueryCache(maxsize=MCP_CACHE_SIZE, ttl=MCP_CACHE_TTL, recent_ttl=MCP_CACHE_TTL_RECENT)
+
+def _mcp_query_key(start_date, end_date, min_magnitude, max_magnitude, bbox, depth_range) -> tuple:
+    """Normalize a search so equivalent questions share one cache entry."""
+    return (
+        str(start_date), str(end_date),
+        round(float(min_magnitude), 1), round(float(max_magnitude), 1),
+        tuple(round(float(v), 2) for v in bbox),
+        tuple(round(float(v), 1) for v in depth_range),
+    )
 
 # Tool function for earthquake search
 def call_mcp_earthquake_search(
     start_date: str,
     end_date: str,
     min_magnitude: float = 4.5,
-    max_magnitude: float = 8.0
+    max_magnitude: float = 8.0,
+    bbox: tuple = TAIWAN_BBOX,
+    depth_range: tuple = TAIWAN_DEPTH_RANGE,
 ) -> str:
     """Search for earthquake events based on specified conditions (time, magnitude) from remote server."""
+    key = _mcp_query_key(start_date, end_date, min_magnitude, max_magnitude, bbox, depth_range)
+    cached = mcp_query_cache.get(key)
+    if cached is not None:
+        print(f"--- Earthquake search served from cache: {key} ---")
+        return cached
     try:
         print(f"--- Calling remote earthquake MCP server ---")
         print(f"    Query conditions: {start_date} to {end_date}, magnitude {min_magnitude} and above")
 
-        client = Client(src=MCP_SERVER_URL)
-        result = client.predict(
-            param_0=start_date, param_1="00:00:00",
-            param_2=end_date, param_3="23:59:59",
-            param_4=21.0, param_5=26.0, # Default Taiwan latitude
-            param_6=119.0, param_7=123.0, # Default Taiwan longitude
-            param_8=0.0, param_9=100.0,
-            param_10=min_magnitude, param_11=max_magnitude,
-            api_name="/gradio_fetch_and_plot_data"
-        )
+        min_lat, max_lat, min_lon, max_lon = key[4]
+        min_depth, max_depth = key[5]
+        with mcp_client_pool.client() as client:
+            result = client.predict(
+                param_0=key[0], param_1="00:00:00",
+                param_2=key[1], param_3="23:59:59",
+                param_4=min_lat, param_5=max_lat,
+                param_6=min_lon, param_7=max_lon,
+                param_8=min_depth, param_9=max_depth,
+                param_10=key[2], param_11=key[3],
+                api_name="/gradio_fetch_and_plot_data"
+            )
         dataframe_dict = result[0]
         data = dataframe_dict.get('data', [])
 
         if not data:
             print("--- MCP server returned: no matching earthquakes found ---")
-            return "Query completed, but no earthquake data matching the conditions was found."
-
-        headers = dataframe_dict.get('headers', [])
-        formatted_results = [dict(zip(headers, row)) for row in data]
-        print(f"--- MCP server successfully returned {len(data)} records ---")
-        return json.dumps(formatted_results, indent=2, ensure_ascii=False)
+            text = "Query completed, but no earthquake data matching the conditions was found."
+        else:
+            headers = dataframe_dict.get('headers', [])
+            formatted_results = [dict(zip(headers, row)) for row in data]
+            print(f"--- MCP server successfully returned {len(data)} records ---")
+            text = json.dumps(formatted_results, indent=2, ensure_ascii=False)
+        mcp_query_cache.put(key, text)
+        return text
     except Exception as e:
         print(f"Failed to call MCP server: {e}")
         return f"Tool execution failed, error message: {e}"
@@ -137,56 +232,85 @@ def _should_search_earthquakes(question: str) -> bool:
     ]
     return any(keyword in question.lower() for keyword in earthquake_keywords)
 
-def _call_ollama_llm(prompt: str, context: str = "") -> str:
-    """Call Ollama LLM for text generation."""
-    global _ollama_model_pulled
+def _ollama_request(path: str, payload: dict, priority: int = LLM_PRIORITY_INTERACTIVE,
+                    deadline: float = LLM_QUEUE_DEADLINE, on_token=None, with_final: bool = False):
+    """Run one generation through the shared LLM scheduler and the backend router; return its text.
+
+    Waits at most `deadline` seconds for a slot (raising LLMUnavailable if
+    it is not started by then). The router picks the backend and hedges a
+    slow one; the error of the last backend is raised if all of them fail.
+    Raises LLMCancelled if the ticket is cancelled before the answer is
+    complete. With `with_final` returns (text, final chunk) instead; the
+    final chunk has "done" set only if the stream ran to its end.
+    """
+    scheduler = get_llm_scheduler()
+    with scheduler.slot(priority, deadline) as ticket:
+        text, result, backend = llm_router.generate(path, payload, on_token, ticket)
+    scheduler.record(result)
+    print(f"--- LLM answered via {backend.name} ---")
+    return (text, result) if with_final else text
+
+def _model_available(model: str) -> bool:
+    """True if `model` is ready on the primary Ollama server, or another backend could serve it."""
+    return model_readiness.is_ready(model) or len(llm_router.backends) > 1
+
+def _call_ollama_llm(prompt: str, context: str = "", history: list = None, on_token=None,
+                     priority: int = LLM_PRIORITY_INTERACTIVE) -> str:
+    """Call Ollama LLM for text generation.
+
+    With `history` (Ollama chat messages preceding this prompt) the /api/chat
+    endpoint is used so the model sees the conversation; otherwise /api/generate.
+    With `on_token` the answer is streamed and each piece is passed to it as
+    it arrives; the full text is still returned. Requests wait for the
+    shared LLM scheduler and get a busy answer if none frees up in time.
+    Successful answers are cached by model, options, normalized prompt,
+    context and history; a cached answer is passed to `on_token` whole.
+    """
+    key = cache_key(OLLAMA_MODEL, OLLAMA_GENERATE_OPTIONS, prompt, context, history)
+    cached = response_cache.get(key)
+    if cached is not None:
+        if on_token:
+            on_token(cached)
+        return cached
+
+    if not _model_available(OLLAMA_MODEL):
+        # Degrade instantly instead of waiting on a download; show the raw data if there is any
+        message = MODEL_NOT_READY_MESSAGE.format(state=model_readiness.describe(OLLAMA_MODEL))
+        return f"{message}\n\n{context}" if context else message
     
     try:
-        # Only pull the model once per session
-        if not _ollama_model_pulled:
-            pull_url = f"{OLLAMA_BASE_URL}/api/pull"
-            pull_payload = {"name": OLLAMA_MODEL}
-            
-            print(f"--- Ensuring Ollama model {OLLAMA_MODEL} is available ---")
-            try:
-                pull_response = requests.post(pull_url, json=pull_payload, timeout=30)
-                # Ollama pull endpoint returns streaming responses, we just need to ensure it starts
-                print(f"Model pull initiated: {pull_response.status_code}")
-                _ollama_model_pulled = True
-            except Exception as e:
-                print(f"Warning: Could not verify model availability: {e}")
-                # Continue anyway - model might already be available
-        
-        # Generate response using Ollama
-        generate_url = f"{OLLAMA_BASE_URL}/api/generate"
-        
         # Combine context and prompt if context is provided
         full_prompt = prompt
         if context:
             full_prompt = OLLAMA_PROMPT_TEMPLATE.format(context=context, prompt=prompt)
         
-        generate_payload = {
-            "model": OLLAMA_MODEL,
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "top_k": 40,
-                "num_predict": 256,
+        if history:
+            path = "/api/chat"
+            generate_payload = {
+                "model": OLLAMA_MODEL,
+                "messages": history + [{"role": "user", "content": full_prompt}],
+                "keep_alive": OLLAMA_KEEP_ALIVE,
+                "options": OLLAMA_GENERATE_OPTIONS,
+            }
+        else:
+            path = "/api/generate"
+            generate_payload = {
+                "model": OLLAMA_MODEL,
+                "prompt": full_prompt,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
+                "options": OLLAMA_GENERATE_OPTIONS,
             }
-        }
-        
-        print(f"--- Calling Ollama API at {generate_url} ---")
-        response = requests.post(generate_url, json=generate_payload, timeout=60)
-        response.raise_for_status()
-        
-        result = response.json()
-        generated_text = result.get("response", "")
         
-        print(f"--- Ollama API returned successfully ---")
-        return generated_text.strip()
+        generated_text, final = _ollama_request(path, generate_payload, priority, on_token=on_token, with_final=True)
+        generated_text = generated_text.strip()
+        # Only an answer whose stream ran to the end is reused; a cut-off one would be served to everyone
+        if generated_text and final.get("done"):
+            response_cache.put(key, generated_text, response_cache.ttl_for(prompt))
+        return generated_text
         
+    except LLMUnavailable as e:
+        print(f"Ollama request not run: {e}")
+        return f"{MODEL_BUSY_MESSAGE}\n\n{context}" if context else MODEL_BUSY_MESSAGE
     except requests.exceptions.Timeout as e:
         print(f"Timeout calling Ollama API: {e}")
         return f"Error: Request timed out. The Ollama server took too long to respond. Please try again later."
@@ -197,25 +321,42 @@ def _call_ollama_llm(prompt: str, context: str = "") -> str:
         print(f"Unexpected error with Ollama: {e}")
         return f"Error: {str(e)}"
 
-def generate_disaster_prevention_advice(earthquake_data: dict) -> str:
-    """Generate a simple disaster prevention advice sentence for earthquake data using gemma3:120m."""
-    global _disaster_model_pulled
+def describe_image(prompt: str, image: bytes) -> str:
+    """Answer a question about an image with OLLAMA_VISION_MODEL.
+
+    Returns None if no vision model is configured, and a short fallback
+    message if it is not ready or the request fails.
+    """
+    if not OLLAMA_VISION_MODEL:
+        return None
+    if not _model_available(OLLAMA_VISION_MODEL):
+        return MODEL_NOT_READY_MESSAGE.format(state=model_readiness.describe(OLLAMA_VISION_MODEL))
+    payload = {
+        "model": OLLAMA_VISION_MODEL,
+        "prompt": prompt,
+        "images": [base64.b64encode(image).decode("ascii")],
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": OLLAMA_GENERATE_OPTIONS,
+    }
+    try:
+        return _ollama_request("/api/generate", payload, LLM_PRIORITY_INTERACTIVE).strip()
+    except LLMUnavailable as e:
+        print(f"Ollama image request not run: {e}")
+        return MODEL_BUSY_MESSAGE
+    except Exception as e:
+        print(f"Error describing image with Ollama: {e}")
+        return f"Error: {str(e)}"
+
+def generate_disaster_prevention_advice(earthquake_data: dict, priority: int = LLM_PRIORITY_ALERT) -> str:
+    """Generate a simple disaster prevention advice sentence for earthquake data using gemma3:120m.
+
+    Advice for a fresh quake goes ahead of chat in the LLM queue; pass
+    LLM_PRIORITY_BACKGROUND for precomputation nobody is waiting on.
+    """
+    if not _model_available(OLLAMA_DISASTER_MODEL):
+        return DEFAULT_DISASTER_ADVICE
     
     try:
-        # Only pull the disaster model once per session
-        if not _disaster_model_pulled:
-            pull_url = f"{OLLAMA_BASE_URL}/api/pull"
-            pull_payload = {"name": OLLAMA_DISASTER_MODEL}
-            
-            print(f"--- Ensuring Ollama model {OLLAMA_DISASTER_MODEL} is available ---")
-            try:
-                pull_response = requests.post(pull_url, json=pull_payload, timeout=MODEL_PULL_TIMEOUT)
-                print(f"Disaster model pull initiated: {pull_response.status_code}")
-                _disaster_model_pulled = True
-            except Exception as e:
-                print(f"Warning: Could not verify disaster model availability: {e}")
-                # Continue anyway - model might already be available
-        
         # Prepare context about the earthquake
         mag = earthquake_data.get('Magnitude', 'N/A')
         depth = earthquake_data.get('Depth', 'N/A')
@@ -238,13 +379,12 @@ def generate_disaster_prevention_advice(earthquake_data: dict) -> str:
         )
         
         # Call Ollama with the disaster model
-        generate_url = f"{OLLAMA_BASE_URL}/api/generate"
         full_prompt = f"{context}\n\n{prompt}"
         
         generate_payload = {
             "model": OLLAMA_DISASTER_MODEL,
             "prompt": full_prompt,
-            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
             "options": {
                 "temperature": 0.7,
                 "top_p": 0.9,
@@ -254,11 +394,7 @@ def generate_disaster_prevention_advice(earthquake_data: dict) -> str:
         }
         
         print(f"--- Calling Ollama API for disaster prevention advice ---")
-        response = requests.post(generate_url, json=generate_payload, timeout=60)
-        response.raise_for_status()
-        
-        result = response.json()
-        advice = result.get("response", "").strip()
+        advice = _ollama_request("/api/generate", generate_payload, priority).strip()
         
         # Clean up the advice - remove any extra line breaks and trim
         advice = " ".join(advice.split())
@@ -280,6 +416,9 @@ def generate_disaster_prevention_advice(earthquake_data: dict) -> str:
         print(f"--- Disaster prevention advice generated successfully ---")
         return advice
         
+    except LLMUnavailable as e:
+        print(f"Disaster prevention advice not generated: {e}")
+        return DEFAULT_DISASTER_ADVICE
     except requests.exceptions.Timeout as e:
         print(f"Timeout generating disaster prevention advice: {e}")
         return DEFAULT_DISASTER_ADVICE
@@ -290,9 +429,131 @@ def generate_disaster_prevention_advice(earthquake_data: dict) -> str:
         print(f"Unexpected error generating disaster prevention advice: {e}")
         return DEFAULT_DISASTER_ADVICE
 
+# Advice depends only on the quake, so it is generated once per EarthquakeNo
+advice_cache = AdviceCache(generate_disaster_prevention_advice, fallback=DEFAULT_DISASTER_ADVICE,
+                           maxsize=ADVICE_CACHE_SIZE, ttl=ADVICE_CACHE_TTL)
+
+def get_disaster_prevention_advice(earthquake_data: dict) -> str:
+    """Cached generate_disaster_prevention_advice, keyed by the earthquake's CWA ID."""
+    return advice_cache.get(earthquake_data)
+
+def _ollama_embed(texts: list, priority: int, deadline: float = LLM_QUEUE_DEADLINE) -> list:
+    """Embed texts with OLLAMA_EMBED_MODEL.
+
+    The request waits for an LLM scheduler slot like a generation does and
+    runs on the router's backends, so a failing server cools down and
+    another Ollama backend can take over.
+    """
+    with get_llm_scheduler().slot(priority, deadline):
+        return llm_router.embed({"model": OLLAMA_EMBED_MODEL, "input": texts, "keep_alive": OLLAMA_KEEP_ALIVE})
+
+# Guidance, FAQ and CWA reports are embedded into a local index; None when retrieval is disabled
+knowledge_index = VectorIndex(
+    VECTOR_INDEX_DIR,
+    lambda texts: _ollama_embed(texts, LLM_PRIORITY_BACKGROUND, LLM_QUEUE_DEADLINE * 4),
+    ivf_min=VECTOR_IVF_MIN, ivf_lists=VECTOR_IVF_LISTS, ivf_probes=VECTOR_IVF_PROBES,
+) if RAG_ENABLED == "1" else None
+
+def _index_when_ready(passages: list) -> None:
+    while not model_readiness.is_loaded(OLLAMA_EMBED_MODEL):
+        time.sleep(5)
+    try:
+        added = knowledge_index.add(passages)
+        if added:
+            print(f"--- Indexed {added} passage(s) for retrieval ---")
+    except Exception as e:
+        print(f"Indexing passages failed: {e}")
+
+def index_passages(passages: list) -> None:
+    """Embed passages into the retrieval index in the background, once the embedding model is ready."""
+    if knowledge_index is not None and passages:
+        threading.Thread(target=_index_when_ready, args=(passages,), name="rag-index", daemon=True).start()
+
+def start_retrieval() -> None:
+    """Index the built-in guidance and FAQ and the significant earthquake reports already stored;
+    passages that are already indexed are skipped."""
+    index_passages(seed_passages())
+    try:
+        index_earthquake_reports(significant_store.stored())
+    except Exception as e:
+        print(f"Indexing stored earthquake reports failed: {e}")
+
+def index_earthquake_reports(df) -> None:
+    """Significant reports listener: make every CWA report in df (a significant store frame) retrievable."""
+    if knowledge_index is None or df.empty:
+        return
+    df = df.assign(TimeStr=df["Time"].dt.strftime("%Y-%m-%d %H:%M").fillna(""))
+    # Missing values as None, like the dicts significant listeners get
+    reports = df.astype(object).where(df.notna(), None).to_dict("records")
+    index_passages([earthquake_report_passage(eq) for eq in reports])
+
+def retrieve_passages(question: str, max_tokens: int = RAG_CONTEXT_TOKENS) -> str:
+    """The indexed passages closest to the question as prompt context, or "" if none is close enough."""
+    if knowledge_index is None or not len(knowledge_index) or not model_readiness.is_ready(OLLAMA_EMBED_MODEL):
+        return ""
+    try:
+        hits = knowledge_index.search(_ollama_embed([question], LLM_PRIORITY_INTERACTIVE, RAG_QUERY_DEADLINE)[0],
+                                      RAG_TOP_K)
+    except LLMUnavailable as e:
+        print(f"Retrieval skipped: {e}")
+        return ""
+    except Exception as e:
+        print(f"Retrieval failed: {e}")
+        return ""
+    lines = ["Reference notes:"]
+    used = estimate_tokens(lines[0])
+    for score, passage in hits:
+        if score < RAG_MIN_SCORE:
+            break
+        line = f"- {passage['text']}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines) if len(lines) > 1 else ""
+
+def _with_passages(context: str, question: str) -> str:
+    passages = retrieve_passages(question)
+    return f"{context}\n\n{passages}" if passages else context
+
+# Counting, max, latest and average-depth questions are answered from the data without the LLM
+intent_router = IntentRouter()
+
+def summarize_conversation(summary: str, messages: list) -> str:
+    """Fold chat messages into a running conversation summary. Returns "" on failure."""
+    transcript = "\n".join(
+        f"{'User' if m['role'] == 'user' else 'Assistant'}: {truncate_to_tokens(m['content'], 200)}"
+        for m in messages
+    )
+    prompt = (
+        "Update the running summary of a conversation between a user and an assistant. "
+        "Keep facts the user shared, their preferences and any open questions. "
+        "Write at most 120 words in the language of the conversation.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\n"
+        f"New messages:\n{transcript}\n\n"
+        "Updated summary:"
+    )
+    if not _model_available(OLLAMA_MODEL):
+        return ""
+    payload = {"model": OLLAMA_MODEL, "prompt": prompt, "keep_alive": OLLAMA_KEEP_ALIVE,
+               "options": OLLAMA_GENERATE_OPTIONS}
+    try:
+        # Nobody waits on a summary, so it queues behind chat and may wait longer
+        return _ollama_request("/api/generate", payload, LLM_PRIORITY_BACKGROUND,
+                               deadline=LLM_QUEUE_DEADLINE * 4).strip()
+    except Exception as e:
+        print(f"Conversation summary failed: {e}")
+        return ""
+
 # Main AI text generation function
-def generate_ai_text(user_prompt: str) -> str:
-    """Generate AI response with earthquake search capability using Ollama LLM."""
+def generate_ai_text(user_prompt: str, history: list = None, on_token=None) -> str:
+    """Generate AI response with earthquake search capability using Ollama LLM.
+
+    `history` is the budgeted conversation window (Ollama chat messages)
+    preceding this prompt, if any. `on_token` receives the answer while it
+    streams in (see _call_ollama_llm).
+    """
     
     # Check if this is an earthquake-related question
     if _should_search_earthquakes(user_prompt):
@@ -311,29 +572,30 @@ def generate_ai_text(user_prompt: str) -> str:
             
             # Parse the JSON response
             if "no earthquake data matching" in earthquake_data.lower():
+                direct = intent_router.try_answer(user_prompt, [], start_date, end_date, min_magnitude, max_magnitude)
+                if direct is not None:
+                    return direct
                 context = f"Searched for earthquakes from {start_date} to {end_date} with magnitude ≥{min_magnitude}, but no matching earthquakes were found."
-                return f"🌍 {_call_ollama_llm(user_prompt, context)}"
+                context = _with_passages(context, user_prompt)
+                return f"🌍 {_call_ollama_llm(user_prompt, context, history, on_token)}"
             
             try:
                 eq_list = json.loads(earthquake_data)
                 if not eq_list:
                     return f"🌍 No earthquakes found for the specified criteria."
                 
-                # Format earthquake data as context
-                context = f"Earthquake Search Results ({start_date} to {end_date}, M≥{min_magnitude}):\n\n"
-                context += f"Found {len(eq_list)} earthquake(s):\n\n"
+                direct = intent_router.try_answer(user_prompt, eq_list, start_date, end_date, min_magnitude, max_magnitude)
+                if direct is not None:
+                    return direct
                 
-                # Include all earthquakes in context for LLM
-                for i, eq in enumerate(eq_list, 1):
-                    time_str = eq.get('Time', 'Unknown')
-                    location = eq.get('Location', 'Unknown')
-                    magnitude = eq.get('Magnitude', 'N/A')
-                    depth = eq.get('Depth', 'N/A')
-                    
-                    context += f"{i}. Time: {time_str}, Location: {location}, Magnitude: M{magnitude}, Depth: {depth} km\n"
+                # Summarise the results within a token budget instead of listing every quake
+                context = build_earthquake_context(
+                    eq_list, header=f"Earthquake Search Results ({start_date} to {end_date}, M≥{min_magnitude}):"
+                )
+                context = _with_passages(context, user_prompt)
                 
                 # Use Ollama to generate a natural language response
-                llm_response = _call_ollama_llm(user_prompt, context)
+                llm_response = _call_ollama_llm(user_prompt, context, history, on_token)
                 
                 # Format the final response
                 response = f"🌍 {llm_response}"
@@ -342,15 +604,16 @@ def generate_ai_text(user_prompt: str) -> str:
                 
             except json.JSONDecodeError:
                 # If JSON parsing fails, use LLM with raw data
-                llm_response = _call_ollama_llm(user_prompt, f"Earthquake data retrieved:\n{earthquake_data}")
+                raw = truncate_to_tokens(earthquake_data, EQ_CONTEXT_TOKENS)
+                llm_response = _call_ollama_llm(user_prompt, f"Earthquake data retrieved:\n{raw}", history, on_token)
                 return f"🌍 {llm_response}"
                 
         except Exception as e:
             print(f"Error processing earthquake question: {e}")
             return f"🤖 I encountered an error while searching for earthquake data: {e}\n\nPlease try using specific commands like /eq_latest or /eq_global instead."
     
-    # For non-earthquake questions, use Ollama LLM directly
-    llm_response = _call_ollama_llm(user_prompt)
+    # For non-earthquake questions, use Ollama LLM directly, grounded in any closely matching guidance
+    llm_response = _call_ollama_llm(user_prompt, retrieve_passages(user_prompt), history, on_token)
     
     if llm_response.startswith("Error:"):
         # If Ollama fails, return a helpful message
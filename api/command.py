@@ -1,23 +1,46 @@
 from time import sleep
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict
+import math
 import pandas as pd
 import os
+import threading
+import time
 
 from .auth import is_admin
 from .config import *
+from .metrics import LatencyHistogram
+from .llm_scheduler import get_llm_scheduler
+from .rate_limit import quota_limiter
 from .printLog import send_log
+from .stream_reply import StreamingReply
 from .telegram import send_message
+from .telegram_client import get_client
 
 # Import new services
 try:
-    from .cwa_service import fetch_cwa_alarm_list, fetch_significant_earthquakes, fetch_latest_significant_earthquake
+    from .cwa_service import fetch_cwa_alarm_list, fetch_significant_earthquakes, fetch_latest_significant_earthquake, add_significant_listener, add_significant_reports_listener
     from .usgs_service import fetch_global_last24h_text, fetch_taiwan_df_this_year, fetch_global_earthquakes_by_date
     from .plotting_service import create_and_save_map, create_global_earthquake_map
-    from .ai_service import generate_ai_text, generate_disaster_prevention_advice
+    from .ai_service import generate_ai_text, get_disaster_prevention_advice, advice_cache, index_earthquake_reports
     SERVICES_AVAILABLE = True
+    # Advice for a new significant quake is generated as soon as the feed shows it, and every new report becomes retrievable
+    add_significant_listener(advice_cache.precompute)
+    add_significant_reports_listener(index_earthquake_reports)
 except ImportError as e:
     print(f"Warning: Some services not available: {e}")
     SERVICES_AVAILABLE = False
 
+# Push subscriptions for new early warnings
+try:
+    from .cwa_service import add_alarm_listener
+    from .subscriptions import subscription_store, alert_broadcaster
+    SUBSCRIPTIONS_AVAILABLE = True
+    add_alarm_listener(alert_broadcaster.broadcast)
+except ImportError as e:
+    print(f"Warning: Alert subscriptions not available: {e}")
+    SUBSCRIPTIONS_AVAILABLE = False
+
 # Import Taiwan earthquake catalog service
 try:
     from .taiwan_eq_service import fetch_taiwan_eq_data, filter_taiwan_eq, format_taiwan_eq_text
@@ -47,8 +70,10 @@ def help():
             "/eq_global - 全球近 24 小時地震（USGS）\n"
             "/eq_taiwan - 台灣今年地震列表（USGS）\n"
             "/eq_alert - 中央氣象署地震速報\n"
-            "/eq_significant - 中央氣象署過去 7 天顯著地震\n"
+            "/eq_significant [天數] - 中央氣象署過去 N 天（預設 7 天）顯著地震\n"
             "/eq_map - 地震查詢服務連結\n"
+            "/subscribe [最小規模] [地區] - 訂閱地震速報推播\n"
+            "/unsubscribe - 取消地震速報推播\n"
             "/ai <問題> - AI 智慧問答（Ollama）\n"
             "/eq_query <起始日期> <結束日期> <最小規模> - 查詢全球地震\n"
             "  範例：/eq_query 2024-07-01 2024-07-07 5.0\n"
@@ -116,7 +141,7 @@ def get_latest_earthquake():
         
         # Generate disaster prevention advice for significant earthquakes
         try:
-            advice = generate_disaster_prevention_advice(latest_eq)
+            advice = get_disaster_prevention_advice(latest_eq)
             if advice:
                 result += f"\n\n💡 防災建議：{advice}"
         except Exception as e:
@@ -160,22 +185,72 @@ def get_earthquake_alerts():
         return "地震資訊服務無法使用。"
     return fetch_cwa_alarm_list(limit=5)
 
-def get_significant_earthquakes():
-    """取得中央氣象署過去 7 天的顯著地震。"""
+def get_significant_earthquakes(args: str = ""):
+    """取得中央氣象署過去 N 天（預設 7 天）的顯著地震。"""
     if not SERVICES_AVAILABLE:
         return "地震資訊服務無法使用。"
-    return fetch_significant_earthquakes(limit=5)
+    days = 7
+    if args.strip():
+        try:
+            days = int(args.split()[0])
+        except ValueError:
+            return "格式：/eq_significant [天數]，例如 /eq_significant 30"
+        if not 1 <= days <= 365:
+            return "天數需介於 1 到 365 之間。"
+    return fetch_significant_earthquakes(days=days, limit=5)
+
+def _can_manage_subscription(ctx) -> bool:
+    """In a group only its administrators (or the bot admin) may change the group's subscription."""
+    if ctx.from_type == "private" or is_admin(ctx.from_id):
+        return True
+    try:
+        response = get_client().call("getChatMember", data={"chat_id": ctx.chat_id, "user_id": ctx.from_id})
+        status = response.json().get("result", {}).get("status")
+    except Exception as e:
+        print(f"getChatMember failed for {ctx.from_id} in {ctx.chat_id}: {e}")
+        return False
+    return status in ("creator", "administrator")
+
+def subscribe_alerts(chat_id, args: str):
+    """訂閱地震速報推播，可指定最小規模與地區，例如「4.5 花蓮縣」。"""
+    if not SUBSCRIPTIONS_AVAILABLE:
+        return "地震速報推播服務無法使用。"
+    min_magnitude, region = 0.0, []
+    for part in args.split():
+        try:
+            min_magnitude = float(part)
+        except ValueError:
+            region.append(part)
+    if not 0 <= min_magnitude <= 10:
+        return subscribe_format_info
+    region = " ".join(region)
+    subscription_store.subscribe(chat_id, min_magnitude, region)
+    condition = f"規模 {min_magnitude:.1f} 以上" if min_magnitude > 0 else "所有規模"
+    if region:
+        condition += f"，地區：{region}"
+    return subscribe_info.format(condition=condition)
+
+def unsubscribe_alerts(chat_id):
+    """取消地震速報推播。"""
+    if not SUBSCRIPTIONS_AVAILABLE:
+        return "地震速報推播服務無法使用。"
+    return unsubscribe_info if subscription_store.unsubscribe(chat_id) else not_subscribed_info
 
 def get_earthquake_map():
     """取得地震查詢服務連結。"""
     return f"🗺️ 外部地震查詢服務\n\n請造訪：\n{MCP_SERVER_URL}"
 
-def process_ai_question(question: str):
+def process_ai_question(question: str, chat_id=None):
     """處理一般 AI 問答。"""
     if not SERVICES_AVAILABLE:
         return "AI 服務無法使用。"
     if not question:
         return "請提供問題，例如：/ai 台灣最高的山是什麼？"
+    if STREAM_REPLIES == "1" and chat_id is not None:
+        # The answer is delivered by editing the streamed message, nothing left to send
+        reply = StreamingReply(chat_id).start()
+        reply.finish(generate_ai_text(question, on_token=reply.feed))
+        return ""
     return generate_ai_text(question)
 
 def process_earthquake_query(args: str, chat_id=None):
@@ -378,77 +453,169 @@ def send_message_test(id, command):
     send_log("success")
     return ""
 
-def excute_command(from_id, command, from_type, chat_id):
-    if command.startswith("start") or command.startswith("help"):
-        return help()
+class CommandContext:
+    """Who sent a command, where, and the text after the command name."""
 
-    elif command.startswith("get_my_info"):
-        return get_my_info(from_id)
+    def __init__(self, from_id, chat_id, from_type, name: str, args: str, text: str) -> None:
+        self.from_id = from_id
+        self.chat_id = chat_id
+        self.from_type = from_type
+        self.name = name
+        self.args = args
+        self.text = text
 
-    elif command.startswith("get_group_info"):
-        return get_group_info(from_type, chat_id)
 
-    elif command.startswith("5g_test"):
-        return speed_test(chat_id)
+class Command:
+    """A registered command and the limits it runs under.
 
-    elif command.startswith("send_message"):
-        return send_message_test(from_id, command)
+    cost is the command's cost class ("cheap", "network", "llm" or "render"),
+    timeout is how many seconds the user waits before getting a timeout
+    reply (None runs the handler inline), and max_concurrency caps how many
+    invocations may run at once across all users.
+    """
 
-    # 地震資訊服務指令
-    elif command.startswith("eq_latest"):
-        return get_latest_earthquake()
-    
-    elif command.startswith("eq_global"):
-        return get_global_earthquakes()
-    
-    elif command.startswith("eq_taiwan"):
-        return get_taiwan_earthquakes()
-    
-    elif command.startswith("eq_alert"):
-        return get_earthquake_alerts()
-    
-    elif command.startswith("eq_significant"):
-        return get_significant_earthquakes()
-    
-    elif command.startswith("eq_map"):
-        return get_earthquake_map()
-    
-    elif command.startswith("ai"):
-        # 擷取問題
-        question = command[2:].strip()  # 移除 "ai" 前綴
-        return process_ai_question(question)
-    
-    elif command.startswith("eq_query"):
-        # 擷取查詢參數
-        args = command[8:].strip()  # 移除 "eq_query" 前綴
-        return process_earthquake_query(args, chat_id=chat_id)
-
-    elif command.startswith("eq_tw_query"):
-        # 台灣地震目錄查詢
-        args = command[11:].strip()  # 移除 "eq_tw_query" 前綴
-        return process_taiwan_eq_query(args, chat_id=chat_id)
-
-    # 網頁搜尋指令
-    elif command.startswith("search") or command.startswith("websearch"):
-        # 擷取搜尋關鍵字
-        if command.startswith("websearch"):
-            query = command[9:].strip()  # 移除 "websearch" 前綴
-        else:
-            query = command[6:].strip()  # 移除 "search" 前綴
-        return perform_web_search(query)
-    
-    elif command in ["get_allowed_users", "get_allowed_groups", "get_api_key"]:
-        if not is_admin(from_id):
+    def __init__(self, name, handler, cost="cheap", timeout=None, max_concurrency=None,
+                 needs_auth=False, admin_only=False, debug_only=False, aliases=()) -> None:
+        self.name = name
+        self.handler = handler
+        self.cost = cost
+        self.timeout = timeout
+        self.needs_auth = needs_auth
+        self.admin_only = admin_only
+        self.debug_only = debug_only
+        self.aliases = tuple(aliases)
+        self.slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+
+class CommandRouter:
+    """Routes a command by exact name lookup instead of prefix matching."""
+
+    def __init__(self, workers: int = 32) -> None:
+        self.commands: Dict[str, Command] = {}
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="command")
+
+    def register(self, command: Command) -> None:
+        for name in (command.name, *command.aliases):
+            self.commands[name] = command
+        self.latency[command.name] = LatencyHistogram()
+        self.counters[command.name] = {"calls": 0, "errors": 0, "timeouts": 0, "busy": 0, "limited": 0}
+
+    @staticmethod
+    def parse(text: str):
+        """Split "eq_query@MyBot 2024-07-01 ..." into ("eq_query", "2024-07-01 ...")."""
+        parts = text.strip().split(None, 1)
+        if not parts:
+            return "", ""
+        name = parts[0].split("@", 1)[0].lower()
+        args = parts[1].strip() if len(parts) > 1 else ""
+        return name, args
+
+    def dispatch(self, from_id, text: str, from_type, chat_id, authorized: bool = True) -> str:
+        name, args = self.parse(text)
+        command = self.commands.get(name)
+        if command is None:
+            return command_format_error_info
+
+        if command.needs_auth and not authorized:
+            if from_type == "supergroup":
+                return f"{group_no_permission_info}\nID:`{chat_id}`"
+            return f"{user_no_permission_info}\nID:`{from_id}`"
+        if command.admin_only and not is_admin(from_id):
             return admin_auch_info
-        if IS_DEBUG_MODE == "0":
+        if command.debug_only and IS_DEBUG_MODE == "0":
             return debug_mode_info
 
-        if command == "get_allowed_users":
-            return get_allowed_users()
-        elif command == "get_allowed_groups":
-            return get_allowed_groups
-        elif command == "get_api_key":
-            return get_API_key()
+        counters = self.counters[command.name]
+        # Take the slot first so a busy command does not use up the caller's quota
+        if command.slots is not None and not command.slots.acquire(blocking=False):
+            counters["busy"] += 1
+            return "⏳ 此指令目前使用人數過多，請稍後再試。"
+        wait = 0.0 if is_admin(from_id) else quota_limiter.acquire(from_id, command.cost)
+        if wait > 0:
+            if command.slots is not None:
+                command.slots.release()
+            counters["limited"] += 1
+            return rate_limited_info.format(seconds=math.ceil(wait))
+
+        ctx = CommandContext(from_id, chat_id, from_type, name, args, text)
+        counters["calls"] += 1
+        started = time.monotonic()
+        if command.timeout is None:
+            try:
+                return self._run(command, ctx, started)
+            except Exception as e:
+                print(f"Command /{name} failed: {e}")
+                return f"❌ 指令執行失敗：{e}"
+
+        future = self._executor.submit(self._run, command, ctx, started)
+        try:
+            return future.result(timeout=command.timeout)
+        except FutureTimeoutError:
+            # The handler keeps running and frees its slot when it finishes, but
+            # the LLM work it queued is no longer awaited by anyone
+            get_llm_scheduler().cancel_owner(ctx)
+            counters["timeouts"] += 1
+            return "⌛ 指令執行逾時，請稍後再試。"
+        except Exception as e:
+            print(f"Command /{name} failed: {e}")
+            return f"❌ 指令執行失敗：{e}"
 
-    else:
-        return command_format_error_info
+    def _run(self, command: Command, ctx: CommandContext, started: float):
+        try:
+            with get_llm_scheduler().owned_by(ctx):
+                return command.handler(ctx) or ""
+        except Exception:
+            self.counters[command.name]["errors"] += 1
+            raise
+        finally:
+            self.latency[command.name].observe(time.monotonic() - started)
+            if command.slots is not None:
+                command.slots.release()
+
+    def stats(self) -> Dict:
+        return {
+            name: {**self.counters[name], "cost": self.commands[name].cost, "latency": self.latency[name].snapshot()}
+            for name in self.latency
+        }
+
+
+router = CommandRouter()
+
+router.register(Command("help", lambda ctx: help(), aliases=("start",)))
+router.register(Command("get_my_info", lambda ctx: get_my_info(ctx.from_id)))
+router.register(Command("get_group_info", lambda ctx: get_group_info(ctx.from_type, ctx.chat_id)))
+router.register(Command("5g_test", lambda ctx: speed_test(ctx.chat_id)))
+router.register(Command("send_message", lambda ctx: send_message_test(ctx.from_id, ctx.text), admin_only=True))
+
+# 地震資訊服務指令
+router.register(Command("eq_latest", lambda ctx: get_latest_earthquake(), cost="llm", timeout=90))
+router.register(Command("eq_global", lambda ctx: get_global_earthquakes(), cost="network", timeout=30))
+router.register(Command("eq_taiwan", lambda ctx: get_taiwan_earthquakes(), cost="network", timeout=30))
+router.register(Command("eq_alert", lambda ctx: get_earthquake_alerts(), cost="network", timeout=30))
+router.register(Command("eq_significant", lambda ctx: get_significant_earthquakes(ctx.args), cost="network", timeout=30))
+router.register(Command("eq_map", lambda ctx: get_earthquake_map()))
+router.register(Command("subscribe", lambda ctx: subscribe_alerts(ctx.chat_id, ctx.args)
+                        if _can_manage_subscription(ctx) else subscribe_admin_only_info))
+router.register(Command("unsubscribe", lambda ctx: unsubscribe_alerts(ctx.chat_id)
+                        if _can_manage_subscription(ctx) else subscribe_admin_only_info))
+router.register(Command("ai", lambda ctx: process_ai_question(ctx.args, ctx.chat_id),
+                        cost="llm", timeout=120, max_concurrency=4))
+router.register(Command("eq_query", lambda ctx: process_earthquake_query(ctx.args, chat_id=ctx.chat_id),
+                        cost="render", timeout=120, max_concurrency=2))
+router.register(Command("eq_tw_query", lambda ctx: process_taiwan_eq_query(ctx.args, chat_id=ctx.chat_id),
+                        cost="render", timeout=180, max_concurrency=2))
+
+# 網頁搜尋指令
+router.register(Command("search", lambda ctx: perform_web_search(ctx.args),
+                        cost="network", timeout=30, aliases=("websearch",)))
+
+# 管理員指令
+router.register(Command("get_allowed_users", lambda ctx: get_allowed_users(), admin_only=True, debug_only=True))
+router.register(Command("get_allowed_groups", lambda ctx: get_allowed_groups(), admin_only=True, debug_only=True))
+router.register(Command("get_api_key", lambda ctx: get_API_key(), admin_only=True, debug_only=True))
+
+
+def excute_command(from_id, command, from_type, chat_id, authorized=True):
+    return router.dispatch(from_id, command, from_type, chat_id, authorized)
@@ -9,6 +9,9 @@ from datetime import datetime
 
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
 
+# Telegram Bot API server (override for a local Bot API server or a mock server in benchmarks)
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
+
 # Google Gemini API Key (optional - enables function calling capabilities)
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "")
 
@@ -41,6 +44,11 @@ ALLOWED_GROUPS = split(r'[ ,;，；]+', os.getenv("ALLOWED_GROUPS", '').replace(
 
 #Whether to push logs and enable some admin commands
 IS_DEBUG_MODE = os.getenv("IS_DEBUG_MODE", '0')
+#Admin logs are buffered and shipped in batches: seconds between flushes, and entries kept before the oldest are dropped
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "2"))
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "1000"))
+#Optional local JSONL file that receives every log entry, independent of debug mode
+LOG_FILE = os.getenv("LOG_FILE", "")
 #The target account that can execute administrator instructions and log push can use /get_my_info to obtain the ID.
 ADMIN_ID = os.getenv("ADMIN_ID", "1234567890")
 
@@ -51,6 +59,114 @@ AUCH_ENABLE = os.getenv("AUCH_ENABLE", "1")
 # If set, all POST/GET requests to the webhook must include a valid token header
 API_ACCESS_TOKEN = os.getenv("API_ACCESS_TOKEN", "")
 
+#"1" acknowledges webhook updates immediately and handles them on a background worker pool, "0" handles them inline in the request
+#The pool needs a long-lived process; on Vercel a function is frozen once it has responded, so the default there is inline
+ASYNC_DISPATCH = os.getenv("ASYNC_DISPATCH", "0" if os.getenv("VERCEL") else "1")
+#Number of worker threads handling updates, and the number of pending updates accepted before new ones are rejected
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "8"))
+DISPATCH_QUEUE_SIZE = int(os.getenv("DISPATCH_QUEUE_SIZE", "200"))
+#Outbound pacing to stay inside Telegram limits: messages/s overall, messages/s per private chat, messages/min per group, burst per chat
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+TG_GROUP_RATE_PER_MIN = float(os.getenv("TG_GROUP_RATE_PER_MIN", "20"))
+TG_CHAT_BURST = float(os.getenv("TG_CHAT_BURST", "3"))
+
+#Per-user budgets for expensive commands as "<requests>/<seconds>" (empty = unlimited); the admin is exempt
+RATE_LIMIT_NETWORK = os.getenv("RATE_LIMIT_NETWORK", "20/60")
+RATE_LIMIT_LLM = os.getenv("RATE_LIMIT_LLM", "6/60")
+RATE_LIMIT_RENDER = os.getenv("RATE_LIMIT_RENDER", "3/60")
+#Optional shared store for those budgets, e.g. "sqlite:////tmp/tg_bot.db" or "redis://localhost:6379/0"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "")
+
+#How long (seconds) and how many update_ids are remembered to drop updates Telegram redelivers
+DEDUP_TTL = int(os.getenv("DEDUP_TTL", "3600"))
+DEDUP_MAX_SIZE = int(os.getenv("DEDUP_MAX_SIZE", "10000"))
+#Optional shared seen-set so several replicas dedupe together, e.g. "sqlite:////tmp/tg_bot.db" or "redis://localhost:6379/0"
+DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "")
+
+#Long-polling runner (python -m api.poller): seconds each getUpdates call waits, and updates fetched per call (max 100)
+POLL_TIMEOUT = int(os.getenv("POLL_TIMEOUT", "50"))
+POLL_BATCH_SIZE = min(100, int(os.getenv("POLL_BATCH_SIZE", "100")))
+
+#Chat sessions: SQLite file they are written through to (empty keeps them in memory only), how many and how many bytes stay resident, and seconds of inactivity before a session leaves memory
+SESSION_DB = os.getenv("SESSION_DB", os.path.join(tempfile.gettempdir(), "tg_bot_sessions.db"))
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(32 * 1024 * 1024)))
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", str(6 * 3600)))
+
+#Chat context sent to the model: recent turns kept verbatim, token budget for the whole prompt, and how many overflowing turns are folded into the running summary at once (sooner if the unsummarized turns take over half the budget)
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "6"))
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "2048"))
+CHAT_SUMMARY_BATCH = int(os.getenv("CHAT_SUMMARY_BATCH", "4"))
+
+#"1" streams chat and /ai answers into a message that is edited as tokens arrive; edits happen at most every STREAM_EDIT_INTERVAL seconds unless STREAM_EDIT_CHARS new characters arrived
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "0.7"))
+STREAM_EDIT_CHARS = int(os.getenv("STREAM_EDIT_CHARS", "80"))
+
+#Ollama generations run at once, requests allowed to wait for one, and seconds a chat request may wait before it is dropped unstarted
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "1"))
+LLM_MAX_QUEUED = int(os.getenv("LLM_MAX_QUEUED", "50"))
+LLM_QUEUE_DEADLINE = float(os.getenv("LLM_QUEUE_DEADLINE", "45"))
+
+#Disaster prevention advice is cached per CWA EarthquakeNo: how many quakes and for how many seconds
+ADVICE_CACHE_SIZE = int(os.getenv("ADVICE_CACHE_SIZE", "256"))
+ADVICE_CACHE_TTL = int(os.getenv("ADVICE_CACHE_TTL", str(7 * 86400)))
+#Seconds between background checks of the CWA significant earthquake feed, so advice for a new quake is ready before anyone asks (0 disables)
+SIGNIFICANT_POLL_INTERVAL = int(os.getenv("SIGNIFICANT_POLL_INTERVAL", "60"))
+#SQLite file of the local significant earthquake store, seconds a synced store answers without asking CWA again, and days fetched when it is empty
+SIGNIFICANT_DB = os.getenv("SIGNIFICANT_DB", os.path.join(tempfile.gettempdir(), "tg_bot_significant.db"))
+SIGNIFICANT_MAX_AGE = float(os.getenv("SIGNIFICANT_MAX_AGE", "60"))
+SIGNIFICANT_BACKFILL_DAYS = int(os.getenv("SIGNIFICANT_BACKFILL_DAYS", "30"))
+#Seconds between background refreshes of the CWA early warning list that /eq_alert is served from (0 disables the poller), and the age after which a request refreshes it itself
+CWA_ALARM_POLL_INTERVAL = float(os.getenv("CWA_ALARM_POLL_INTERVAL", "10"))
+CWA_ALARM_MAX_AGE = float(os.getenv("CWA_ALARM_MAX_AGE", "60"))
+#SQLite file holding /subscribe subscriptions, and the age in seconds after which a new early warning is no longer pushed to them
+SUBSCRIPTION_DB = os.getenv("SUBSCRIPTION_DB", os.path.join(tempfile.gettempdir(), "tg_bot_subscriptions.db"))
+ALERT_MAX_AGE = float(os.getenv("ALERT_MAX_AGE", "600"))
+
+#Earthquake search Space (MCP_SERVER_URL): gradio clients kept open, and cached results (count, seconds for past ranges, seconds for ranges that include today)
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+MCP_CACHE_SIZE = int(os.getenv("MCP_CACHE_SIZE", "128"))
+MCP_CACHE_TTL = int(os.getenv("MCP_CACHE_TTL", str(6 * 3600)))
+MCP_CACHE_TTL_RECENT = int(os.getenv("MCP_CACHE_TTL_RECENT", "300"))
+
+#Earthquake search results given to the model: token budget for the summary, and how many of the strongest events are listed
+EQ_CONTEXT_TOKENS = int(os.getenv("EQ_CONTEXT_TOKENS", "600"))
+EQ_CONTEXT_TOP_K = int(os.getenv("EQ_CONTEXT_TOP_K", "10"))
+
+#LLM answers reused for repeated prompts: how many, seconds they stay valid, seconds for prompts about "today"/"latest" and the like (0 never caches those), and an optional SQLite file that keeps them across restarts
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_TTL_RELATIVE = int(os.getenv("LLM_CACHE_TTL_RELATIVE", "120"))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "")
+
+#Retrieval for AI answers: "1" embeds the built-in safety guidance, FAQ and CWA reports into a local index and adds the closest passages to the prompt; where the index is stored, passages used, minimum cosine similarity, and their token budget
+RAG_ENABLED = os.getenv("RAG_ENABLED", "1")
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(tempfile.gettempdir(), "tg_bot_vectors"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.55"))
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "300"))
+#Index rows before searches switch from brute force to an inverted file, its list count (0 = about the square root of the rows), and lists probed per search
+VECTOR_IVF_MIN = int(os.getenv("VECTOR_IVF_MIN", "4096"))
+VECTOR_IVF_LISTS = int(os.getenv("VECTOR_IVF_LISTS", "0"))
+VECTOR_IVF_PROBES = int(os.getenv("VECTOR_IVF_PROBES", "8"))
+
+#Extra LLM backends tried after OLLAMA_BASE_URL, comma separated: Ollama URLs, or "openai+<url>" for an OpenAI-compatible server (whose model and API key follow)
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")
+OPENAI_COMPAT_MODEL = os.getenv("OPENAI_COMPAT_MODEL", "")
+OPENAI_COMPAT_API_KEY = os.getenv("OPENAI_COMPAT_API_KEY", "")
+#A request without a first token after this percentile of the backend's recent times to first token (clamped to the min/max seconds) is also sent to the next backend
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "8.0"))
+
+#Photos for the vision model: longest side it needs (the smallest Telegram size covering it is downloaded, then downscaled to it), largest download allowed, parallel decodes, and seconds a getFile answer is reused
+VISION_IMAGE_SIDE = int(os.getenv("VISION_IMAGE_SIDE", "896"))
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", str(10 * 1024 * 1024)))
+PHOTO_DECODE_WORKERS = int(os.getenv("PHOTO_DECODE_WORKERS", "2"))
+FILE_PATH_CACHE_TTL = int(os.getenv("FILE_PATH_CACHE_TTL", "3000"))
+
 #"1"to use the same chat history in the group, "2"to record chat history individually for each person
 GROUP_MODE = os.getenv("GROUP_MODE=", "1")
 
@@ -73,6 +189,16 @@ gemini_err_info = f"處理您的請求時發生錯誤，請稍後再試。"
 new_chat_info = "我們正在進行一個全新的對話。"
 prompt_new_info = "輸入 /new 開始新對話。"
 unable_to_recognize_content_sent = "無法識別您傳送的內容！"
+rate_limited_info = "⏳ 請求過於頻繁，請於 {seconds} 秒後再試。"
+stream_placeholder_info = "💭 思考中…"
+photo_too_large_info = "圖片檔案過大，請傳送較小的圖片。"
+photo_failed_info = "無法讀取這張圖片，請稍後再試或傳送其他圖片。"
+subscribe_info = "✅ 已訂閱地震速報推播（{condition}）。\n使用 /unsubscribe 取消訂閱。"
+subscribe_format_info = "格式：/subscribe [最小規模] [地區]\n範例：/subscribe 4.5 花蓮縣"
+unsubscribe_info = "已取消地震速報推播。"
+not_subscribed_info = "您尚未訂閱地震速報推播。"
+subscribe_admin_only_info = "只有群組管理員可以變更此群組的地震速報推播。"
+alert_push_info = "🚨 地震速報\n時間：{time}（台灣時間）\n規模／深度：M{magnitude} / {depth} 公里\n地區：{areas}"
 
 """ 以下是紀錄相關文字 """
 send_message_log = "傳送訊息，回傳內容為："
@@ -1,61 +1,80 @@
 """
-The class ChatManager manages all users and their conversations in the
-form of a dictionary.
+The class ChatManager manages all users and their conversations through a
+SessionStore: a bounded LRU of ChatConversation instances that is written
+through to SQLite, so conversations survive restarts and are shared
+between workers.
 
 Each user has a ChatConversation instance, which may include multiple
 previous conversations of the user (provided by the Google Gemini API).
 
-The class ImageChatManager is rather simple, as the images in Gemini Pro
-do not have a contextual environment. This class performs some tasks
-such as obtaining photos to addresses and so on.
+The class ImageChatManager is rather simple, as images do not have a
+contextual environment. It fetches the right size of the photo through
+the photo pipeline and asks the vision model about it.
 """
 from io import BytesIO
-from typing import Dict
 
-import requests
-
-from .config import BOT_TOKEN
-from .gemini import ChatConversation, generate_text_with_image
+from .config import SESSION_DB, SESSION_MAX_COUNT, SESSION_MAX_BYTES, SESSION_IDLE_TTL, photo_too_large_info, photo_failed_info
+from .gemini import ChatConversation, IMAGE_NO_API_KEY_MESSAGE, generate_text_with_image, image_supported
+from .photo_pipeline import PhotoTooLarge, fetch_photo, file_resolver, pick_photo_size
+from .session_store import SessionStore
 
 
 class ChatManager:
     """setting up a basic conversation storage manager"""
 
     def __init__(self):
-        self.chats: Dict[int, ChatConversation] = {}
-
-    def _new_chat(self, history_id: int) -> ChatConversation:
-        chat = ChatConversation()
-        self.chats[history_id] = chat
-        return chat
+        self.chats = SessionStore(
+            ChatConversation.from_state,
+            max_sessions=SESSION_MAX_COUNT,
+            max_bytes=SESSION_MAX_BYTES,
+            idle_ttl=SESSION_IDLE_TTL,
+            db_path=SESSION_DB,
+        )
 
     def get_chat(self, history_id: int) -> ChatConversation:
-        if self.chats.get(history_id) is None:
-            return self._new_chat(history_id)
-        return self.chats[history_id]
+        return self.chats.get(history_id)
+
+    def save_chat(self, history_id: int, chat: ChatConversation) -> None:
+        """Persist the conversation after it changed."""
+        try:
+            self.chats.save(history_id, chat)
+        except Exception as e:
+            print(f"Failed to save chat session {history_id}: {e}")
+
+    def reset_chat(self, history_id: int) -> None:
+        self.chats.delete(history_id)
 
 
 class ImageChatManger:
-    def __init__(self, prompt, file_id: str) -> None:
+    def __init__(self, prompt, file_id: str, photo_sizes: list = None) -> None:
         self.prompt = prompt
-        self.file_id = file_id
+        self.photo_sizes = photo_sizes or [{"file_id": file_id}]
+        # The size that is actually downloaded, so the log links to the same (already resolved) file
+        self.file_id = pick_photo_size(self.photo_sizes)["file_id"]
 
     def tel_photo_url(self) -> str:
-        """process telegram photo url"""
-        r_file_id = requests.get(
-            f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={self.file_id}"
-        )
-        file_path = r_file_id.json().get("result").get("file_path")
-        download_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-        return download_url
+        """process telegram photo url (getFile is memoized)"""
+        try:
+            return file_resolver.url(self.file_id)
+        except Exception as e:
+            print(f"Photo URL not resolved: {e}")
+            return ""
 
     def photo_bytes(self) -> BytesIO:
-        """get photo bytes"""
-        photo_url = self.tel_photo_url()
-        response = requests.get(photo_url)
-        photo_bytes = BytesIO(response.content)
-        return photo_bytes
+        """get photo bytes, downscaled for the vision model"""
+        return BytesIO(fetch_photo(self.photo_sizes))
 
     def send_image(self) -> str:
-        response = generate_text_with_image(self.prompt, self.photo_bytes())
+        if not image_supported():
+            return IMAGE_NO_API_KEY_MESSAGE
+        try:
+            photo = self.photo_bytes()
+        except PhotoTooLarge as e:
+            print(f"Photo not processed: {e}")
+            return photo_too_large_info
+        except Exception as e:
+            # getFile, the download or decoding failed, or decoding timed out
+            print(f"Photo not processed: {e!r}")
+            return photo_failed_info
+        response = generate_text_with_image(self.prompt, photo)
         return response
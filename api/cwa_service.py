@@ -1,12 +1,81 @@
 # cwa_service.py - Taiwan Central Weather Administration earthquake service
+import hashlib
 import requests
 import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, timezone
-from .config import CWA_API_KEY, CWA_ALARM_API, CWA_SIGNIFICANT_API
+from .config import (CWA_API_KEY, CWA_ALARM_API, CWA_SIGNIFICANT_API, CWA_ALARM_MAX_AGE, SIGNIFICANT_DB,
+                     SIGNIFICANT_MAX_AGE, SIGNIFICANT_BACKFILL_DAYS)
+from .significant_store import SignificantStore
 
 TAIPEI_TZ = timezone(timedelta(hours=8))
 
+# Callbacks told about the newest significant earthquake whenever a fetch shows one not seen before
+_significant_listeners = []
+_seen_earthquake_ids = OrderedDict()
+_seen_lock = threading.Lock()
+
+# Callbacks given every batch of reports new to the store, e.g. a whole backfill
+_significant_report_listeners = []
+
+def add_significant_listener(callback):
+    """Register callback(eq) for new significant earthquakes (eq as returned by fetch_latest_significant_earthquake)."""
+    _significant_listeners.append(callback)
+
+def add_significant_reports_listener(callback):
+    """Register callback(df) for every batch of significant reports the store had not seen (rows as in the store's frame)."""
+    _significant_report_listeners.append(callback)
+
+def _notify_new_significant(df: pd.DataFrame):
+    """Pass the new reports to the report listeners, and call the listeners if the newest quake in df has not been seen yet."""
+    if df.empty:
+        return
+    for callback in _significant_report_listeners:
+        try:
+            callback(df)
+        except Exception as e:
+            print(f"Significant reports listener failed: {e}")
+    if not _significant_listeners:
+        return
+    newest = df.sort_values(by="Time", ascending=False).iloc[0].to_dict()
+    eq_id = newest.get("ID")
+    if eq_id is None:
+        return
+    with _seen_lock:
+        if eq_id in _seen_earthquake_ids:
+            return
+        _seen_earthquake_ids[eq_id] = True
+        while len(_seen_earthquake_ids) > 1000:
+            _seen_earthquake_ids.popitem(last=False)
+    if pd.notna(newest.get("Time")):
+        newest["TimeStr"] = newest["Time"].strftime('%Y-%m-%d %H:%M')
+    for callback in _significant_listeners:
+        try:
+            callback(newest)
+        except Exception as e:
+            print(f"Significant earthquake listener failed: {e}")
+
+def start_significant_watch(interval: float):
+    """Sync the significant earthquake store every `interval` seconds in the background,
+    so listeners hear about a new quake even before anyone asks. Returns the thread (None if disabled)."""
+    if interval <= 0 or not CWA_API_KEY:
+        return None
+    def _watch():
+        while True:
+            try:
+                # Another worker's sync within the interval is as good as this one
+                significant_store.sync(max_age=interval / 2)
+            except Exception as e:
+                print(f"Significant earthquake watch failed: {e}")
+            time.sleep(interval)
+    thread = threading.Thread(target=_watch, name="significant-watch", daemon=True)
+    thread.start()
+    return thread
+
 def _escape_braces(s: str) -> str:
     """Escape curly braces for string formatting."""
     return str(s).replace('{', '{{').replace('}', '}}')
@@ -37,20 +106,113 @@ def _parse_cwa_time(s: str) -> tuple[str, str]:
         return (tw_str, utc_str)
     return (s, "Unknown")
 
-def fetch_cwa_alarm_list(limit: int = 5) -> str:
-    """Fetch earthquake early warnings from CWA API."""
+# Callbacks told about early warnings whose identifier was not in the list before
+_alarm_listeners = []
+
+def add_alarm_listener(callback):
+    """Register callback(item) for each new early warning (item as found in the CWA alarm list).
+    Warnings already in the list when the bot starts are not reported."""
+    _alarm_listeners.append(callback)
+
+def alarm_origin_time(it) -> datetime | None:
+    """The warning's originTime as an aware datetime (Taiwan time if no offset is given)."""
     try:
-        r = requests.get(CWA_ALARM_API, timeout=10)
-        r.raise_for_status()
-        payload = r.json()
-    except Exception as e:
-        return f"❌ Earthquake warning query failed: {e}"
-    items = payload.get("data", [])
+        dt = datetime.fromisoformat(str(it.get("originTime", "")).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=TAIPEI_TZ)
+
+class _AlarmSnapshot:
+    """The parsed early warning list, newest first, with the text rendered for each limit."""
+
+    def __init__(self, items: list, digest: str, etag: str = None, last_modified: str = None):
+        self.items = items
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = time.time()
+        self.rendered = {}
+
+_alarm_snapshot = None
+_alarm_refresh_lock = threading.Lock()
+_alarm_stats = {"polls": 0, "not_modified": 0, "unchanged": 0, "changed": 0, "errors": 0}
+
+def _alarm_time_key(it):
+    return alarm_origin_time(it) or datetime.min.replace(tzinfo=timezone.utc)
+
+def refresh_cwa_alarms(max_age: float = 0) -> bool:
+    """Fetch the early warning list into the in-memory snapshot. Returns True if it changed.
+
+    The request is conditional (If-None-Match / If-Modified-Since) and a 200
+    whose body hashes the same as the snapshot's is not parsed again. Nothing
+    is fetched if the snapshot was checked less than `max_age` seconds ago,
+    so callers that queued behind another refresh reuse its result.
+    Listeners hear about new identifiers once the lock is released.
+    """
+    global _alarm_snapshot
+    with _alarm_refresh_lock:
+        snapshot = _alarm_snapshot
+        if snapshot is not None and time.time() - snapshot.checked_at < max_age:
+            return False
+        headers = {}
+        if snapshot is not None:
+            if snapshot.etag: headers["If-None-Match"] = snapshot.etag
+            if snapshot.last_modified: headers["If-Modified-Since"] = snapshot.last_modified
+        _alarm_stats["polls"] += 1
+        try:
+            r = requests.get(CWA_ALARM_API, headers=headers, timeout=10)
+            if r.status_code == 304 and snapshot is not None:
+                _alarm_stats["not_modified"] += 1
+                snapshot.checked_at = time.time()
+                return False
+            r.raise_for_status()
+            digest = hashlib.sha1(r.content).hexdigest()
+            if snapshot is not None and digest == snapshot.digest:
+                _alarm_stats["unchanged"] += 1
+                snapshot.checked_at = time.time()
+                return False
+            items = sorted(r.json().get("data", []), key=_alarm_time_key, reverse=True)
+        except Exception:
+            _alarm_stats["errors"] += 1
+            raise
+        _alarm_snapshot = _AlarmSnapshot(items, digest, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        _alarm_stats["changed"] += 1
+        new_items = []
+        if snapshot is not None:
+            known = {it.get("identifier") for it in snapshot.items}
+            new_items = [it for it in items if it.get("identifier") and it.get("identifier") not in known]
+    for item in reversed(new_items):
+        for callback in _alarm_listeners:
+            try:
+                callback(item)
+            except Exception as e:
+                print(f"Earthquake warning listener failed: {e}")
+    return True
+
+def start_alarm_watch(interval: float):
+    """Refresh the early warning snapshot every `interval` seconds in the background.
+    Returns the thread (None if disabled)."""
+    if interval <= 0:
+        return None
+    def _watch():
+        while True:
+            try:
+                refresh_cwa_alarms()
+            except Exception as e:
+                print(f"Earthquake warning watch failed: {e}")
+            time.sleep(interval)
+    thread = threading.Thread(target=_watch, name="alarm-watch", daemon=True)
+    thread.start()
+    return thread
+
+def alarm_watch_stats() -> dict:
+    snapshot = _alarm_snapshot
+    return {**_alarm_stats,
+            "items": len(snapshot.items) if snapshot else None,
+            "age": round(time.time() - snapshot.checked_at, 1) if snapshot else None}
+
+def _render_alarm_list(items: list, limit: int) -> str:
     if not items: return "✅ No earthquake warnings at this time."
-    def _key(it):
-        try: return datetime.fromisoformat(it.get("originTime", "").replace("Z", "+00:00"))
-        except: return datetime.min.replace(tzinfo=timezone.utc)
-    items = sorted(items, key=_key, reverse=True)
     lines = ["🚨 Earthquake Early Warnings (Latest):", "-" * 20]
     for it in items[:limit]:
         mag = _to_float(it.get("magnitudeValue"))
@@ -72,82 +234,141 @@ def fetch_cwa_alarm_list(limit: int = 5) -> str:
         )
     return "\n\n".join(lines).strip()
 
+def fetch_cwa_alarm_list(limit: int = 5) -> str:
+    """Earthquake early warnings from the in-memory snapshot kept by start_alarm_watch.
+
+    The snapshot is refreshed here only if it is missing or older than
+    CWA_ALARM_MAX_AGE (e.g. the poller is disabled); concurrent callers share
+    that one refresh. A stale snapshot is still shown if CWA cannot be reached.
+    """
+    snapshot = _alarm_snapshot
+    if snapshot is None or time.time() - snapshot.checked_at > CWA_ALARM_MAX_AGE:
+        try:
+            refresh_cwa_alarms(max_age=CWA_ALARM_MAX_AGE)
+        except Exception as e:
+            if _alarm_snapshot is None:
+                return f"❌ Earthquake warning query failed: {e}"
+        snapshot = _alarm_snapshot
+    text = snapshot.rendered.get(limit)
+    if text is None:
+        text = snapshot.rendered[limit] = _render_alarm_list(snapshot.items, limit)
+    return f"{text}\n\n🕒 Updated {time.time() - snapshot.checked_at:.0f} s ago"
+
+# Keys tried in order for each nested object and field of an E-A0015-001 record,
+# covering every case variant CWA has used; the first non-empty one wins
+_EPICENTER_KEYS = ("Epicenter", "epicenter")
+_MAGNITUDE_KEYS = ("Magnitude", "magnitude", "EarthquakeMagnitude")
+_SIGNIFICANT_FIELDS = {
+    "ID": ("quake", ("EarthquakeNo",)),
+    "Time": ("info", ("OriginTime",)),
+    "Lat": ("epicenter", ("EpicenterLatitude", "epicenterLatitude")),
+    "Lon": ("epicenter", ("EpicenterLongitude", "epicenterLongitude")),
+    "Depth": ("info", ("FocalDepth", "depth", "Depth")),
+    "Magnitude": ("magnitude", ("MagnitudeValue", "magnitudeValue", "Value", "value")),
+    "Location": ("epicenter", ("Location", "location")),
+    "URL": ("quake", ("Web", "ReportURL")),
+    "Report": ("quake", ("ReportContent",)),
+    "ImageURL": ("quake", ("ReportImageURI",)),
+}
+_SIGNIFICANT_NUMERIC = ("Lat", "Lon", "Depth", "Magnitude")
+_NUMBER_RE = r"([-+]?\d+(?:\.\d+)?)"
+
+def _is_missing(s: pd.Series) -> pd.Series:
+    return s.isna() | s.eq("")
+
+def _coalesce(dicts: list, keys: tuple) -> list:
+    """dict.get(k1) or dict.get(k2) or ... for every dict, one key at a time:
+    later keys are only looked up for the rows still empty."""
+    values = [d.get(keys[0]) for d in dicts]
+    for key in keys[1:]:
+        missing = [i for i, v in enumerate(values) if not v]
+        if not missing:
+            break
+        for i in missing:
+            values[i] = dicts[i].get(key)
+    return values
+
+def _to_numeric(values: list) -> np.ndarray:
+    """Vectorized _to_float: numbers and numeric strings convert in one go; only if some
+    value is not a plain number is the first number extracted from each string."""
+    try:
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        pass
+    s = pd.Series(values, dtype=object)
+    numbers = pd.to_numeric(s, errors="coerce")
+    leftover = numbers.isna() & ~_is_missing(s)
+    extracted = s[leftover].astype(str).str.extract(_NUMBER_RE, expand=False)
+    numbers[leftover] = pd.to_numeric(extracted, errors="coerce")
+    return numbers.to_numpy(dtype=float)
+
 def _parse_significant_earthquakes(obj: dict) -> pd.DataFrame:
-    """Parse significant earthquake data from CWA API response."""
-    records = obj.get("records", {})
-    quakes = records.get("Earthquake", [])
-    rows = []
-    for q in quakes:
-        ei = q.get("EarthquakeInfo", {})
-        
-        # Use robust way to get all data, checking all known case variations
-        epic = ei.get("Epicenter") or ei.get("epicenter") or {}
-        mag_info = ei.get("Magnitude") or ei.get("magnitude") or ei.get("EarthquakeMagnitude") or {}
-        depth_raw = ei.get("FocalDepth") or ei.get("depth") or ei.get("Depth")
-        mag_raw = mag_info.get("MagnitudeValue") or mag_info.get("magnitudeValue") or mag_info.get("Value") or mag_info.get("value")
-        
-        rows.append({
-            "ID": q.get("EarthquakeNo"), "Time": ei.get("OriginTime"),
-            "Lat": _to_float(epic.get("EpicenterLatitude") or epic.get("epicenterLatitude")),
-            "Lon": _to_float(epic.get("EpicenterLongitude") or epic.get("epicenterLongitude")),
-            "Depth": _to_float(depth_raw), 
-            "Magnitude": _to_float(mag_raw),
-            "Location": epic.get("Location") or epic.get("location"), 
-            "URL": q.get("Web") or q.get("ReportURL"),
-        })
-        
-    df = pd.DataFrame(rows)
-    if not df.empty and "Time" in df.columns:
-        df["Time"] = pd.to_datetime(df["Time"], errors="coerce").dt.tz_localize(TAIPEI_TZ)
-    return df
+    """Parse significant earthquake data from CWA API response, a column at a time."""
+    quakes = obj.get("records", {}).get("Earthquake", [])
+    if not quakes:
+        return pd.DataFrame()
+    infos = [q.get("EarthquakeInfo") or {} for q in quakes]
+    sources = {
+        "quake": quakes,
+        "info": infos,
+        "epicenter": [e or {} for e in _coalesce(infos, _EPICENTER_KEYS)],
+        "magnitude": [m or {} for m in _coalesce(infos, _MAGNITUDE_KEYS)],
+    }
+    columns = {name: _coalesce(sources[source], keys) for name, (source, keys) in _SIGNIFICANT_FIELDS.items()}
+    for name in _SIGNIFICANT_NUMERIC:
+        columns[name] = _to_numeric(columns[name])
+    columns["Time"] = pd.to_datetime(columns["Time"], errors="coerce", format="ISO8601").tz_localize(TAIPEI_TZ)
+    return pd.DataFrame(columns)
+
+def _render_significant(df: pd.DataFrame) -> list:
+    """One text block per row of a parsed significant earthquake frame, built from whole
+    columns rather than a Series per row."""
+    def text(value, default):
+        return value if isinstance(value, str) and value else default
+    # Taiwan wall-clock minutes formatted by numpy; Series.dt.strftime formats one timestamp at a time
+    minutes = df["Time"].dt.tz_localize(None).to_numpy().astype("datetime64[m]")
+    times = np.char.replace(np.datetime_as_string(minutes, unit="m"), "T", " ").tolist()
+    return [
+        f"Time: {'—' if t == 'NaT' else t}\n"
+        f"Location: {text(location, '—')}\n"
+        f"Magnitude: M{'—' if mag != mag else f'{mag:.1f}'} | Depth: {'—' if depth != depth else f'{depth:.0f}'} km\n"
+        f"Report: {text(url, 'None')}"
+        for t, location, mag, depth, url in zip(times, df["Location"].tolist(), df["Magnitude"].tolist(),
+                                                 df["Depth"].tolist(), df["URL"].tolist())
+    ]
+
+def _fetch_significant(time_from: datetime, time_to: datetime | None = None) -> pd.DataFrame:
+    """Significant earthquake reports with OriginTime in [time_from, time_to] from the CWA API."""
+    if not CWA_API_KEY: raise ValueError("Error: CWA_API_KEY Secret not set.")
+    params = {"Authorization": CWA_API_KEY, "format": "JSON",
+              "timeFrom": time_from.astimezone(TAIPEI_TZ).strftime("%Y-%m-%dT%H:%M:%S")}
+    if time_to is not None:
+        params["timeTo"] = time_to.astimezone(TAIPEI_TZ).strftime("%Y-%m-%dT%H:%M:%S")
+    r = requests.get(CWA_SIGNIFICANT_API, params=params, timeout=15)
+    r.raise_for_status()
+    return _parse_significant_earthquakes(r.json())
+
+significant_store = SignificantStore(_fetch_significant, SIGNIFICANT_DB, TAIPEI_TZ, max_age=SIGNIFICANT_MAX_AGE,
+                                     backfill_days=SIGNIFICANT_BACKFILL_DAYS, on_new=_notify_new_significant)
 
 def fetch_significant_earthquakes(days: int = 7, limit: int = 5) -> str:
-    """Fetch significant earthquakes from CWA API."""
+    """Significant earthquakes of the past `days` days (from midnight Taiwan time) from the local store."""
     if not CWA_API_KEY: return "❌ Significant earthquake query failed: Administrator has not set CWA_API_KEY."
-    now = datetime.now(timezone.utc)
-    time_from = (now - timedelta(days=days)).strftime("%Y-%m-%d")
-    params = {"Authorization": CWA_API_KEY, "format": "JSON", "timeFrom": time_from}
+    since = datetime.now(TAIPEI_TZ).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
     try:
-        r = requests.get(CWA_SIGNIFICANT_API, params=params, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        df = _parse_significant_earthquakes(data)
+        df = significant_store.window(since=since, limit=limit)
         if df.empty: return f"✅ No significant earthquakes reported in the past {days} days."
-        df = df.sort_values(by="Time", ascending=False).head(limit)
         lines = [f"🚨 CWA Latest Significant Earthquakes (past {days} days):", "-" * 20]
-        for _, row in df.iterrows():
-            mag_str = f"{row['Magnitude']:.1f}" if pd.notna(row['Magnitude']) else "—"
-            depth_str = f"{row['Depth']:.0f}" if pd.notna(row['Depth']) else "—"
-            lines.append(
-                f"Time: {row['Time'].strftime('%Y-%m-%d %H:%M') if pd.notna(row['Time']) else '—'}\n"
-                f"Location: {row['Location'] or '—'}\n"
-                f"Magnitude: M{mag_str} | Depth: {depth_str} km\n"
-                f"Report: {row['URL'] or 'None'}"
-            )
+        lines.extend(_render_significant(df))
         return "\n\n".join(lines)
     except Exception as e:
         return f"❌ Significant earthquake query failed: {e}"
 
 def fetch_latest_significant_earthquake() -> dict | None:
-    """Fetch the latest significant earthquake from CWA API."""
-    try:
-        if not CWA_API_KEY: raise ValueError("Error: CWA_API_KEY Secret not set.")
-        params = {"Authorization": CWA_API_KEY, "format": "JSON", "limit": 1, "orderby": "OriginTime desc"}
-        r = requests.get(CWA_SIGNIFICANT_API, params=params, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        df = _parse_significant_earthquakes(data)
-        if df.empty: return None
-
-        latest_eq_data = df.iloc[0].to_dict()
-        
-        quakes = data.get("records", {}).get("Earthquake", [])
-        if quakes:
-            latest_eq_data["ImageURL"] = quakes[0].get("ReportImageURI")
-
-        if pd.notna(latest_eq_data.get("Time")):
-            latest_eq_data["TimeStr"] = latest_eq_data["Time"].strftime('%Y-%m-%d %H:%M')
-
-        return latest_eq_data
-    except Exception as e:
-        raise e
+    """The latest significant earthquake from the local store."""
+    if not CWA_API_KEY: raise ValueError("Error: CWA_API_KEY Secret not set.")
+    latest_eq_data = significant_store.latest()
+    if latest_eq_data is None: return None
+    if latest_eq_data.get("Time") is not None:
+        latest_eq_data["TimeStr"] = latest_eq_data["Time"].strftime('%Y-%m-%d %H:%M')
+    return latest_eq_data
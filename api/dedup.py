@@ -0,0 +1,155 @@
+"""
+Telegram redelivers an update when the webhook is slow or fails, and every
+copy carries the same update_id. The UpdateDeduplicator remembers recently
+seen update_ids so a redelivered copy is dropped instead of running the
+same LLM call, map render and reply again.
+
+The in-memory seen-set is bounded both by size and by TTL. An optional
+shared backend (SQLite file or Redis) lets several replicas dedupe
+together; the backend is consulted only when the local set has not seen
+the update yet.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteSeenBackend:
+    """Seen-set shared through a SQLite file, e.g. between gunicorn workers."""
+
+    def __init__(self, path: str, ttl: float) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._writes = 0
+
+    def add(self, update_id: int) -> bool:
+        """Mark update_id as seen. Returns False if it was already seen."""
+        now = time.time()
+        with self._lock:
+            # Insert, or refresh a row whose TTL already expired
+            cur = self._conn.execute(
+                "INSERT INTO seen_updates (update_id, seen_at) VALUES (?, ?) "
+                "ON CONFLICT(update_id) DO UPDATE SET seen_at = excluded.seen_at WHERE seen_at < ?",
+                (update_id, now, now - self.ttl),
+            )
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._conn.execute("DELETE FROM seen_updates WHERE seen_at < ?", (now - self.ttl,))
+            self._conn.commit()
+            return cur.rowcount > 0
+
+    def discard(self, update_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM seen_updates WHERE update_id = ?", (update_id,))
+            self._conn.commit()
+
+
+class RedisSeenBackend:
+    """Seen-set shared through Redis, using SET NX with an expiry."""
+
+    def __init__(self, url: str, ttl: float) -> None:
+        import redis  # Optional dependency, only needed for this backend
+
+        self.ttl = max(1, int(ttl))
+        self._client = redis.Redis.from_url(url)
+
+    def add(self, update_id: int) -> bool:
+        return bool(self._client.set(f"tg-bot:update:{update_id}", 1, nx=True, ex=self.ttl))
+
+    def discard(self, update_id: int) -> None:
+        self._client.delete(f"tg-bot:update:{update_id}")
+
+
+def make_seen_backend(url: str, ttl: float):
+    """Build a shared backend from a URL like sqlite:///path/to.db or redis://host:6379/0."""
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteSeenBackend(url[len("sqlite:///"):], ttl)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSeenBackend(url, ttl)
+    raise ValueError(f"Unsupported dedup backend: {url}")
+
+
+class UpdateDeduplicator:
+    """TTL-bounded LRU of seen update_ids with an optional shared backend."""
+
+    def __init__(self, ttl: float = 3600, max_size: int = 10000, backend=None) -> None:
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+
+        self.checked = 0
+        self.duplicates = 0
+        self.backend_errors = 0
+
+    def is_duplicate(self, update_id: Optional[int]) -> bool:
+        """Record update_id and return True if it was seen within the TTL."""
+        if update_id is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self.checked += 1
+            self._expire(now)
+            if update_id in self._seen:
+                self.duplicates += 1
+                return True
+            self._seen[update_id] = now + self.ttl
+            while len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+
+        if self.backend is not None:
+            try:
+                if not self.backend.add(update_id):
+                    with self._lock:
+                        self.duplicates += 1
+                    return True
+            except Exception as e:
+                # Fail open: handling an update twice is better than dropping it
+                with self._lock:
+                    self.backend_errors += 1
+                logger.warning(f"Dedup backend error for update {update_id}: {e}")
+        return False
+
+    def forget(self, update_id: Optional[int]) -> None:
+        """Forget update_id, e.g. when it was rejected and Telegram will resend it."""
+        if update_id is None:
+            return
+        with self._lock:
+            self._seen.pop(update_id, None)
+        if self.backend is not None:
+            try:
+                self.backend.discard(update_id)
+            except Exception as e:
+                logger.warning(f"Dedup backend error forgetting update {update_id}: {e}")
+
+    def _expire(self, now: float) -> None:
+        # Entries are inserted in time order, so expired ones sit at the front
+        while self._seen:
+            update_id, expires_at = next(iter(self._seen.items()))
+            if expires_at > now:
+                break
+            self._seen.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "tracked": len(self._seen),
+                "checked": self.checked,
+                "duplicates_dropped": self.duplicates,
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+                "backend_errors": self.backend_errors,
+            }
@@ -0,0 +1,141 @@
+"""
+The UpdateDispatcher decouples receiving a Telegram update from handling
+it. The webhook only has to enqueue the update and can answer Telegram
+straight away, while a bounded pool of worker threads does the slow part
+(LLM calls, map rendering, Telegram round-trips).
+
+Updates are grouped by chat: a chat is only ever owned by one worker at a
+time, so replies within a chat keep their order, while different chats
+are processed in parallel. When the total number of pending updates
+reaches the configured limit new updates are rejected, so a burst of
+heavy commands cannot pile up without bound.
+
+If a deduplicator is given, updates Telegram redelivers are dropped
+before they are queued.
+"""
+import logging
+import queue
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(update: Dict):
+    """Return the chat id an update belongs to, or None if it has none."""
+    for key in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        message = update.get(key)
+        if isinstance(message, dict):
+            return message.get("chat", {}).get("id")
+    callback = update.get("callback_query")
+    if isinstance(callback, dict):
+        return callback.get("message", {}).get("chat", {}).get("id")
+    return None
+
+
+class UpdateDispatcher:
+    """Bounded worker pool with per-chat FIFO ordering."""
+
+    def __init__(self, handler: Callable[[Dict], None], workers: int = 8, max_pending: int = 200, deduplicator=None) -> None:
+        self.handler = handler
+        self.deduplicator = deduplicator
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+
+        self._lock = threading.Lock()
+        self._pending: Dict[object, Deque[Dict]] = {}
+        self._ready: "queue.Queue[object]" = queue.Queue()
+        self._threads = []
+        self._started = False
+
+        self.queued = 0
+        self.active = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"update-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, update: Dict) -> bool:
+        """Queue an update. Returns False if the queue is full.
+
+        Duplicates are acknowledged (True) without being queued.
+        """
+        if not self._started:
+            self.start()
+        update_id = update.get("update_id")
+        if self.deduplicator is not None and self.deduplicator.is_duplicate(update_id):
+            return True
+        chat_id = update_chat_id(update)
+        # Updates without a chat have no ordering constraint, give them their own key
+        key = chat_id if chat_id is not None else ("update", update_id, id(update))
+        with self._lock:
+            full = self.queued >= self.max_pending
+            if full:
+                self.rejected += 1
+            else:
+                self.queued += 1
+                self.accepted += 1
+                chat_queue = self._pending.get(key)
+                if chat_queue is None:
+                    # The chat is idle: create its queue and schedule it
+                    self._pending[key] = deque([update])
+                    self._ready.put(key)
+                else:
+                    # A worker owns (or will own) this chat and will drain it in order
+                    chat_queue.append(update)
+        if full:
+            if self.deduplicator is not None:
+                # Telegram will redeliver it, which must not count as a duplicate
+                self.deduplicator.forget(update_id)
+            return False
+        return True
+
+    def _worker(self) -> None:
+        while True:
+            key = self._ready.get()
+            with self._lock:
+                update = self._pending[key].popleft()
+                self.queued -= 1
+                self.active += 1
+            try:
+                self.handler(update)
+                ok = True
+            except Exception as e:
+                ok = False
+                logger.exception(f"Error handling update {update.get('update_id')}: {e}")
+            with self._lock:
+                self.active -= 1
+                if ok:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+                if self._pending[key]:
+                    # Go to the back of the line so other chats get a turn
+                    self._ready.put(key)
+                else:
+                    del self._pending[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "queue_depth": self.queued,
+                "active": self.active,
+                "chats_pending": len(self._pending),
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "failed": self.failed,
+            }
@@ -0,0 +1,101 @@
+"""
+Compact earthquake context for the LLM prompt.
+
+Listing every quake a search returns, one line each, makes a question
+like "2024 earthquakes" produce thousands of lines: prompt evaluation on
+the small model becomes the slowest part of the answer, or the prompt no
+longer fits its context at all. build_earthquake_context() instead
+summarises the result set (count, magnitude and depth distribution,
+busiest days and regions) and lists only the strongest events, adding
+sections in order of usefulness until the token budget is spent.
+"""
+import re
+from typing import Dict, List
+
+import pandas as pd
+
+from .config import EQ_CONTEXT_TOKENS, EQ_CONTEXT_TOP_K
+from .tokens import estimate_tokens
+
+# "花蓮縣政府東南方 20.0 公里 (位於臺灣東部海域)" -> "臺灣東部海域"
+_CWA_REGION_RE = re.compile(r"[(（]\s*(?:位於)?\s*([^()（）]+?)\s*[)）]")
+# "12 km SSE of Hualien City, Taiwan" -> "Hualien City, Taiwan"
+_USGS_REGION_RE = re.compile(r"^\s*[\d.]+\s*km\s+[NSEW]{1,3}\s+of\s+", re.IGNORECASE)
+
+
+def _region(location) -> str:
+    if not isinstance(location, str) or not location.strip():
+        return "Unknown"
+    match = _CWA_REGION_RE.search(location)
+    if match:
+        return match.group(1)
+    return _USGS_REGION_RE.sub("", location).strip()
+
+
+def earthquake_frame(eq_list: List[Dict]) -> pd.DataFrame:
+    """Search rows as a DataFrame with numeric Magnitude/Depth plus Date and Region columns."""
+    df = pd.DataFrame(eq_list)
+    for column in ("Time", "Location", "Magnitude", "Depth"):
+        if column not in df.columns:
+            df[column] = None
+    df["Magnitude"] = pd.to_numeric(df["Magnitude"], errors="coerce")
+    df["Depth"] = pd.to_numeric(df["Depth"], errors="coerce")
+    df["Date"] = pd.to_datetime(df["Time"], errors="coerce").dt.strftime("%Y-%m-%d")
+    df["Region"] = df["Location"].map(_region)
+    return df
+
+
+def _event_line(rank: int, row) -> str:
+    magnitude = f"M{row.Magnitude:.1f}" if pd.notna(row.Magnitude) else "M?"
+    depth = f"{row.Depth:.0f} km" if pd.notna(row.Depth) else "? km"
+    return f"{rank}. {row.Time}, {row.Location}, {magnitude}, depth {depth}"
+
+
+def summary_lines(df: pd.DataFrame) -> List[str]:
+    """Aggregate statistics, most important first."""
+    lines = [f"Total earthquakes: {len(df)}"]
+    magnitudes = df["Magnitude"].dropna()
+    if not magnitudes.empty:
+        lines.append(f"Magnitude: max M{magnitudes.max():.1f}, mean M{magnitudes.mean():.1f}, median M{magnitudes.median():.1f}")
+        bins = pd.cut(magnitudes, [-10, 4, 5, 6, 7, 10], right=False, labels=["<M4", "M4-5", "M5-6", "M6-7", "M7+"])
+        counts = bins.value_counts().sort_index()
+        lines.append("Magnitude distribution: " + ", ".join(f"{label} {count}" for label, count in counts.items() if count))
+    depths = df["Depth"].dropna()
+    if not depths.empty:
+        bins = pd.cut(depths, [-1, 30, 70, 300, 1000], labels=["shallow <30 km", "30-70 km", "70-300 km", "deep >300 km"])
+        counts = bins.value_counts().sort_index()
+        lines.append(f"Depth: median {depths.median():.0f} km; " + ", ".join(f"{label} {count}" for label, count in counts.items() if count))
+    days = df["Date"].dropna().value_counts().head(3)
+    if not days.empty:
+        lines.append("Busiest days: " + ", ".join(f"{day} ({count})" for day, count in days.items()))
+    regions = df["Region"].value_counts().head(3)
+    if not regions.empty:
+        lines.append("Busiest regions: " + ", ".join(f"{region} ({count})" for region, count in regions.items()))
+    return lines
+
+
+def build_earthquake_context(eq_list: List[Dict], header: str = "", max_tokens: int = EQ_CONTEXT_TOKENS,
+                             top_k: int = EQ_CONTEXT_TOP_K) -> str:
+    """Statistics plus the top_k strongest events, within about max_tokens."""
+    df = earthquake_frame(eq_list)
+    parts = [header] if header else []
+    used = estimate_tokens(header)
+
+    def add(line: str) -> bool:
+        nonlocal used
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            return False
+        parts.append(line)
+        used += cost
+        return True
+
+    for line in summary_lines(df):
+        if not add(line):
+            break
+    strongest = df.sort_values("Magnitude", ascending=False, na_position="last").head(top_k)
+    if not strongest.empty and add(f"Strongest {len(strongest)} events:"):
+        for rank, row in enumerate(strongest.itertuples(index=False), 1):
+            if not add(_event_line(rank, row)):
+                break
+    return "\n".join(parts)
@@ -0,0 +1,133 @@
+"""
+Direct answers for structured earthquake questions.
+
+"How many M5+ quakes in 2024", "what was the biggest quake last month",
+"the latest one" or "average depth" are fully answered by the search
+results, so they do not need a generation: detect_intents() spots them
+and answer() computes them with pandas in milliseconds. The search only
+applies the date range and magnitudes, so a question that also narrows
+by place, depth or intensity ("quakes near Hualien", "花蓮最大地震") is
+not answered from the unfiltered results. Such questions, open-ended
+questions ("why", "what should I do") and questions with no recognised
+intent still go to the LLM. IntentRouter counts how often each path is
+taken.
+"""
+import re
+import threading
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from .eq_context import earthquake_frame
+
+INTENT_PATTERNS = {
+    "count": re.compile(r"how many|number of|\bcount\b|多少(?:次|個|个|起|筆|笔|場|场)|幾次|几次|幾個|几个|幾起|几起|次數|次数|筆數|笔数",
+                        re.IGNORECASE),
+    "max": re.compile(r"biggest|largest|strongest|maximum|\bmax\b|最大|最強|最强", re.IGNORECASE),
+    "latest": re.compile(r"latest|most recent|last (?:one|quake|earthquake)|最近一次|最新|最後一次|最后一次", re.IGNORECASE),
+    "avg_depth": re.compile(r"(?:average|mean|avg)\s+depth|平均深度", re.IGNORECASE),
+}
+# Questions that ask for explanation or advice need the model even if they mention a statistic
+OPEN_ENDED_RE = re.compile(
+    r"\bwhy\b|explain|how (?:does|do|can|should)|what should|為什麼|为什么|原因|建議|建议|如何|怎麼|怎么|影響|影响|預測|预测",
+    re.IGNORECASE,
+)
+# Filters the search does not apply: places in or around Taiwan, depth bounds and intensity
+UNAPPLIED_FILTER_RE = re.compile(
+    r"花蓮|花莲|宜蘭|宜兰|臺東|台東|台东|南投|臺北|台北|新北|桃園|桃园|新竹|苗栗|臺中|台中|彰化|雲林|云林|嘉義|嘉义"
+    r"|臺南|台南|高雄|屏東|屏东|基隆|澎湖|金門|金门|馬祖|马祖|連江|连江|綠島|绿岛|蘭嶼|兰屿"
+    r"|東部|东部|西部|南部|北部|中部|外海|近海|海域|附近|周邊|周边"
+    r"|\b(?:hualien|yilan|taitung|nantou|taipei|taoyuan|hsinchu|miaoli|taichung|changhua|yunlin|chiayi|tainan"
+    r"|kaohsiung|pingtung|keelung|penghu|kinmen|matsu)\b"
+    r"|\b(?:near|around|off the|close to|offshore|(?:east|west|north|south)(?:ern)? (?:coast|taiwan))\b"
+    r"|deeper|shallower|\bdepth (?:over|above|below|under|greater|less|more)|深度(?:大於|大于|小於|小于|超過|超过|低於|低于)"
+    r"|淺層|浅层|深層|深层|震度|intensity",
+    re.IGNORECASE,
+)
+_WIDE_RE = re.compile(r"[\u4e00-\u9fff]")
+
+
+def detect_intents(question: str) -> List[str]:
+    """Intents the question asks for, or [] if it should go to the LLM."""
+    if OPEN_ENDED_RE.search(question) or UNAPPLIED_FILTER_RE.search(question):
+        return []
+    return [name for name, pattern in INTENT_PATTERNS.items() if pattern.search(question)]
+
+
+def _describe(row, zh: bool) -> str:
+    magnitude = f"M{row['Magnitude']:.1f}" if pd.notna(row["Magnitude"]) else "M?"
+    if zh:
+        depth = f"深度 {row['Depth']:.0f} 公里" if pd.notna(row["Depth"]) else "深度不明"
+        return f"{row['Time']}，{row['Location'] or '位置不明'}，規模 {magnitude}，{depth}"
+    depth = f"depth {row['Depth']:.0f} km" if pd.notna(row["Depth"]) else "depth unknown"
+    return f"{row['Time']}, {row['Location'] or 'unknown location'}, {magnitude}, {depth}"
+
+
+def answer(intents: List[str], eq_list: List[Dict], question: str, start_date: str, end_date: str,
+           min_magnitude: float, max_magnitude: float) -> str:
+    """Compute the requested figures from the search results."""
+    zh = bool(_WIDE_RE.search(question))
+    if zh:
+        lines = [f"🌍 {start_date} 至 {end_date}，規模 M{min_magnitude:g}–{max_magnitude:g}："]
+    else:
+        lines = [f"🌍 {start_date} to {end_date}, M{min_magnitude:g}–{max_magnitude:g}:"]
+    df = earthquake_frame(eq_list)
+    if df.empty:
+        lines.append("找不到符合條件的地震。" if zh else "No earthquakes matched.")
+        return "\n".join(lines)
+
+    for intent in intents:
+        if intent == "count":
+            lines.append(f"📊 共 {len(df)} 筆地震。" if zh else f"📊 {len(df)} earthquakes.")
+        elif intent == "max":
+            magnitudes = df["Magnitude"]
+            if magnitudes.notna().any():
+                row = df.loc[magnitudes.idxmax()]
+                lines.append(f"📈 最大地震：{_describe(row, zh)}" if zh else f"📈 Largest: {_describe(row, zh)}")
+        elif intent == "latest":
+            times = pd.to_datetime(df["Time"], errors="coerce")
+            if times.notna().any():
+                row = df.loc[times.idxmax()]
+                lines.append(f"🕒 最近一次：{_describe(row, zh)}" if zh else f"🕒 Most recent: {_describe(row, zh)}")
+        elif intent == "avg_depth":
+            depths = df["Depth"].dropna()
+            if not depths.empty:
+                if zh:
+                    lines.append(f"📏 平均深度 {depths.mean():.1f} 公里（中位數 {depths.median():.0f} 公里，{len(depths)} 筆）。")
+                else:
+                    lines.append(f"📏 Average depth {depths.mean():.1f} km (median {depths.median():.0f} km, {len(depths)} quakes).")
+    return "\n".join(lines)
+
+
+class IntentRouter:
+    """Answers structured questions from data and records the hit rate."""
+
+    def __init__(self) -> None:
+        self.hits: Dict[str, int] = {name: 0 for name in INTENT_PATTERNS}
+        self.answered = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def try_answer(self, question: str, eq_list: List[Dict], start_date: str, end_date: str,
+                   min_magnitude: float, max_magnitude: float) -> Optional[str]:
+        """The direct answer, or None if the question needs the LLM."""
+        intents = detect_intents(question)
+        text = answer(intents, eq_list, question, start_date, end_date, min_magnitude, max_magnitude) if intents else None
+        with self._lock:
+            if text is None:
+                self.fallbacks += 1
+            else:
+                self.answered += 1
+                for intent in intents:
+                    self.hits[intent] += 1
+        return text
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.answered + self.fallbacks
+            return {
+                "answered": self.answered,
+                "fallbacks": self.fallbacks,
+                "hit_rate": round(self.answered / total, 3) if total else None,
+                "intents": dict(self.hits),
+            }
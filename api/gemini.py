@@ -2,10 +2,12 @@ import os
 from io import BytesIO
 from typing import Optional
 from .config import new_chat_info, prompt_new_info, gemini_err_info, generation_config, safety_settings
+from .config import CHAT_HISTORY_TURNS, CHAT_CONTEXT_TOKENS, CHAT_SUMMARY_BATCH
+from .tokens import estimate_tokens, truncate_to_tokens
 
 # Lazy import to avoid potential circular dependencies
 try:
-    from .ai_service import generate_ai_text
+    from .ai_service import generate_ai_text, summarize_conversation, describe_image, OLLAMA_VISION_MODEL
     AI_SERVICE_AVAILABLE = True
 except ImportError:
     AI_SERVICE_AVAILABLE = False
@@ -29,28 +31,123 @@ class MockResponse:
     def __init__(self, text: str):
         self.text = text
 
+# Per-message overhead (role markers, separators) added to the token estimate
+MESSAGE_TOKEN_OVERHEAD = 4
+
+def _message_tokens(message: dict) -> int:
+    return estimate_tokens(message["parts"][0]["text"]) + MESSAGE_TOKEN_OVERHEAD
+
 class ChatConversation:
-    def __init__(self):
+    """A chat with the model.
+
+    The model sees every turn not yet folded into the running summary
+    verbatim, plus the summary, trimmed so the whole prompt stays within
+    CHAT_CONTEXT_TOKENS. compact_history() folds turns older than the last
+    CHAT_HISTORY_TURNS, and folds early when the unsummarized turns grow
+    too long, so a turn only leaves the prompt once the summary covers it.
+    `summarized` counts the leading history messages already folded into
+    `summary`.
+    """
+
+    def __init__(self, history=None, summary: str = "", summarized: int = 0):
         """Initialize chat conversation with Ollama AI support."""
-        self.history = []
+        self.history = history or []
+        self.summary = summary
+        self.summarized = summarized
         print("已使用 Ollama AI 初始化聊天。")
 
-    def send_message(self, text: str) -> MockResponse:
-        """Send a message and get an AI response from Ollama"""
-        # Track history for consistency
-        self.history.append({"role": "user", "parts": [{"text": text}]})
-        
+    def to_state(self) -> dict:
+        """Compact, JSON-serialisable form used by the session store."""
+        state = {"h": [["u" if m["role"] == "user" else "m", m["parts"][0]["text"]] for m in self.history]}
+        if self.summary:
+            state["s"] = self.summary
+            state["n"] = self.summarized
+        return state
+
+    @classmethod
+    def from_state(cls, state: Optional[dict]) -> "ChatConversation":
+        if not state:
+            return cls()
+        history = [
+            {"role": "user" if role == "u" else "model", "parts": [{"text": text}]}
+            for role, text in state.get("h", [])
+        ]
+        return cls(history, state.get("s", ""), state.get("n", 0))
+
+    def context_window(self, prompt: str = "") -> list:
+        """Ollama chat messages to send before `prompt`, within the token budget.
+
+        The summary gets at most a quarter of the budget; the turns not yet
+        in the summary are then added newest first until the budget is spent.
+        """
+        budget = CHAT_CONTEXT_TOKENS - estimate_tokens(prompt) - MESSAGE_TOKEN_OVERHEAD
+        messages = []
+        summary = ""
+        if self.summary and budget > 0:
+            summary = truncate_to_tokens(self.summary, budget // 4)
+            budget -= estimate_tokens(summary) + MESSAGE_TOKEN_OVERHEAD
+
+        for message in reversed(self.history[self.summarized:]):
+            cost = _message_tokens(message)
+            if cost > budget:
+                break
+            budget -= cost
+            messages.append({"role": "user" if message["role"] == "user" else "assistant",
+                             "content": message["parts"][0]["text"]})
+        messages.reverse()
+
+        if summary:
+            messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        return messages
+
+    def compact_history(self) -> bool:
+        """Fold turns that left the verbatim window into the running summary.
+
+        Runs once CHAT_SUMMARY_BATCH turns are waiting, so the model is asked
+        for a summary every few turns rather than on every message, or as
+        soon as the unsummarized turns take more than half of
+        CHAT_CONTEXT_TOKENS; then it also folds recent turns until the rest
+        fits, so context_window() can keep them all unless the prompt itself
+        is very long.
+        Returns True when the summary was updated.
+        """
+        unsummarized = self.history[self.summarized:]
+        pending = max(0, len(unsummarized) - CHAT_HISTORY_TURNS * 2)
+        pending -= pending % 2  # whole user/model turns only
+        kept = sum(_message_tokens(m) for m in unsummarized[pending:])
+        overflow = kept + sum(_message_tokens(m) for m in unsummarized[:pending]) > CHAT_CONTEXT_TOKENS // 2
+        while overflow and kept > CHAT_CONTEXT_TOKENS // 2 and pending < len(unsummarized):
+            kept -= sum(_message_tokens(m) for m in unsummarized[pending:pending + 2])
+            pending += 2
+        if not pending or (pending < CHAT_SUMMARY_BATCH * 2 and not overflow) or not AI_SERVICE_AVAILABLE:
+            return False
+        folded = [
+            {"role": m["role"], "content": m["parts"][0]["text"]}
+            for m in self.history[self.summarized:self.summarized + pending]
+        ]
+        summary = summarize_conversation(self.summary, folded)
+        if not summary:
+            return False
+        self.summary = summary
+        self.summarized += pending
+        return True
+
+    def send_message(self, text: str, on_token=None) -> MockResponse:
+        """Send a message and get an AI response from Ollama.
+
+        on_token, if given, receives the answer while it is generated."""
         # Try to use Ollama AI service for generating response
         try:
             if not AI_SERVICE_AVAILABLE:
                 raise ImportError("AI service is not available")
-            response_text = generate_ai_text(text)
+            response_text = generate_ai_text(text, self.context_window(text), on_token)
         except Exception as e:
             # Truncate long messages for logging
             text_preview = text[:50] + "..." if len(text) > 50 else text
             print(f"Error calling Ollama AI for message \"{text_preview}\": {e}")
             response_text = AI_NOT_AVAILABLE_MESSAGE
         
+        self.history.append({"role": "user", "parts": [{"text": text}]})
         self.history.append({"role": "model", "parts": [{"text": response_text}]})
         
         return MockResponse(response_text)
@@ -59,9 +156,14 @@ class ChatConversation:
     def history_length(self):
         return len(self.history)
 
+def image_supported() -> bool:
+    """True if a vision model is configured, so photos are worth downloading"""
+    return AI_SERVICE_AVAILABLE and bool(OLLAMA_VISION_MODEL)
+
 def generate_text_with_image(prompt: str, image_bytes: BytesIO) -> str:
-    """Generate text with image - not currently supported"""
-    return IMAGE_NO_API_KEY_MESSAGE
+    """Generate text with image using the Ollama vision model, if one is configured"""
+    answer = describe_image(prompt, image_bytes.getvalue()) if AI_SERVICE_AVAILABLE else None
+    return answer or IMAGE_NO_API_KEY_MESSAGE
 
 def list_models():
     """List available models"""
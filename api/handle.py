@@ -11,16 +11,32 @@ As for images, in Gemini pro, they're context-free, so you can handle
 them pretty straight-up without much fuss.
 """
 
-from .auth import is_authorized
+import math
+
+from .auth import is_authorized, is_admin
 from .command import excute_command
 from .context import ChatManager, ImageChatManger
-from .telegram import Update, send_message
+from .gemini import image_supported
+from .telegram import Update, is_new_chat, send_message
 from .printLog import send_log,send_image_log
+from .rate_limit import quota_limiter
+from .stream_reply import StreamingReply
 from .config import *
 
 chat_manager = ChatManager()
 
 
+def _llm_quota_exceeded(update) -> bool:
+    """Charge one LLM request to the sender; reply and return True if over budget."""
+    if is_admin(update.from_id):
+        return False
+    wait = quota_limiter.acquire(update.from_id, "llm")
+    if wait <= 0:
+        return False
+    send_message(update.chat_id, rate_limited_info.format(seconds=math.ceil(wait)), reply_to_message_id=update.message_id)
+    return True
+
+
 def handle_message(update_data):
 
     #try:
@@ -41,7 +57,7 @@ def handle_message(update_data):
     authorized = is_authorized(update.is_group, update.from_id, update.user_name,  update.chat_id, update.group_name)
 
     if update.type == "command":
-        response_text = excute_command(update.from_id, update.text, update.from_type, update.chat_id)
+        response_text = excute_command(update.from_id, update.text, update.from_type, update.chat_id, authorized)
         if response_text!= "":
             send_message(update.chat_id, response_text)
             if update.is_group :
@@ -66,13 +82,28 @@ def handle_message(update_data):
             history_id = update.from_id
         else:
             history_id = update.chat_id
+        # Starting over does not call the model, so it is free even when the user is rate limited
+        if is_new_chat(update.text):
+            chat_manager.reset_chat(history_id)
+            send_message(update.chat_id, new_chat_info)
+            return
+        if _llm_quota_exceeded(update):
+            return
         chat = chat_manager.get_chat(history_id)
-        anwser = chat.send_message(update.text).text
+        reply = StreamingReply(update.chat_id).start() if STREAM_REPLIES == "1" else None
+        anwser = chat.send_message(update.text, on_token=reply.feed if reply else None).text
+        chat_manager.save_chat(history_id, chat)
         extra_text = (
             f"\n\n{prompt_new_info}" if chat.history_length >= prompt_new_threshold*2 else ""
         )
         response_text = f"{anwser}{extra_text}"
-        send_message(update.chat_id, response_text)
+        if reply is not None:
+            reply.finish(response_text)
+        else:
+            send_message(update.chat_id, response_text)
+        # Summarise turns that left the context window once the user has their reply
+        if chat.compact_history():
+            chat_manager.save_chat(history_id, chat)
         dialogueLogarithm = int(chat.history_length/2)
         if update.is_group:
             log = f"@{update.user_name} id:`{update.from_id}` {group} @{update.group_name} id:`{update.chat_id}`{the_content_sent_is}\n{update.text}\n{the_reply_content_is}\n{response_text}\n{the_logarithm_of_historical_conversations_is}{dialogueLogarithm}"
@@ -81,7 +112,10 @@ def handle_message(update_data):
         send_log(log)
 
     elif update.type == "photo":
-        chat = ImageChatManger(update.photo_caption, update.file_id)
+        # Without a vision model the reply says so, and costs no quota
+        if image_supported() and _llm_quota_exceeded(update):
+            return
+        chat = ImageChatManger(update.photo_caption, update.file_id, update.photo_sizes)
         response_text = chat.send_image()
         print(f"update.message_id {update.message_id}")
         # Use the reply_to_message_id parameter to let the bot reply to
@@ -5,8 +5,27 @@ from functools import wraps
 import threading
 import logging
 
-from .handle import handle_message
-from .config import STATIC_DIR, API_ACCESS_TOKEN, HF_SPACE_URL
+from .handle import handle_message, chat_manager
+from .dispatcher import UpdateDispatcher
+from .dedup import UpdateDeduplicator, make_seen_backend
+from .telegram_client import get_client
+from .send_scheduler import get_scheduler
+from .printLog import shipper
+from .command import router
+from .rate_limit import quota_limiter
+from .llm_scheduler import get_llm_scheduler
+from .photo_pipeline import file_resolver
+try:
+    from .ai_service import model_readiness, advice_cache, mcp_client_pool, mcp_query_cache, intent_router, response_cache
+    from .ai_service import knowledge_index, start_retrieval, llm_router
+    from .cwa_service import start_significant_watch, start_alarm_watch, alarm_watch_stats, significant_store
+    from .subscriptions import alert_broadcaster
+except ImportError:
+    model_readiness = advice_cache = mcp_client_pool = mcp_query_cache = intent_router = response_cache = start_significant_watch = None
+    knowledge_index = start_retrieval = llm_router = start_alarm_watch = alarm_watch_stats = alert_broadcaster = significant_store = None
+from .config import (STATIC_DIR, API_ACCESS_TOKEN, HF_SPACE_URL, ASYNC_DISPATCH, DISPATCH_WORKERS, DISPATCH_QUEUE_SIZE,
+                     DEDUP_TTL, DEDUP_MAX_SIZE, DEDUP_BACKEND, SIGNIFICANT_POLL_INTERVAL,
+                     CWA_ALARM_POLL_INTERVAL)
 
 app = Flask(__name__)
 logger = logging.getLogger(__name__)
@@ -35,6 +54,23 @@ def ping_hf_space():
 # Using a daemon thread to avoid blocking the application startup
 threading.Thread(target=ping_hf_space, daemon=True).start()
 
+# Pull and warm the Ollama models now rather than on the first user request
+if model_readiness is not None:
+    model_readiness.start()
+    # Watch the significant earthquake feed so advice for a new quake is precomputed
+    start_significant_watch(SIGNIFICANT_POLL_INTERVAL)
+    # /eq_alert is served from a snapshot of the CWA early warning list kept fresh here, and new warnings are pushed to subscribers
+    start_alarm_watch(CWA_ALARM_POLL_INTERVAL)
+    # Embed the built-in guidance and FAQ for retrieval once the embedding model is ready
+    start_retrieval()
+
+# Redelivered updates are dropped by update_id before they reach handle_message
+deduplicator = UpdateDeduplicator(ttl=DEDUP_TTL, max_size=DEDUP_MAX_SIZE, backend=make_seen_backend(DEDUP_BACKEND, DEDUP_TTL))
+
+# Updates are acknowledged right away and handled on a background worker pool
+dispatcher = UpdateDispatcher(handle_message, workers=DISPATCH_WORKERS, max_pending=DISPATCH_QUEUE_SIZE,
+                              deduplicator=deduplicator)
+
 
 def require_token(f):
     """Decorator to require authentication token for API endpoints
@@ -62,11 +98,61 @@ def require_token(f):
 def home():
     if request.method == "POST":
         update = request.json
-        handle_message(update)
+        if ASYNC_DISPATCH == "0":
+            update_id = update.get("update_id")
+            if not deduplicator.is_duplicate(update_id):
+                try:
+                    handle_message(update)
+                except Exception:
+                    # The error response makes Telegram redeliver it, which must not count as a duplicate
+                    deduplicator.forget(update_id)
+                    raise
+            return "ok"
+        if not dispatcher.submit(update):
+            # Non-2xx makes Telegram redeliver the update later
+            logger.warning(f"Update queue full, rejecting update {update.get('update_id')}")
+            return jsonify({'error': 'Busy', 'message': 'Update queue is full'}), 503
         return "ok"
     return render_template("status.html")
 
 
+@app.route("/metrics", methods=["GET"])
+@require_token
+def metrics():
+    """Report runtime statistics such as the update queue depth."""
+    return jsonify({
+        "dispatcher": dispatcher.stats(),
+        "dedup": deduplicator.stats(),
+        "telegram": get_client().stats(),
+        "send_scheduler": get_scheduler().stats(),
+        "log_shipper": shipper.stats(),
+        "commands": router.stats(),
+        "quotas": quota_limiter.stats(),
+        "sessions": chat_manager.chats.stats(),
+        "llm": get_llm_scheduler().stats(),
+        "llm_backends": llm_router.stats() if llm_router is not None else None,
+        "models": model_readiness.status() if model_readiness is not None else None,
+        "advice_cache": advice_cache.stats() if advice_cache is not None else None,
+        "intents": intent_router.stats() if intent_router is not None else None,
+        "llm_cache": response_cache.stats() if response_cache is not None else None,
+        "retrieval": knowledge_index.stats() if knowledge_index is not None else None,
+        "photos": file_resolver.stats(),
+        "cwa_alarm": alarm_watch_stats() if alarm_watch_stats is not None else None,
+        "cwa_significant": significant_store.stats() if significant_store is not None else None,
+        "alerts": alert_broadcaster.stats() if alert_broadcaster is not None else None,
+        "mcp": {"pool": mcp_client_pool.stats(), "cache": mcp_query_cache.stats()} if mcp_client_pool is not None else None,
+    })
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness probe: 200 once the Ollama models are pulled and loaded, 503 before."""
+    if model_readiness is None:
+        return jsonify({"ready": False, "error": "AI service unavailable"}), 503
+    status = model_readiness.status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+
 @app.route("/static/<path:filename>")
 def serve_static(filename):
     """Serve static files (e.g., generated earthquake maps)."""
@@ -0,0 +1,52 @@
+"""
+Passages indexed for retrieval: earthquake safety guidance, answers about
+the bot's own commands, and CWA significant earthquake reports.
+
+Each passage is {"id", "source", "text"}. Ids are stable so an edited
+passage replaces its old embedding instead of being indexed twice.
+"""
+from typing import Dict, List
+
+import pandas as pd
+
+DISASTER_GUIDANCE = [
+    ("drop-cover-hold", "地震發生時，應立即趴下、掩護、穩住：趴在地上，躲到堅固的桌子下保護頭頸部，並抓住桌腳直到搖晃停止。"),
+    ("indoors", "在室內遇到地震不要往外衝，遠離窗戶、玻璃、吊燈與高大家具；搖晃停止後再檢查瓦斯與電源，確認安全後才移動。"),
+    ("outdoors", "在戶外遇到地震，應遠離建築物、電線桿、招牌與圍牆，到空曠處蹲低並保護頭部。"),
+    ("driving", "開車時遇到地震，應打方向燈慢慢減速靠邊停車，不要停在橋上、隧道或高架道路下，留在車內直到搖晃停止。"),
+    ("elevator", "地震時不要搭乘電梯；若受困於電梯中，按下所有樓層按鈕，在電梯停止時盡快離開，無法離開時使用緊急通話求援。"),
+    ("aftershocks", "大地震後數小時至數天內常有餘震，規模可能接近主震；進入受損建築物前要特別小心，並持續留意中央氣象署的地震報告。"),
+    ("coast-tsunami", "在海邊感受到強烈或長時間的搖晃時，不必等待警報，應立即往高處或內陸移動，直到官方解除海嘯警報。"),
+    ("gas-fire", "搖晃停止後如聞到瓦斯味，應關閉瓦斯總開關、打開門窗通風，不要開關電器或使用明火，並盡快離開。"),
+    ("emergency-kit", "平時準備緊急避難包：飲用水、乾糧、手電筒、電池、收音機、急救用品、常用藥品、證件影本與少量現金。"),
+    ("family-plan", "與家人事先約定避難地點與聯絡方式，地震後電話可能壅塞，可改用簡訊或通訊軟體報平安。"),
+    ("furniture", "平時應將書櫃、衣櫃等高大家具固定在牆上，重物放低處，床邊避免放置易掉落物品。"),
+    ("intensity", "震度代表某地感受到的搖晃程度，規模代表地震釋放的能量；同一個地震只有一個規模，但各地震度不同。"),
+    ("alerts", "中央氣象署在偵測到地震後數秒內發布地震速報，預估震度達 4 級以上的地區會收到國家級警報（強震即時警報）。"),
+]
+
+BOT_FAQ = [
+    ("faq-latest", "想知道最新的顯著地震，可以使用 /eq_latest，會附上中央氣象署的報告圖片與防災建議。"),
+    ("faq-alert", "/eq_alert 顯示中央氣象署的地震速報；/eq_significant 列出過去 7 天的顯著有感地震。"),
+    ("faq-global", "/eq_global 列出全球近 24 小時的地震（USGS 資料），/eq_taiwan 列出台灣今年的地震。"),
+    ("faq-query", "/eq_query <起始日期> <結束日期> <最小規模> 可查詢指定期間的全球地震，例如 /eq_query 2024-01-01 2024-01-31 5.0。"),
+    ("faq-tw-query", "/eq_tw_query 可依條件查詢台灣地震目錄，並產生互動式地圖。"),
+    ("faq-ai", "/ai <問題> 使用 AI 回答問題；提到「地震」的問題會先查詢地震資料再回答。"),
+    ("faq-search", "/search <關鍵字> 可搜尋網頁，/new 可開始新的對話並清除先前的對話紀錄。"),
+]
+
+
+def seed_passages() -> List[Dict]:
+    """The built-in guidance and FAQ passages."""
+    return ([{"id": f"guide:{key}", "source": "guidance", "text": text} for key, text in DISASTER_GUIDANCE]
+            + [{"id": key, "source": "faq", "text": text} for key, text in BOT_FAQ])
+
+
+def earthquake_report_passage(eq: Dict) -> Dict:
+    """A passage for one CWA significant earthquake (eq as passed to significant listeners)."""
+    magnitude = f"M{eq['Magnitude']:.1f}" if pd.notna(eq.get("Magnitude")) else "規模不明"
+    depth = f"深度 {eq['Depth']:.0f} 公里" if pd.notna(eq.get("Depth")) else "深度不明"
+    text = f"中央氣象署顯著有感地震報告：{eq.get('TimeStr', '')}，{eq.get('Location') or '位置不明'}，{magnitude}，{depth}。"
+    if isinstance(eq.get("Report"), str) and eq["Report"]:
+        text += f" {eq['Report']}"
+    return {"id": f"cwa:{eq.get('ID')}", "source": "cwa", "text": text}
@@ -0,0 +1,424 @@
+"""
+LLMRouter sends generations to one of several LLM backends and hedges slow ones.
+
+Backends are Ollama servers (/api/generate, /api/chat) or OpenAI-compatible
+servers (/v1/chat/completions, e.g. llama.cpp, vLLM or LM Studio). Each one
+tracks an EWMA of its time to first token and of its error rate; requests go
+to the backend with the best score, and a backend that failed several times
+in a row sits out a cooldown.
+
+A request starts on the best backend. If no token has arrived once the
+hedge delay passes (the HEDGE_PERCENTILE of that backend's recent times to
+first token, clamped to [min_delay, max_delay]), the same request is sent to
+the next backend as well; a backend that fails before answering is replaced
+by the next one at once. The first backend to produce a token wins: only
+its tokens reach on_token, and every other attempt is cancelled, which
+closes its stream so the server abandons the generation. Requests are
+always streamed internally so any attempt can be cancelled between chunks.
+
+Embeddings (/api/embed) are not hedged: they go to the best backend that
+can embed and fail over to the next one on an error.
+"""
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from .llm_scheduler import LLMCancelled, LLMUnavailable
+from .metrics import LatencyHistogram
+
+
+class LLMAttemptCancelled(Exception):
+    """Raised inside an attempt that lost the race or whose request was cancelled."""
+
+
+class LLMBackend:
+    kind = "ollama"
+    embeds = True
+
+    def __init__(self, url: str, name: str = "", model: str = "", api_key: str = "",
+                 ewma_alpha: float = 0.2, failure_threshold: int = 3, cooldown: float = 30,
+                 connect_timeout: float = 10, read_timeout: float = 60) -> None:
+        self.url = url.rstrip("/")
+        self.name = name or self.url
+        self.model = model
+        self.api_key = api_key
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.timeout = (connect_timeout, read_timeout)
+        self._lock = threading.Lock()
+        self._recent_ttft = deque(maxlen=50)
+        self.ewma_ttft: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.in_flight = 0
+
+        self.requests = 0
+        self.errors = 0
+        self.wins = 0
+        self.cancelled = 0
+        self.ttft = LatencyHistogram()
+
+    # --- health and latency ---
+
+    def available(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def score(self) -> float:
+        """Expected seconds to first token, inflated by recent errors and current load."""
+        with self._lock:
+            ttft = self.ewma_ttft if self.ewma_ttft is not None else 1.0
+            return ttft * (1 + 4 * self.error_rate) * (1 + self.in_flight)
+
+    def hedge_delay(self, percentile: float, min_delay: float, max_delay: float) -> float:
+        with self._lock:
+            samples = sorted(self._recent_ttft)
+        if len(samples) < 5:
+            return max_delay
+        value = samples[min(len(samples) - 1, int(percentile * len(samples)))]
+        return min(max_delay, max(min_delay, value))
+
+    def _observe(self, ttft: Optional[float], error: bool) -> None:
+        with self._lock:
+            a = self.ewma_alpha
+            self.error_rate = (1 - a) * self.error_rate + a * (1.0 if error else 0.0)
+            if error:
+                self.errors += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.failure_threshold:
+                    self.down_until = time.monotonic() + self.cooldown
+                    print(f"LLM backend {self.name} failed {self.consecutive_failures} times, cooling down")
+                return
+            self.consecutive_failures = 0
+            if ttft is not None:
+                self._recent_ttft.append(ttft)
+                self.ewma_ttft = ttft if self.ewma_ttft is None else (1 - a) * self.ewma_ttft + a * ttft
+        if ttft is not None:
+            self.ttft.observe(ttft)
+
+    # --- transport ---
+
+    def _headers(self) -> Dict:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _request(self, path: str, payload: Dict) -> Tuple[str, Dict]:
+        """URL and JSON body for an Ollama-style request."""
+        if self.model:
+            payload = {**payload, "model": self.model}
+        return f"{self.url}{path}", {**payload, "stream": True}
+
+    def _pieces(self, response, chat: bool):
+        """Yield (text piece, chunk) from the streamed response; the last chunk is the final one."""
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            yield (chunk.get("message", {}).get("content", "") if chat else chunk.get("response", "")), chunk
+            if chunk.get("done"):
+                return
+
+    def stream(self, path: str, payload: Dict, on_piece: Callable[[str], None],
+               cancelled: Callable[[], bool]) -> Dict:
+        """Run one streamed generation, passing text pieces to on_piece. Returns the final chunk."""
+        url, body = self._request(path, payload)
+        chat = path == "/api/chat"
+        final = {}
+        with requests.post(url, json=body, headers=self._headers(), timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for piece, chunk in self._pieces(response, chat):
+                if cancelled():
+                    raise LLMAttemptCancelled()
+                final = chunk
+                if piece:
+                    on_piece(piece)
+        return final
+
+    def embed(self, payload: Dict) -> List:
+        """Run an Ollama /api/embed request and return its embeddings."""
+        response = requests.post(f"{self.url}/api/embed", json=payload, headers=self._headers(), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "ewma_ttft": None if self.ewma_ttft is None else round(self.ewma_ttft, 3),
+                "error_rate": round(self.error_rate, 3),
+                "in_flight": self.in_flight,
+                "down": time.monotonic() < self.down_until,
+                "requests": self.requests,
+                "errors": self.errors,
+                "wins": self.wins,
+                "cancelled": self.cancelled,
+                "ttft": self.ttft.snapshot(),
+            }
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """An OpenAI-compatible /v1/chat/completions server, fed Ollama-style requests."""
+
+    kind = "openai"
+    embeds = False
+
+    def _request(self, path: str, payload: Dict) -> Tuple[str, Dict]:
+        if path == "/api/chat":
+            messages = payload["messages"]
+        elif payload.get("images"):
+            content = [{"type": "text", "text": payload["prompt"]}]
+            content += [{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}}
+                        for image in payload["images"]]
+            messages = [{"role": "user", "content": content}]
+        else:
+            messages = [{"role": "user", "content": payload["prompt"]}]
+        options = payload.get("options", {})
+        body = {"model": self.model or payload["model"], "messages": messages, "stream": True}
+        for ours, theirs in (("temperature", "temperature"), ("top_p", "top_p"), ("num_predict", "max_tokens")):
+            if ours in options:
+                body[theirs] = options[ours]
+        url = self.url if self.url.endswith("/v1") else f"{self.url}/v1"
+        return f"{url}/chat/completions", body
+
+    def _pieces(self, response, chat: bool):
+        # Server-sent events: "data: {...}" lines ending with "data: [DONE]"
+        for line in response.iter_lines():
+            if not line or not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                # Marks the end like Ollama's final chunk, so a cut-off stream can be told apart
+                yield "", {"done": True}
+                return
+            chunk = json.loads(data)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            choices = chunk.get("choices") or [{}]
+            yield choices[0].get("delta", {}).get("content") or "", chunk
+
+
+class _Attempt:
+    def __init__(self, backend: LLMBackend, hedge: bool) -> None:
+        self.backend = backend
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.first_token: Optional[float] = None
+        self.pieces: List[str] = []
+        self.final: Dict = {}
+        self.error: Optional[Exception] = None
+        self.done = False
+        self.cancelled = False
+
+
+class _Race:
+    """The attempts for one request, and which of them won."""
+
+    def __init__(self, on_token, ticket) -> None:
+        self.on_token = on_token
+        self.ticket = ticket
+        self.cond = threading.Condition()
+        self.attempts: List[_Attempt] = []
+        self.winner: Optional[_Attempt] = None
+
+    def is_cancelled(self, attempt: _Attempt) -> bool:
+        return attempt.cancelled or (self.ticket is not None and self.ticket.cancelled)
+
+    def claim(self, attempt: _Attempt) -> bool:
+        """Make `attempt` the winner if nobody has won yet; True if it is the winner."""
+        with self.cond:
+            if self.winner is None:
+                self.winner = attempt
+                for other in self.attempts:
+                    if other is not attempt:
+                        other.cancelled = True
+                self.cond.notify_all()
+            return self.winner is attempt
+
+
+class LLMRouter:
+    def __init__(self, backends: List[LLMBackend], hedge_percentile: float = 0.9,
+                 min_hedge_delay: float = 1.0, max_hedge_delay: float = 8.0) -> None:
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = backends
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def ranked(self) -> List[LLMBackend]:
+        """Backends best first; ones cooling down go last rather than being dropped."""
+        now = time.monotonic()
+        return sorted(self.backends, key=lambda b: (not b.available(now), b.score()))
+
+    def generate(self, path: str, payload: Dict, on_token: Optional[Callable[[str], None]] = None,
+                 ticket=None) -> Tuple[str, Dict, LLMBackend]:
+        """Run an Ollama-style request on the best backend, hedging if it is slow.
+
+        Returns (text, final chunk, backend that answered). Raises the last
+        error if every backend failed, and LLMCancelled if the ticket is
+        cancelled before the answer is complete.
+        """
+        race = _Race(on_token, ticket)
+        queue = self.ranked()
+        last_error: Optional[Exception] = None
+
+        def launch(hedge: bool) -> None:
+            attempt = _Attempt(queue.pop(0), hedge)
+            with race.cond:
+                race.attempts.append(attempt)
+            threading.Thread(target=self._run, args=(race, attempt, path, payload),
+                             name=f"llm-{attempt.backend.name}", daemon=True).start()
+
+        launch(False)
+        hedge_at = time.monotonic() + race.attempts[0].backend.hedge_delay(
+            self.hedge_percentile, self.min_hedge_delay, self.max_hedge_delay)
+        with race.cond:
+            while True:
+                if race.winner is not None:
+                    if race.winner.done:
+                        break
+                    if ticket is not None and ticket.cancelled:
+                        race.winner.cancelled = True
+                        raise LLMCancelled("LLM request cancelled while the answer was streaming")
+                    race.cond.wait(0.5)
+                    continue
+                if ticket is not None and ticket.cancelled:
+                    for attempt in race.attempts:
+                        attempt.cancelled = True
+                    raise LLMCancelled("LLM request cancelled before any backend answered")
+                running = [a for a in race.attempts if not a.done]
+                failed = [a for a in race.attempts if a.done and a.error is not None]
+                if failed:
+                    last_error = failed[-1].error
+                if not running:
+                    if not queue:
+                        raise last_error or RuntimeError("no LLM backend answered")
+                    # Everything so far failed before answering: fail over immediately
+                    self.failovers += 1
+                    race.cond.release()
+                    try:
+                        launch(False)
+                    finally:
+                        race.cond.acquire()
+                    continue
+                now = time.monotonic()
+                if queue and now >= hedge_at:
+                    self.hedges += 1
+                    race.cond.release()
+                    try:
+                        launch(True)
+                    finally:
+                        race.cond.acquire()
+                    hedge_at = float("inf")  # one hedge per request; failures still fail over
+                    continue
+                race.cond.wait(min(0.5, max(0.0, hedge_at - now)) if queue else 0.5)
+
+        winner = race.winner
+        if winner.error is not None:
+            raise winner.error
+        if winner.hedge:
+            self.hedge_wins += 1
+        return "".join(winner.pieces), winner.final, winner.backend
+
+    def _run(self, race: _Race, attempt: _Attempt, path: str, payload: Dict) -> None:
+        backend = attempt.backend
+        with backend._lock:
+            backend.requests += 1
+            backend.in_flight += 1
+
+        def on_piece(piece: str) -> None:
+            if attempt.first_token is None:
+                attempt.first_token = time.monotonic()
+                if not race.claim(attempt):
+                    raise LLMAttemptCancelled()
+            attempt.pieces.append(piece)
+            if race.on_token is not None:
+                try:
+                    race.on_token(piece)
+                except Exception as e:
+                    print(f"Token callback failed: {e}")
+
+        try:
+            attempt.final = backend.stream(path, payload, on_piece, lambda: race.is_cancelled(attempt))
+            if attempt.first_token is None:
+                # An empty answer still counts as an answer
+                attempt.first_token = time.monotonic()
+                race.claim(attempt)
+            backend._observe(attempt.first_token - attempt.started, error=False)
+            if race.winner is attempt:
+                with backend._lock:
+                    backend.wins += 1
+        except LLMAttemptCancelled:
+            with backend._lock:
+                backend.cancelled += 1
+            if race.winner is attempt:
+                # The request itself was cancelled mid-answer; the text so far is not an answer
+                attempt.error = LLMCancelled("LLM request cancelled while the answer was streaming")
+        except Exception as e:
+            attempt.error = e
+            # Losing the race is not the backend's fault; failing before or after answering is
+            backend._observe(None, error=True)
+            print(f"LLM backend {backend.name} failed: {e}")
+        finally:
+            with backend._lock:
+                backend.in_flight -= 1
+            with race.cond:
+                attempt.done = True
+                race.cond.notify_all()
+
+    def embed(self, payload: Dict) -> List:
+        """Run an Ollama-style /api/embed request on the best backend that can embed, failing over on errors.
+
+        Raises LLMUnavailable if no such backend is available, and the last
+        error if every one of them failed.
+        """
+        now = time.monotonic()
+        backends = [b for b in self.ranked() if b.embeds and b.available(now)]
+        if not backends:
+            raise LLMUnavailable("no LLM backend available for embeddings")
+        last_error: Optional[Exception] = None
+        for backend in backends:
+            with backend._lock:
+                backend.requests += 1
+            try:
+                embeddings = backend.embed(payload)
+            except Exception as e:
+                last_error = e
+                backend._observe(None, error=True)
+                print(f"LLM backend {backend.name} failed to embed: {e}")
+                continue
+            backend._observe(None, error=False)
+            return embeddings
+        raise last_error
+
+    def stats(self) -> Dict:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "backends": {backend.name: backend.stats() for backend in self.backends},
+        }
+
+
+def parse_backends(spec: str, openai_model: str = "", openai_api_key: str = "") -> List[LLMBackend]:
+    """Backends from a comma-separated list of URLs; an "openai+" prefix marks an OpenAI-compatible server.
+
+    "http://gpu-box:11434, openai+http://localhost:8080" -> Ollama and OpenAI-compatible backends.
+    """
+    backends = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        if entry.startswith("openai+"):
+            backends.append(OpenAICompatibleBackend(entry[len("openai+"):], model=openai_model, api_key=openai_api_key))
+        else:
+            backends.append(LLMBackend(entry))
+    return backends
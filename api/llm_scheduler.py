@@ -0,0 +1,210 @@
+"""
+LLMScheduler limits how many Ollama generations run at once.
+
+Ollama on a small box serves about one generation at a time; firing every
+request at it concurrently just makes them all slow and time out
+together. Callers instead take a slot:
+
+    with get_llm_scheduler().slot(LLM_PRIORITY_INTERACTIVE, deadline=60) as ticket:
+        ... call Ollama, stop early if ticket.cancelled ...
+
+Waiting requests are served by priority lane (disaster advice for fresh
+quakes before chat, chat before background summaries), FIFO within a
+lane. A request still queued when its deadline passes is dropped
+unstarted with LLMDeadlineExceeded. Tickets can be cancelled: a queued one
+leaves the queue, a running one sees `cancelled` and should stop reading.
+Tickets are tagged with the owner set by owned_by(), so all LLM work
+started on behalf of e.g. a timed-out command can be cancelled at once.
+
+Queue wait is measured per lane, and the time Ollama reports for prompt
+evaluation and generation (prompt_eval_duration / eval_duration) is
+recorded from each response.
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from .config import LLM_MAX_IN_FLIGHT, LLM_MAX_QUEUED
+from .metrics import LatencyHistogram
+
+LLM_PRIORITY_ALERT = 0
+LLM_PRIORITY_INTERACTIVE = 1
+LLM_PRIORITY_BACKGROUND = 2
+LLM_PRIORITY_NAMES = {LLM_PRIORITY_ALERT: "alert", LLM_PRIORITY_INTERACTIVE: "interactive",
+                      LLM_PRIORITY_BACKGROUND: "background"}
+
+
+class LLMUnavailable(Exception):
+    """The request was not run; the caller should answer with a fallback."""
+
+
+class LLMQueueFull(LLMUnavailable):
+    pass
+
+
+class LLMDeadlineExceeded(LLMUnavailable):
+    pass
+
+
+class LLMCancelled(LLMUnavailable):
+    pass
+
+
+class LLMTicket:
+    __slots__ = ("scheduler", "priority", "deadline", "owner", "enqueued_at", "started_at", "cancelled")
+
+    def __init__(self, scheduler, priority: int, deadline: Optional[float], owner) -> None:
+        self.scheduler = scheduler
+        self.priority = priority
+        self.deadline = deadline
+        self.owner = owner
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.scheduler.cancel(self)
+
+
+class LLMScheduler:
+    def __init__(self, max_in_flight: int = 1, max_queued: int = 100) -> None:
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queued = max_queued
+        self._cond = threading.Condition()
+        self._queue: List = []  # heap of (priority, seq, ticket)
+        self._seq = itertools.count()
+        self._running: List[LLMTicket] = []
+        self._local = threading.local()
+
+        self.queue_wait = {p: LatencyHistogram() for p in LLM_PRIORITY_NAMES}
+        self.prompt_eval = LatencyHistogram()
+        self.eval = LatencyHistogram()
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.cancelled = 0
+        self.eval_tokens = 0
+        self.eval_seconds = 0.0
+
+    @contextmanager
+    def owned_by(self, owner):
+        """Tag tickets taken by this thread inside the block with `owner`."""
+        previous = getattr(self._local, "owner", None)
+        self._local.owner = owner
+        try:
+            yield
+        finally:
+            self._local.owner = previous
+
+    @contextmanager
+    def slot(self, priority: int = LLM_PRIORITY_INTERACTIVE, deadline: Optional[float] = None):
+        """Wait for a generation slot; `deadline` is the most seconds to wait for it."""
+        ticket = self.acquire(priority, deadline)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def acquire(self, priority: int = LLM_PRIORITY_INTERACTIVE, deadline: Optional[float] = None) -> LLMTicket:
+        ticket = LLMTicket(self, priority, None if deadline is None else time.monotonic() + deadline,
+                           getattr(self._local, "owner", None))
+        with self._cond:
+            if len(self._queue) >= self.max_queued:
+                self.rejected += 1
+                raise LLMQueueFull(f"{len(self._queue)} LLM requests already queued")
+            heapq.heappush(self._queue, (priority, next(self._seq), ticket))
+            while True:
+                if ticket.cancelled:
+                    self._remove(ticket)
+                    raise LLMCancelled("LLM request cancelled before it started")
+                if self._queue[0][2] is ticket and len(self._running) < self.max_in_flight:
+                    heapq.heappop(self._queue)
+                    break
+                remaining = None if ticket.deadline is None else ticket.deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._remove(ticket)
+                    self.expired += 1
+                    raise LLMDeadlineExceeded("LLM request waited past its deadline")
+                self._cond.wait(remaining)
+            ticket.started_at = time.monotonic()
+            self._running.append(ticket)
+            # The next ticket in line may be able to start as well
+            self._cond.notify_all()
+        self.queue_wait[priority].observe(ticket.started_at - ticket.enqueued_at)
+        return ticket
+
+    def _remove(self, ticket: LLMTicket) -> None:
+        self._queue = [entry for entry in self._queue if entry[2] is not ticket]
+        heapq.heapify(self._queue)
+        self._cond.notify_all()
+
+    def release(self, ticket: LLMTicket) -> None:
+        with self._cond:
+            if ticket in self._running:
+                self._running.remove(ticket)
+            self._cond.notify_all()
+
+    def cancel(self, ticket: LLMTicket) -> None:
+        with self._cond:
+            if not ticket.cancelled:
+                ticket.cancelled = True
+                self.cancelled += 1
+            self._cond.notify_all()
+
+    def cancel_owner(self, owner) -> int:
+        """Cancel every queued or running ticket tagged with `owner`."""
+        with self._cond:
+            tickets = [entry[2] for entry in self._queue] + self._running
+            victims = [t for t in tickets if t.owner is owner and not t.cancelled]
+            for ticket in victims:
+                ticket.cancelled = True
+            self.cancelled += len(victims)
+            self._cond.notify_all()
+        return len(victims)
+
+    def record(self, result: Dict) -> None:
+        """Record the timings Ollama reports in a final response (durations are in ns)."""
+        if "eval_duration" not in result:
+            return
+        self.completed += 1
+        self.prompt_eval.observe(result.get("prompt_eval_duration", 0) / 1e9)
+        self.eval.observe(result["eval_duration"] / 1e9)
+        self.eval_tokens += result.get("eval_count", 0)
+        self.eval_seconds += result["eval_duration"] / 1e9
+
+    def stats(self) -> Dict:
+        with self._cond:
+            depth = {name: 0 for name in LLM_PRIORITY_NAMES.values()}
+            for priority, _, _ in self._queue:
+                depth[LLM_PRIORITY_NAMES[priority]] += 1
+            running = len(self._running)
+        return {
+            "max_in_flight": self.max_in_flight,
+            "running": running,
+            "queue_depth": depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "cancelled": self.cancelled,
+            "queue_wait": {LLM_PRIORITY_NAMES[p]: h.snapshot() for p, h in self.queue_wait.items()},
+            "prompt_eval": self.prompt_eval.snapshot(),
+            "eval": self.eval.snapshot(),
+            "tokens_per_second": round(self.eval_tokens / self.eval_seconds, 1) if self.eval_seconds else None,
+        }
+
+
+_llm_scheduler: Optional[LLMScheduler] = None
+_llm_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Return the process-wide shared LLMScheduler."""
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        with _llm_scheduler_lock:
+            if _llm_scheduler is None:
+                _llm_scheduler = LLMScheduler(LLM_MAX_IN_FLIGHT, LLM_MAX_QUEUED)
+    return _llm_scheduler
@@ -0,0 +1,148 @@
+"""
+Long-lived gradio clients for the earthquake search Space.
+
+Building gradio_client.Client(src) downloads the Space config and opens
+new connections, which cost seconds before every predict. GradioClientPool
+keeps up to `size` clients and lends each to one thread at a time. A
+client that has been idle for a while is health-checked (a cheap GET of
+the Space config) before it is handed out, and a client whose call failed
+is dropped, so the next call reconnects with a fresh one.
+
+QueryCache remembers search results by the normalized query tuple. Results
+for ranges that end in the past cannot change and are kept long; ranges
+that include today get a short TTL.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+from cachetools import TLRUCache
+
+
+class _PooledClient:
+    __slots__ = ("client", "last_used")
+
+    def __init__(self, client) -> None:
+        self.client = client
+        self.last_used = time.monotonic()
+
+
+class GradioClientPool:
+    def __init__(self, factory: Callable[[], object], size: int = 2, health_interval: float = 60,
+                 acquire_timeout: float = 30) -> None:
+        self.factory = factory
+        self.size = max(1, size)
+        self.health_interval = health_interval
+        self.acquire_timeout = acquire_timeout
+        self._idle: List[_PooledClient] = []
+        self._created = 0
+        self._cond = threading.Condition()
+
+        self.connects = 0
+        self.reuses = 0
+        self.discarded = 0
+
+    @contextmanager
+    def client(self):
+        """Borrow a client; it is returned to the pool unless the block raises."""
+        pooled = self._acquire()
+        try:
+            yield pooled.client
+        except Exception:
+            self._discard()
+            raise
+        else:
+            pooled.last_used = time.monotonic()
+            with self._cond:
+                self._idle.append(pooled)
+                self._cond.notify()
+
+    def _acquire(self) -> _PooledClient:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._created >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("no gradio client became free")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    pooled = self._idle.pop()  # most recently used, the likeliest to be healthy
+                else:
+                    self._created += 1
+                    pooled = None
+            if pooled is None:
+                try:
+                    pooled = _PooledClient(self.factory())
+                except Exception:
+                    self._discard()
+                    raise
+                self.connects += 1
+                return pooled
+            if time.monotonic() - pooled.last_used < self.health_interval or self._healthy(pooled.client):
+                self.reuses += 1
+                return pooled
+            print("--- Dropping unhealthy gradio client, reconnecting ---")
+            self._discard()
+
+    @staticmethod
+    def _healthy(client) -> bool:
+        src = getattr(client, "src", "")
+        if not src:
+            return True
+        try:
+            return requests.get(f"{src.rstrip('/')}/config", timeout=5).ok
+        except requests.exceptions.RequestException:
+            return False
+
+    def _discard(self) -> None:
+        with self._cond:
+            self._created -= 1
+            self.discarded += 1
+            self._cond.notify()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "idle": len(self._idle),
+                "connects": self.connects,
+                "reuses": self.reuses,
+                "discarded": self.discarded,
+            }
+
+
+class QueryCache:
+    def __init__(self, maxsize: int = 128, ttl: float = 6 * 3600, recent_ttl: float = 300) -> None:
+        self.ttl = ttl
+        self.recent_ttl = recent_ttl
+        self._cache = TLRUCache(maxsize=maxsize, ttu=self._ttu, timer=time.monotonic)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _ttu(self, key: Tuple, value, now: float) -> float:
+        # key[1] is the end date; a range reaching today can still gain events
+        end_date = key[1]
+        return now + (self.recent_ttl if end_date >= date.today().isoformat() else self.ttl)
+
+    def get(self, key: Tuple) -> Optional[str]:
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key: Tuple, value: str) -> None:
+        with self._lock:
+            self._cache[key] = value
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,58 @@
+"""
+Small thread-safe latency histogram used by the services to report
+per-method / per-command timings on the /metrics endpoint.
+"""
+import bisect
+import math
+import threading
+from typing import Dict, Sequence
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (0 < q <= 1)."""
+        with self._lock:
+            return self._percentile(q)
+
+    def _percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        target = math.ceil(q * self.count)
+        seen = 0
+        for i, n in enumerate(self._counts):
+            seen += n
+            if seen >= target:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "count": self.count,
+                "avg": round(self.sum / self.count, 4) if self.count else 0.0,
+                "max": round(self.max, 4),
+                "p50": self._percentile(0.5),
+                "p95": self._percentile(0.95),
+                "p99": self._percentile(0.99),
+            }
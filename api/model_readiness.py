@@ -0,0 +1,192 @@
+"""
+ModelReadiness gets the Ollama models ready in the background, so no user
+request has to wait for a model download or a cold model load.
+
+For each model a background thread checks /api/tags, pulls the model if it
+is missing (following the streamed progress), and warms it with a one
+token generate (an embedding for embedding models) carrying `keep_alive`
+so Ollama keeps it loaded. Models that fail are retried after a delay, and
+ready models are re-checked periodically in case the Ollama server was
+restarted or wiped.
+
+Callers ask is_ready(model) and answer with a fast fallback while it is
+False. That is only once the check has found the model missing (it is
+being pulled) or failing: before the first check finishes the model is
+assumed ready, so a cold start with the models already pulled answers at
+once. is_loaded(model) is the strict version, for work that can wait;
+status() reports each model's state and pull progress.
+"""
+import json
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+import requests
+
+STATE_UNKNOWN = "unknown"
+STATE_PULLING = "pulling"
+STATE_WARMING = "warming"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+def _full_name(model: str) -> str:
+    """/api/tags lists untagged models as <name>:latest."""
+    return model if ":" in model else f"{model}:latest"
+
+
+class _ModelStatus:
+    def __init__(self) -> None:
+        self.state = STATE_UNKNOWN
+        self.progress: Optional[float] = None
+        self.error = ""
+        self.since = time.time()
+
+    def set(self, state: str, error: str = "") -> None:
+        self.state = state
+        self.error = error
+        self.since = time.time()
+
+    def snapshot(self) -> Dict:
+        return {
+            "state": self.state,
+            "progress": None if self.progress is None else round(self.progress, 3),
+            "error": self.error,
+            "since": round(self.since, 1),
+        }
+
+
+class ModelReadiness:
+    def __init__(
+        self,
+        base_url: str,
+        models: Iterable[str],
+        keep_alive: str = "30m",
+        pull_timeout: float = 120,
+        retry_interval: float = 30,
+        recheck_interval: float = 600,
+        enabled: bool = True,
+        embedding_models: Iterable[str] = (),
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.embedding_models = set(embedding_models)
+        self.models = list(dict.fromkeys([*models, *self.embedding_models]))
+        self.keep_alive = keep_alive
+        self.pull_timeout = pull_timeout
+        self.retry_interval = retry_interval
+        self.recheck_interval = recheck_interval
+        self.enabled = enabled
+        self._status = {model: _ModelStatus() for model in self.models}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ModelReadiness":
+        with self._lock:
+            if self.enabled and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ollama-readiness", daemon=True)
+                self._thread.start()
+        return self
+
+    def is_ready(self, model: str) -> bool:
+        """True unless the check found `model` being pulled or failing. Unmanaged models are assumed ready."""
+        if not self.enabled or model not in self._status:
+            return True
+        self.start()
+        return self._status[model].state not in (STATE_PULLING, STATE_FAILED)
+
+    def is_loaded(self, model: str) -> bool:
+        """True once `model` is confirmed pulled and warmed."""
+        if not self.enabled or model not in self._status:
+            return True
+        self.start()
+        return self._status[model].state == STATE_READY
+
+    def describe(self, model: str) -> str:
+        """Short human-readable state, e.g. "pulling 42%"."""
+        status = self._status.get(model)
+        if status is None:
+            return STATE_READY
+        if status.state == STATE_PULLING and status.progress is not None:
+            return f"{STATE_PULLING} {status.progress:.0%}"
+        return status.state
+
+    def _run(self) -> None:
+        while True:
+            try:
+                installed = self._installed_models()
+            except Exception as e:
+                print(f"Ollama readiness: cannot list models: {e}")
+                for status in self._status.values():
+                    status.set(STATE_FAILED, str(e))
+                time.sleep(self.retry_interval)
+                continue
+            for model in self.models:
+                status = self._status[model]
+                if status.state == STATE_READY and _full_name(model) in installed:
+                    continue
+                try:
+                    if _full_name(model) not in installed:
+                        self._pull(model, status)
+                    status.set(STATE_WARMING)
+                    self._warm(model)
+                    status.progress = None
+                    status.set(STATE_READY)
+                    print(f"Ollama readiness: {model} is ready")
+                except Exception as e:
+                    print(f"Ollama readiness: {model} failed: {e}")
+                    status.set(STATE_FAILED, str(e))
+            failed = any(s.state != STATE_READY for s in self._status.values())
+            time.sleep(self.retry_interval if failed else self.recheck_interval)
+
+    def _installed_models(self) -> set:
+        response = requests.get(f"{self.base_url}/api/tags", timeout=10)
+        response.raise_for_status()
+        return {_full_name(m.get("name") or m.get("model", "")) for m in response.json().get("models", [])}
+
+    def _pull(self, model: str, status: _ModelStatus) -> None:
+        status.set(STATE_PULLING)
+        status.progress = 0.0
+        print(f"--- Pulling Ollama model {model} ---")
+        # The read timeout applies between progress lines, so long downloads are fine
+        with requests.post(f"{self.base_url}/api/pull", json={"model": model, "stream": True},
+                           timeout=(10, self.pull_timeout), stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("error"):
+                    raise RuntimeError(event["error"])
+                if event.get("total"):
+                    status.progress = event.get("completed", 0) / event["total"]
+                if event.get("status") == "success":
+                    return
+        raise RuntimeError("pull stream ended without success")
+
+    def _warm(self, model: str) -> None:
+        """Load the model into memory with a one token generate (or a one word embedding)."""
+        if model in self.embedding_models:
+            response = requests.post(
+                f"{self.base_url}/api/embed",
+                json={"model": model, "input": "hi", "keep_alive": self.keep_alive},
+                timeout=self.pull_timeout,
+            )
+            response.raise_for_status()
+            return
+        response = requests.post(
+            f"{self.base_url}/api/generate",
+            json={"model": model, "prompt": "hi", "stream": False, "keep_alive": self.keep_alive,
+                  "options": {"num_predict": 1}},
+            timeout=self.pull_timeout,
+        )
+        response.raise_for_status()
+
+    def ready(self) -> bool:
+        return all(self.is_loaded(model) for model in self.models)
+
+    def status(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready(),
+            "models": {model: status.snapshot() for model, status in self._status.items()},
+        }
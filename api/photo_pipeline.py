@@ -0,0 +1,121 @@
+"""
+Photo ingestion for image questions.
+
+Telegram sends every photo in several sizes. The pipeline picks the
+smallest size whose longer side still covers the vision model's input
+resolution (bigger ones are downscaled to that anyway), resolves its
+file_id to a file_path once (getFile answers are memoized; Telegram keeps
+a file_path valid for at least an hour), streams the download through the
+shared Telegram session with a byte cap, and decodes, orients and
+downscales it with Pillow in a small worker pool so large images never
+reach the model and a burst of photos cannot take every CPU.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, List
+
+from cachetools import TTLCache
+
+from .config import (BOT_TOKEN, TELEGRAM_API_BASE, VISION_IMAGE_SIDE, PHOTO_MAX_BYTES, PHOTO_DECODE_WORKERS,
+                     FILE_PATH_CACHE_TTL)
+from .telegram_client import get_client
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+class PhotoTooLarge(Exception):
+    pass
+
+
+def pick_photo_size(sizes: List[Dict], target_side: int = VISION_IMAGE_SIDE) -> Dict:
+    """The smallest PhotoSize whose longer side is at least target_side, else the largest one."""
+    by_area = sorted(sizes, key=lambda s: s.get("width", 0) * s.get("height", 0))
+    for size in by_area:
+        if max(size.get("width", 0), size.get("height", 0)) >= target_side:
+            return size
+    return by_area[-1]
+
+
+class FileResolver:
+    """Memoized getFile: file_id -> file_path."""
+
+    def __init__(self, ttl: float = FILE_PATH_CACHE_TTL, maxsize: int = 1024) -> None:
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def file_path(self, file_id: str) -> str:
+        with self._lock:
+            path = self._cache.get(file_id)
+            if path is not None:
+                self.hits += 1
+                return path
+            self.misses += 1
+        response = get_client().call("getFile", data={"file_id": file_id})
+        path = response.json().get("result", {}).get("file_path")
+        if not path:
+            raise RuntimeError(f"getFile returned no file_path: {response.text[:200]}")
+        with self._lock:
+            self._cache[file_id] = path
+        return path
+
+    def url(self, file_id: str) -> str:
+        return f"{TELEGRAM_API_BASE}/file/bot{BOT_TOKEN}/{self.file_path(file_id)}"
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+file_resolver = FileResolver()
+
+_decode_pool = ThreadPoolExecutor(max_workers=PHOTO_DECODE_WORKERS, thread_name_prefix="photo-decode")
+
+
+def download(url: str, max_bytes: int = PHOTO_MAX_BYTES) -> bytes:
+    """Stream a file, giving up as soon as it exceeds max_bytes."""
+    with get_client().session.get(url, stream=True, timeout=(5, 30)) as response:
+        response.raise_for_status()
+        length = response.headers.get("Content-Length")
+        if length and int(length) > max_bytes:
+            raise PhotoTooLarge(f"{length} bytes")
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                raise PhotoTooLarge(f"more than {max_bytes} bytes")
+    return bytes(buffer)
+
+
+def _downscale(data: bytes, max_side: int) -> bytes:
+    image = Image.open(BytesIO(data))
+    # JPEG can decode at 1/2, 1/4 or 1/8 scale directly, which is much cheaper than resizing afterwards
+    scale = max_side / max(image.size)
+    if scale < 1:
+        image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    image.thumbnail((max_side, max_side), reducing_gap=2.0)
+    out = BytesIO()
+    image.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def prepare_image(data: bytes, max_side: int = VISION_IMAGE_SIDE, timeout: float = 30) -> bytes:
+    """JPEG bytes no larger than max_side on either side (the input unchanged without Pillow)."""
+    if not PIL_AVAILABLE:
+        return data
+    return _decode_pool.submit(_downscale, data, max_side).result(timeout)
+
+
+def fetch_photo(sizes: List[Dict], max_side: int = VISION_IMAGE_SIDE) -> bytes:
+    """Pick, download and downscale the right size of a Telegram photo."""
+    size = pick_photo_size(sizes, max_side)
+    if size.get("file_size") and size["file_size"] > PHOTO_MAX_BYTES:
+        raise PhotoTooLarge(f"{size['file_size']} bytes")
+    return prepare_image(download(file_resolver.url(size["file_id"])), max_side)
@@ -0,0 +1,154 @@
+"""
+Long-polling entry point for deployments that cannot receive the webhook.
+
+    python -m api.poller [--delete-webhook] [--workers N] [--queue-size N]
+
+The UpdatePoller long-polls getUpdates, fetching up to 100 updates per
+call, and feeds them into the same handle_message pipeline the webhook
+uses through an UpdateDispatcher, so chats are still handled in parallel
+and each chat in order. The offset only advances past an update once it
+has been queued; when the dispatcher is full the poller waits instead of
+dropping updates.
+"""
+import argparse
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from .config import (BOT_TOKEN, TELEGRAM_API_BASE, POLL_TIMEOUT, POLL_BATCH_SIZE,
+                     DISPATCH_WORKERS, DISPATCH_QUEUE_SIZE, SIGNIFICANT_POLL_INTERVAL,
+                     CWA_ALARM_POLL_INTERVAL)
+from .dispatcher import UpdateDispatcher
+from .telegram_client import TelegramClient
+
+logger = logging.getLogger(__name__)
+
+
+class UpdatePoller:
+    def __init__(
+        self,
+        dispatcher: UpdateDispatcher,
+        api_base: str = TELEGRAM_API_BASE,
+        token: Optional[str] = BOT_TOKEN,
+        batch_size: int = POLL_BATCH_SIZE,
+        poll_timeout: int = POLL_TIMEOUT,
+        allowed_updates: Optional[List[str]] = None,
+    ) -> None:
+        self.dispatcher = dispatcher
+        self.api_base = api_base.rstrip("/")
+        self.batch_size = max(1, min(100, batch_size))
+        self.poll_timeout = poll_timeout
+        self.allowed_updates = allowed_updates if allowed_updates is not None else ["message"]
+        self.offset: Optional[int] = None
+        # Retries are handled by the polling loop's own backoff
+        self.client = TelegramClient(token=token, api_base=api_base, pool_size=1, max_retries=0)
+
+        self.polls = 0
+        self.updates_received = 0
+        self.errors = 0
+
+    def delete_webhook(self) -> None:
+        """getUpdates is refused while a webhook is set, so remove it first."""
+        r = self.client.call("deleteWebhook")
+        r.raise_for_status()
+        logger.info("Webhook deleted, switching to long polling")
+
+    def fetch_updates(self) -> List[Dict]:
+        params = {
+            "timeout": self.poll_timeout,
+            "limit": self.batch_size,
+            "allowed_updates": self.allowed_updates,
+        }
+        if self.offset is not None:
+            params["offset"] = self.offset
+        # The HTTP timeout has to outlast the long-poll timeout
+        r = self.client.call("getUpdates", json=params, timeout=(5, self.poll_timeout + 10))
+        r.raise_for_status()
+        payload = r.json()
+        if not payload.get("ok"):
+            raise RuntimeError(f"getUpdates failed: {payload.get('description')}")
+        self.polls += 1
+        return payload.get("result", [])
+
+    def poll_once(self, stop_event: Optional[threading.Event] = None) -> int:
+        """Fetch one batch and queue it. Returns the number of updates queued."""
+        updates = self.fetch_updates()
+        for update in updates:
+            # Backpressure: wait for room rather than skipping the update
+            while not self.dispatcher.submit(update):
+                if stop_event is not None and stop_event.is_set():
+                    return 0
+                time.sleep(0.1)
+            self.offset = update["update_id"] + 1
+            self.updates_received += 1
+        return len(updates)
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> None:
+        stop_event = stop_event or threading.Event()
+        backoff = 1.0
+        logger.info(f"Long polling {self.api_base} (batch {self.batch_size}, timeout {self.poll_timeout}s)")
+        while not stop_event.is_set():
+            try:
+                self.poll_once(stop_event)
+                backoff = 1.0
+            except requests.exceptions.HTTPError as e:
+                self.errors += 1
+                if e.response is not None and e.response.status_code == 409:
+                    logger.error("getUpdates conflict: a webhook is set or another poller is running (use --delete-webhook)")
+                else:
+                    logger.warning(f"getUpdates failed: {e}")
+                stop_event.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"getUpdates failed: {e}")
+                stop_event.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def stats(self) -> Dict:
+        return {
+            "offset": self.offset,
+            "polls": self.polls,
+            "updates_received": self.updates_received,
+            "errors": self.errors,
+        }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the bot with getUpdates long polling instead of a webhook.")
+    parser.add_argument("--delete-webhook", action="store_true", help="remove the configured webhook before polling")
+    parser.add_argument("--workers", type=int, default=DISPATCH_WORKERS, help="update worker threads")
+    parser.add_argument("--queue-size", type=int, default=DISPATCH_QUEUE_SIZE, help="maximum pending updates")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if not BOT_TOKEN:
+        parser.error("BOT_TOKEN is not set")
+
+    # Imported here so `--help` works without the full service stack
+    from .handle import handle_message
+    try:
+        from .ai_service import model_readiness, start_retrieval
+        from .cwa_service import start_significant_watch, start_alarm_watch
+        model_readiness.start()
+        start_significant_watch(SIGNIFICANT_POLL_INTERVAL)
+        start_alarm_watch(CWA_ALARM_POLL_INTERVAL)
+        start_retrieval()
+    except ImportError as e:
+        logger.warning(f"AI service unavailable: {e}")
+
+    dispatcher = UpdateDispatcher(handle_message, workers=args.workers, max_pending=args.queue_size)
+    poller = UpdatePoller(dispatcher)
+    if args.delete_webhook:
+        poller.delete_webhook()
+    try:
+        poller.run()
+    except KeyboardInterrupt:
+        logger.info(f"Stopped: {poller.stats()} {dispatcher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
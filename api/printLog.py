@@ -1,30 +1,145 @@
-import requests
+"""
+Admin logging. send_log() and send_image_log() only append to an in-memory
+buffer and return, so logging never delays the reply to the user.
+
+A background LogShipper flushes the buffer every LOG_FLUSH_INTERVAL
+seconds: text entries are coalesced into digest messages of at most 4096
+characters and sent to the admin chat at log priority (debug mode only),
+and every entry can also be appended to a local JSONL file (LOG_FILE).
+The buffer is bounded; when it is full the oldest entries are dropped.
+"""
+import atexit
+import json
+import threading
+import time
+from collections import deque
+
 from md2tgmd import escape
 
-from .config import IS_DEBUG_MODE, ADMIN_ID, BOT_TOKEN
+from .config import IS_DEBUG_MODE, ADMIN_ID, LOG_FILE, LOG_FLUSH_INTERVAL, LOG_BUFFER_SIZE
+from .send_scheduler import PRIORITY_LOG, MAX_MESSAGE_LENGTH, get_scheduler
 
 admin_id = ADMIN_ID
 is_debug_mode =IS_DEBUG_MODE
 
-TELEGRAM_API = f"https://api.telegram.org/bot{BOT_TOKEN}"
 
-def send_log(text):
-    if is_debug_mode == "1":
-            payload = {
-            "chat_id": admin_id,
-            "text": escape(text),
-            "parse_mode": "MarkdownV2",
+class LogShipper:
+    def __init__(self, to_telegram: bool, log_file: str = "", flush_interval: float = 2.0, buffer_size: int = 1000) -> None:
+        self.to_telegram = to_telegram
+        self.log_file = log_file
+        self.flush_interval = flush_interval
+        self._buffer = deque(maxlen=max(1, buffer_size))
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+        self.dropped = 0
+        self.shipped = 0
+        self.digests = 0
+
+    def enabled(self) -> bool:
+        return self.to_telegram or bool(self.log_file)
+
+    def add(self, kind: str, text: str, image_id: str = "") -> None:
+        """Buffer an entry. Never blocks on I/O."""
+        entry = {"ts": time.time(), "kind": kind, "text": text}
+        if image_id:
+            entry["image_id"] = image_id
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Log shipper flush failed: {e}")
+
+    def flush(self) -> None:
+        with self._lock:
+            entries = list(self._buffer)
+            self._buffer.clear()
+        if not entries:
+            return
+        # Serialise flushes so digests keep their order
+        with self._flush_lock:
+            if self.log_file:
+                self._write_file(entries)
+            if self.to_telegram:
+                self._ship(entries)
+            self.shipped += len(entries)
+
+    def _write_file(self, entries) -> None:
+        with open(self.log_file, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+    def _ship(self, entries) -> None:
+        scheduler = get_scheduler()
+        digest = []
+        size = 0
+        for entry in entries:
+            if entry["kind"] == "photo":
+                payload = {
+                    "chat_id": admin_id,
+                    "caption": escape(entry["text"]),
+                    "parse_mode": "MarkdownV2",
+                    "photo": entry["image_id"],
+                }
+                scheduler.submit("sendPhoto", admin_id, payload, priority=PRIORITY_LOG)
+                continue
+            text = escape(entry["text"])
+            if len(text) > MAX_MESSAGE_LENGTH:
+                # Cutting MarkdownV2 could leave an entity open, send it as plain text
+                payload = {"chat_id": admin_id, "text": entry["text"][:MAX_MESSAGE_LENGTH]}
+                scheduler.submit("sendMessage", admin_id, payload, priority=PRIORITY_LOG)
+                self.digests += 1
+                continue
+            if digest and size + 2 + len(text) > MAX_MESSAGE_LENGTH:
+                self._send_digest(digest)
+                digest, size = [], 0
+            size += len(text) + (2 if digest else 0)
+            digest.append(text)
+        if digest:
+            self._send_digest(digest)
+
+    def _send_digest(self, parts) -> None:
+        payload = {"chat_id": admin_id, "text": "\n\n".join(parts), "parse_mode": "MarkdownV2"}
+        get_scheduler().submit("sendMessage", admin_id, payload, priority=PRIORITY_LOG)
+        self.digests += 1
+
+    def stats(self):
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            "enabled": self.enabled(),
+            "buffered": buffered,
+            "dropped": self.dropped,
+            "shipped": self.shipped,
+            "digests": self.digests,
         }
-            requests.post(f"{TELEGRAM_API}/sendMessage", data=payload)
 
 
-def send_image_log(text,imageID):
-    if is_debug_mode == "1":
-        payload = {
-        "chat_id": admin_id,
-        "caption": escape(text),
-        "parse_mode": "MarkdownV2",
-        "photo": imageID
-    }
-        requests.post(f"{TELEGRAM_API}/sendPhoto", data=payload)
+shipper = LogShipper(
+    to_telegram=is_debug_mode == "1",
+    log_file=LOG_FILE,
+    flush_interval=LOG_FLUSH_INTERVAL,
+    buffer_size=LOG_BUFFER_SIZE,
+)
+atexit.register(shipper.flush)
+
 
+def send_log(text):
+    if shipper.enabled():
+        shipper.add("text", text)
+
+
+def send_image_log(text,imageID):
+    if shipper.enabled():
+        shipper.add("photo", text, imageID)
@@ -0,0 +1,215 @@
+"""
+Token buckets used to pace outbound Telegram traffic and to ration
+expensive commands per user.
+
+A bucket holds up to `capacity` tokens and refills at `rate` tokens per
+second; taking a token either succeeds immediately or reports how long
+the caller has to wait. Buckets are not locked themselves, the owner
+(e.g. the SendScheduler or QuotaLimiter) serialises access.
+
+QuotaLimiter keeps one bucket per (user, cost class): cheap commands are
+unlimited while LLM calls and map rendering get small budgets. Buckets
+live in memory, or in a shared SQLite/Redis backend for multi-replica
+setups.
+"""
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .config import RATE_LIMIT_NETWORK, RATE_LIMIT_LLM, RATE_LIMIT_RENDER, RATE_LIMIT_BACKEND
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, now: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: Optional[float] = None, tokens: float = 1.0) -> float:
+        """Seconds until `tokens` can be taken (0 if they can be taken now)."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= tokens:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (tokens - self.tokens) / self.rate
+
+    def consume(self, now: Optional[float] = None, tokens: float = 1.0) -> float:
+        """Take `tokens` if available. Returns 0 on success, else the wait in seconds."""
+        wait = self.wait_time(now, tokens)
+        if wait == 0.0:
+            self.tokens -= tokens
+        return wait
+
+    def is_full(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class SQLiteQuotaBackend:
+    """Token buckets kept in a SQLite file so several workers share quotas."""
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS quota_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def consume(self, key: str, rate: float, capacity: float) -> float:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM quota_buckets WHERE key = ?", (key,)).fetchone()
+                bucket = TokenBucket(rate, capacity, now)
+                if row is not None:
+                    bucket.tokens, bucket.updated = row
+                wait = bucket.consume(now)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO quota_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                    (key, bucket.tokens, bucket.updated),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+
+class RedisQuotaBackend:
+    """Token buckets kept in Redis, updated atomically by a Lua script."""
+
+    _SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    if now > updated then
+        tokens = math.min(capacity, tokens + (now - updated) * rate)
+        updated = now
+    end
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', updated)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str) -> None:
+        import redis  # Optional dependency, only needed for this backend
+
+        self._client = redis.Redis.from_url(url)
+        self._consume = self._client.register_script(self._SCRIPT)
+
+    def consume(self, key: str, rate: float, capacity: float) -> float:
+        return float(self._consume(keys=[f"tg-bot:quota:{key}"], args=[rate, capacity, time.time()]))
+
+
+def make_quota_backend(url: str):
+    """Build a shared backend from a URL like sqlite:///path/to.db or redis://host:6379/0."""
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteQuotaBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisQuotaBackend(url)
+    raise ValueError(f"Unsupported rate limit backend: {url}")
+
+
+def parse_quota(spec: str) -> Optional[Tuple[float, float]]:
+    """Parse "5/60" (5 requests per 60 s) into (rate per second, burst). Empty means unlimited."""
+    spec = spec.strip()
+    if not spec:
+        return None
+    count, _, period = spec.partition("/")
+    try:
+        count = float(count)
+        period = float(period or 60)
+    except ValueError:
+        raise ValueError(f"Invalid quota {spec!r}, expected requests/seconds like \"5/60\"") from None
+    if not (count > 0 and period > 0):
+        raise ValueError(f"Invalid quota {spec!r}: requests and seconds must both be positive")
+    return count / period, count
+
+
+class QuotaLimiter:
+    """Per-user token buckets, one per command cost class.
+
+    Cost classes without a quota are unlimited. With a shared backend the
+    buckets live there and every replica sees the same budget; if the
+    backend fails the in-memory buckets are used instead.
+    """
+
+    def __init__(self, quotas: Dict[str, Optional[Tuple[float, float]]], backend=None) -> None:
+        self.quotas = quotas
+        self.backend = backend
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited: Dict[str, int] = {cost: 0 for cost in quotas}
+
+    def acquire(self, user_id, cost: str) -> float:
+        """Take one request from user_id's `cost` budget. Returns 0 or seconds to wait."""
+        quota = self.quotas.get(cost)
+        if quota is None:
+            return 0.0
+        rate, capacity = quota
+        key = f"{user_id}:{cost}"
+        wait = None
+        if self.backend is not None:
+            try:
+                wait = self.backend.consume(key, rate, capacity)
+            except Exception as e:
+                print(f"Rate limit backend error, using local buckets: {e}")
+        with self._lock:
+            if wait is None:
+                now = time.monotonic()
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    if len(self._buckets) > 10000:
+                        self._buckets = {k: b for k, b in self._buckets.items() if not b.is_full(now)}
+                    bucket = self._buckets[key] = TokenBucket(rate, capacity, now)
+                wait = bucket.consume(now)
+            if wait > 0:
+                self.limited[cost] = self.limited.get(cost, 0) + 1
+            else:
+                self.allowed += 1
+        return wait
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "quotas": {cost: (None if q is None else {"per_minute": round(q[0] * 60, 2), "burst": q[1]})
+                           for cost, q in self.quotas.items()},
+                "allowed": self.allowed,
+                "limited": dict(self.limited),
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+            }
+
+
+quota_limiter = QuotaLimiter(
+    {
+        "cheap": None,
+        "network": parse_quota(RATE_LIMIT_NETWORK),
+        "llm": parse_quota(RATE_LIMIT_LLM),
+        "render": parse_quota(RATE_LIMIT_RENDER),
+    },
+    backend=make_quota_backend(RATE_LIMIT_BACKEND),
+)
@@ -0,0 +1,121 @@
+"""
+ResponseCache remembers LLM answers so repeated prompts skip generation.
+
+Users keep sending near-identical prompts (the /help examples, common
+safety questions). The cache key is a hash of the model, its options, the
+normalized prompt (Unicode NFKC so full-width forms fold to half-width,
+CJK punctuation mapped to ASCII, case folded, whitespace collapsed) and
+hashes of the context and conversation history when they are used.
+
+Entries live in a size-bounded LRU with a per-entry TTL and can be
+written through to SQLite so they survive restarts and are shared by
+workers. Prompts about time-relative things ("today", "latest", 現在,
+最近 ...) get a short TTL, or are not cached at all when that TTL is 0.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Optional
+
+from cachetools import TLRUCache
+
+_PUNCTUATION = str.maketrans({"。": ".", "、": ",", "「": '"', "」": '"', "『": '"', "』": '"', "～": "~", "・": "."})
+_SPACE_RE = re.compile(r"\s+")
+TIME_RELATIVE_RE = re.compile(
+    r"\b(?:today|tonight|now|current(?:ly)?|latest|recent(?:ly)?|yesterday|tomorrow|this (?:week|month|year))\b"
+    r"|今天|今日|現在|现在|目前|最新|最近|昨天|明天|剛剛|刚刚|本週|本周|這週|这周|這個月|这个月|今年",
+    re.IGNORECASE,
+)
+
+
+def normalize_prompt(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).translate(_PUNCTUATION).casefold()
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cache_key(model: str, options: Dict, prompt: str, context: str = "", history=None) -> str:
+    parts = {"model": model, "options": options, "prompt": normalize_prompt(prompt)}
+    if context:
+        parts["context"] = _digest(context)
+    if history:
+        parts["history"] = _digest([[m["role"], normalize_prompt(m["content"])] for m in history])
+    return _digest(parts)
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int = 512, ttl: float = 86400, relative_ttl: float = 120, db_path: str = "") -> None:
+        self.ttl = ttl
+        self.relative_ttl = relative_ttl
+        # Values are (response, expires_at in wall-clock seconds) so SQLite rows share the same expiry
+        self._memory = TLRUCache(maxsize=maxsize, ttu=lambda key, value, now: value[1], timer=time.time)
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        self._writes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def ttl_for(self, prompt: str) -> float:
+        """Seconds a response to `prompt` may be reused (0 = do not cache)."""
+        return self.relative_ttl if TIME_RELATIVE_RE.search(unicodedata.normalize("NFKC", prompt)) else self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT response, expires_at FROM llm_responses WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    entry = self._memory[key] = (row[0], row[1])
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, response: str, ttl: float) -> None:
+        if ttl <= 0:
+            self.skipped += 1
+            return
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._memory[key] = (response, expires_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_responses (key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, response, expires_at),
+                )
+                self._writes += 1
+                if self._writes % 200 == 0:
+                    self._conn.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (time.time(),))
+                self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "resident": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "not_cached_time_relative": self.skipped,
+                "persistent": self._conn is not None,
+            }
@@ -0,0 +1,217 @@
+"""
+SendScheduler paces everything the bot sends so it stays inside
+Telegram's limits (about 30 messages/s overall, 1 message/s per chat and
+20 messages/minute per group) instead of being throttled with 429s.
+
+Outgoing calls are queued by priority: earthquake alerts go first, then
+replies to users, then admin logs. A single pacing thread picks the next
+call whose chat bucket and the global bucket both have a token and hands
+it to a small pool of sender threads. Only one call per chat is in
+flight at a time, so a chat's messages keep their order. Plain text
+messages that queue up for the same chat are merged into one message
+while they fit in Telegram's 4096 character limit.
+
+submit() returns a Future resolving to the Bot API response.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional
+
+from .config import TG_GLOBAL_RATE, TG_CHAT_RATE, TG_GROUP_RATE_PER_MIN, TG_CHAT_BURST
+from .metrics import LatencyHistogram
+from .rate_limit import TokenBucket
+from .telegram_client import TelegramClient, get_client
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_ALERT = 0
+PRIORITY_REPLY = 1
+PRIORITY_LOG = 2
+PRIORITY_NAMES = {PRIORITY_ALERT: "alert", PRIORITY_REPLY: "reply", PRIORITY_LOG: "log"}
+
+MAX_MESSAGE_LENGTH = 4096
+# Payload keys a sendMessage may have and still be merged with its neighbours
+_MERGEABLE_KEYS = {"chat_id", "text", "parse_mode"}
+
+
+def is_group_chat(chat_id) -> bool:
+    """Group and supergroup ids are negative."""
+    return str(chat_id).startswith("-")
+
+
+class _Outbound:
+    __slots__ = ("method", "chat_id", "data", "files", "priority", "allow_merge", "enqueued_at", "futures")
+
+    def __init__(self, method, chat_id, data, files, priority, allow_merge=True) -> None:
+        self.method = method
+        self.chat_id = chat_id
+        self.data = data
+        self.files = files
+        self.priority = priority
+        self.allow_merge = allow_merge
+        self.enqueued_at = time.monotonic()
+        self.futures: List[Future] = [Future()]
+
+    @property
+    def mergeable(self) -> bool:
+        return self.allow_merge and self.method == "sendMessage" and not self.files and set(self.data) <= _MERGEABLE_KEYS
+
+
+class SendScheduler:
+    def __init__(
+        self,
+        client: Optional[TelegramClient] = None,
+        global_rate: float = TG_GLOBAL_RATE,
+        chat_rate: float = TG_CHAT_RATE,
+        group_rate: float = TG_GROUP_RATE_PER_MIN / 60.0,
+        chat_burst: float = TG_CHAT_BURST,
+        senders: int = 8,
+        merge: bool = True,
+    ) -> None:
+        self.client = client
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.merge = merge
+
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._queues: Dict[int, Deque[_Outbound]] = {p: deque() for p in PRIORITY_NAMES}
+        self._in_flight = set()
+        self._cond = threading.Condition()
+        self._senders = ThreadPoolExecutor(max_workers=senders, thread_name_prefix="tg-send")
+        self._thread: Optional[threading.Thread] = None
+
+        self.queue_latency = {p: LatencyHistogram() for p in PRIORITY_NAMES}
+        self.sent = 0
+        self.merged = 0
+        self.failed = 0
+
+    def submit(self, method: str, chat_id, data: Dict, files=None, priority: int = PRIORITY_REPLY,
+               mergeable: bool = True) -> Future:
+        """Queue a Bot API call. mergeable=False keeps a sendMessage separate,
+        e.g. when its message_id is needed for later edits."""
+        item = _Outbound(method, chat_id, data, files, priority, mergeable)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tg-send-scheduler", daemon=True)
+                self._thread.start()
+            self._queues[priority].append(item)
+            self._cond.notify()
+        return item.futures[0]
+
+    def _bucket(self, chat_key: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(chat_key)
+        if bucket is None:
+            if len(self._buckets) > 10000:
+                # Forget chats whose bucket has refilled; a new full bucket is equivalent
+                self._buckets = {k: b for k, b in self._buckets.items() if not b.is_full(now)}
+            rate = self.group_rate if is_group_chat(chat_key) else self.chat_rate
+            bucket = self._buckets[chat_key] = TokenBucket(rate, self.chat_burst, now)
+        return bucket
+
+    def _pick(self, now: float):
+        """Take the next sendable item. Returns (item, None) or (None, seconds to wait)."""
+        global_wait = self._global.wait_time(now)
+        if global_wait > 0:
+            return None, global_wait
+        wait = None
+        blocked = set()
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            for index, item in enumerate(queue):
+                chat_key = str(item.chat_id)
+                if chat_key in blocked or chat_key in self._in_flight:
+                    # Later items of the chat must not overtake this one
+                    blocked.add(chat_key)
+                    continue
+                chat_wait = self._bucket(chat_key, now).consume(now)
+                if chat_wait > 0:
+                    blocked.add(chat_key)
+                    wait = chat_wait if wait is None else min(wait, chat_wait)
+                    continue
+                self._global.consume(now)
+                del queue[index]
+                if self.merge and item.mergeable:
+                    self._merge_following(item, queue, index)
+                return item, None
+        return None, wait
+
+    def _merge_following(self, item: _Outbound, queue: Deque[_Outbound], start: int) -> None:
+        """Fold queued plain messages for the same chat into `item`."""
+        chat_key = str(item.chat_id)
+        text = item.data["text"]
+        index = start
+        while index < len(queue):
+            other = queue[index]
+            if str(other.chat_id) != chat_key:
+                index += 1
+                continue
+            if (not other.mergeable or other.data.get("parse_mode") != item.data.get("parse_mode")
+                    or len(text) + 2 + len(other.data["text"]) > MAX_MESSAGE_LENGTH):
+                break
+            text = f"{text}\n\n{other.data['text']}"
+            item.futures.extend(other.futures)
+            self.queue_latency[other.priority].observe(time.monotonic() - other.enqueued_at)
+            self.merged += 1
+            del queue[index]
+        item.data = {**item.data, "text": text}
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    item, wait = self._pick(time.monotonic())
+                    if item is not None:
+                        break
+                    self._cond.wait(wait)
+                self._in_flight.add(str(item.chat_id))
+            self.queue_latency[item.priority].observe(time.monotonic() - item.enqueued_at)
+            self._senders.submit(self._send, item)
+
+    def _send(self, item: _Outbound) -> None:
+        client = self.client or get_client()
+        try:
+            response = client.call(item.method, data=item.data, files=item.files)
+        except Exception as e:
+            self.failed += 1
+            for future in item.futures:
+                future.set_exception(e)
+        else:
+            self.sent += 1
+            for future in item.futures:
+                future.set_result(response)
+        finally:
+            with self._cond:
+                self._in_flight.discard(str(item.chat_id))
+                self._cond.notify()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            depth = {PRIORITY_NAMES[p]: len(q) for p, q in self._queues.items()}
+            in_flight = len(self._in_flight)
+        return {
+            "queue_depth": depth,
+            "in_flight": in_flight,
+            "sent": self.sent,
+            "merged": self.merged,
+            "failed": self.failed,
+            "queue_latency": {PRIORITY_NAMES[p]: h.snapshot() for p, h in self.queue_latency.items()},
+        }
+
+
+_scheduler: Optional[SendScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> SendScheduler:
+    """Return the process-wide shared SendScheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = SendScheduler()
+    return _scheduler
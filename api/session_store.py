@@ -0,0 +1,176 @@
+"""
+SessionStore keeps ChatConversation objects for ChatManager.
+
+Resident sessions form an LRU bounded by count and by (encoded) bytes,
+and sessions idle longer than the TTL are evicted. Every save is written
+through to SQLite in a compact encoding (zlib-compressed JSON), so a
+session evicted from memory, lost on a cold start, or saved by another
+gunicorn worker is loaded back on the next message. Before a resident
+session is reused its row version is compared with the database, so a
+newer copy written by another worker wins.
+"""
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+
+def encode_state(state: Dict) -> bytes:
+    return zlib.compress(json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_state(blob: bytes) -> Dict:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class _Entry:
+    __slots__ = ("session", "size", "last_access", "version")
+
+    def __init__(self, session, size: int, version: float) -> None:
+        self.session = session
+        self.size = size
+        self.last_access = time.monotonic()
+        self.version = version
+
+
+class SessionStore:
+    def __init__(
+        self,
+        factory: Callable[[Optional[Dict]], object],
+        max_sessions: int = 1000,
+        max_bytes: int = 32 * 1024 * 1024,
+        idle_ttl: float = 6 * 3600,
+        db_path: str = "",
+        retention: float = 30 * 86400,
+    ) -> None:
+        """factory(state) builds a session from a decoded state (None for a new one);
+        sessions must provide to_state()."""
+        self.factory = factory
+        self.max_sessions = max(1, max_sessions)
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.retention = retention
+        self._entries: "OrderedDict[object, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (history_id TEXT PRIMARY KEY, state BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        self._writes = 0
+
+        self.hits = 0
+        self.loads = 0
+        self.created = 0
+        self.evictions = 0
+
+    def get(self, history_id):
+        """Return the session for history_id, loading or creating it as needed."""
+        key = str(history_id)
+        with self._lock:
+            self._expire_idle()
+            entry = self._entries.get(key)
+            row = self._db_row(key, with_state=False) if self._conn is not None else None
+            if entry is not None and self._is_current(entry, row):
+                self.hits += 1
+                entry.last_access = time.monotonic()
+                self._entries.move_to_end(key)
+                return entry.session
+
+            if self._conn is not None and row is not None:
+                # Not resident, or another worker saved a newer version
+                _, version = row
+                blob = self._db_row(key, with_state=True)[0]
+                session = self.factory(decode_state(blob))
+                self.loads += 1
+                self._insert(key, session, len(blob), version)
+            else:
+                session = self.factory(None)
+                self.created += 1
+                self._insert(key, session, 0, 0.0)
+            return session
+
+    def save(self, history_id, session) -> None:
+        """Write the session through to the database and refresh its size."""
+        key = str(history_id)
+        blob = encode_state(session.to_state())
+        version = time.time()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (history_id, state, updated_at) VALUES (?, ?, ?)",
+                    (key, blob, version),
+                )
+                self._writes += 1
+                if self._writes % 500 == 0:
+                    self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (version - self.retention,))
+                self._conn.commit()
+            self._insert(key, session, len(blob), version)
+
+    def delete(self, history_id) -> None:
+        key = str(history_id)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM sessions WHERE history_id = ?", (key,))
+                self._conn.commit()
+
+    def _is_current(self, entry: _Entry, row) -> bool:
+        if self._conn is None:
+            return True
+        if row is None:
+            # A saved session whose row is gone was reset by another worker
+            return entry.version == 0.0
+        return row[1] <= entry.version
+
+    def _db_row(self, key: str, with_state: bool):
+        column = "state" if with_state else "NULL"
+        return self._conn.execute(
+            f"SELECT {column}, updated_at FROM sessions WHERE history_id = ?", (key,)
+        ).fetchone()
+
+    def _insert(self, key: str, session, size: int, version: float) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[key] = _Entry(session, size, version)
+        self._bytes += size
+        # Evict least recently used sessions, but never the one just inserted
+        while len(self._entries) > 1 and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    def _expire_idle(self) -> None:
+        deadline = time.monotonic() - self.idle_ttl
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.last_access > deadline:
+                break
+            self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "resident_sessions": len(self._entries),
+                "resident_bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "loads": self.loads,
+                "created": self.created,
+                "evictions": self.evictions,
+                "persistent": self._conn is not None,
+            }
@@ -0,0 +1,223 @@
+"""
+A local store of CWA significant earthquake reports, keyed by EarthquakeNo.
+
+/eq_latest, /eq_significant and the background watch used to each request
+the whole feed. They now read one in-memory frame backed by SQLite. A
+sync asks CWA only for reports from a little before the newest OriginTime
+already stored (reports can be published or revised out of order, and a
+re-fetched report simply replaces its row). The first sync backfills a
+fixed number of days, and a query for an older window fetches just the
+missing stretch once. Reads sync only when the last sync is older than
+max_age; the time of the last sync lives in the database, so gunicorn
+workers share one sync and the others reload the frame when the table
+changed. If CWA cannot be reached, the stored reports are served.
+"""
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+# Columns of the parsed frame and their SQLite counterparts
+_COLUMNS = {
+    "ID": "earthquake_no", "Time": "origin_ts", "Lat": "lat", "Lon": "lon", "Depth": "depth",
+    "Magnitude": "magnitude", "Location": "location", "URL": "url", "Report": "report", "ImageURL": "image_url",
+}
+
+
+class SignificantStore:
+    def __init__(
+        self,
+        fetch: Callable[[datetime, Optional[datetime]], pd.DataFrame],
+        db_path: str,
+        tz,
+        max_age: float = 60,
+        backfill_days: int = 30,
+        overlap: timedelta = timedelta(hours=6),
+        on_new: Optional[Callable[[pd.DataFrame], None]] = None,
+    ) -> None:
+        """fetch(time_from, time_to) returns the parsed reports in that range (time_to None = up to now);
+        on_new(df) is called with reports the store had not seen before."""
+        self.fetch = fetch
+        self.tz = tz
+        self.max_age = max_age
+        self.backfill = timedelta(days=backfill_days)
+        self.overlap = overlap
+        self.on_new = on_new
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS significant_earthquakes (earthquake_no INTEGER PRIMARY KEY, origin_ts REAL, "
+            "lat REAL, lon REAL, depth REAL, magnitude REAL, location TEXT, url TEXT, report TEXT, image_url TEXT, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS significant_by_time ON significant_earthquakes (origin_ts)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS significant_meta (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+        self._conn.commit()
+        self._db_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._frame: Optional[pd.DataFrame] = None
+        self._data_version = None
+        self.syncs = 0
+        self.fetches = 0
+        self.new_reports = 0
+        self.errors = 0
+        self.stale_reads = 0
+
+    # --- database ---
+
+    def _meta(self, key: str) -> Optional[float]:
+        row = self._conn.execute("SELECT value FROM significant_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: float) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO significant_meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _reload_if_changed(self) -> None:
+        """Rebuild the frame if the table changed since it was loaded (writes by this store reload it directly)."""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._frame is not None and version == self._data_version:
+            return
+        rows = self._conn.execute(
+            f"SELECT {', '.join(_COLUMNS.values())} FROM significant_earthquakes ORDER BY origin_ts DESC, earthquake_no DESC"
+        ).fetchall()
+        frame = pd.DataFrame(rows, columns=list(_COLUMNS))
+        frame["Time"] = pd.to_datetime(frame["Time"], unit="s", utc=True).dt.tz_convert(self.tz)
+        for name in ("Lat", "Lon", "Depth", "Magnitude"):
+            frame[name] = frame[name].astype(float)
+        self._frame = frame
+        self._data_version = version
+
+    def _upsert(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Write fetched reports; returns the ones whose EarthquakeNo was not stored yet."""
+        if df.empty:
+            return df
+        df = df[df["ID"].notna()]
+        known = set(self._frame["ID"].tolist())
+        new = df[~df["ID"].isin(known)]
+        rows = df[list(_COLUMNS)].copy()
+        rows["Time"] = rows["Time"].map(lambda t: t.timestamp() if pd.notna(t) else None)
+        rows = rows.astype(object).where(rows.notna(), None)
+        now = time.time()
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO significant_earthquakes ({', '.join(_COLUMNS.values())}, updated_at) "
+            f"VALUES ({', '.join('?' * len(_COLUMNS))}, ?)",
+            [(int(row[0]), *row[1:], now) for row in rows.itertuples(index=False)],
+        )
+        return new
+
+    # --- sync ---
+
+    def sync(self, max_age: Optional[float] = None) -> pd.DataFrame:
+        """Fetch reports newer than the store unless it was synced less than max_age
+        seconds ago (by any worker). Returns the reports that were new."""
+        max_age = self.max_age if max_age is None else max_age
+        with self._sync_lock:
+            with self._db_lock:
+                self._reload_if_changed()
+                synced_at = self._meta("synced_at")
+                if synced_at is not None and time.time() - synced_at < max_age:
+                    return self._frame.iloc[:0]
+                now = datetime.now(self.tz)
+                newest = self._frame["Time"].max() if not self._frame.empty else None
+                time_from = newest.to_pydatetime() - self.overlap if pd.notna(newest) else now - self.backfill
+            self.syncs += 1
+            df = self._fetch(time_from, None)
+            with self._db_lock:
+                new = self._upsert(df)
+                self._set_meta("synced_at", time.time())
+                if self._meta("covered_from") is None:
+                    self._set_meta("covered_from", time_from.timestamp())
+                self._conn.commit()
+                self._frame = None
+                self._reload_if_changed()
+        self.new_reports += len(new)
+        if self.on_new is not None and not new.empty:
+            self.on_new(new)
+        return new
+
+    def _ensure_covered(self, since: datetime) -> None:
+        """Fetch the stretch between `since` and the oldest time the store is complete from, if any."""
+        with self._sync_lock:
+            with self._db_lock:
+                covered_from = self._meta("covered_from")
+            if covered_from is None or since.timestamp() >= covered_from:
+                return
+            df = self._fetch(since, datetime.fromtimestamp(covered_from, self.tz))
+            with self._db_lock:
+                self._reload_if_changed()
+                self._upsert(df)
+                self._set_meta("covered_from", since.timestamp())
+                self._conn.commit()
+                self._frame = None
+                self._reload_if_changed()
+
+    def _fetch(self, time_from: datetime, time_to: Optional[datetime]) -> pd.DataFrame:
+        self.fetches += 1
+        try:
+            return self.fetch(time_from, time_to)
+        except Exception:
+            self.errors += 1
+            raise
+
+    def _fresh_frame(self) -> pd.DataFrame:
+        """The frame after a sync if one is due; the stored frame if CWA cannot be reached and it has reports."""
+        try:
+            self.sync()
+        except Exception:
+            with self._db_lock:
+                self._reload_if_changed()
+                if self._frame.empty:
+                    raise
+            self.stale_reads += 1
+        return self._frame
+
+    # --- queries ---
+
+    def window(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+               limit: Optional[int] = None) -> pd.DataFrame:
+        """Reports with since <= OriginTime < until, newest first."""
+        if since is not None:
+            try:
+                self._ensure_covered(since)
+            except Exception as e:
+                print(f"Significant earthquake backfill failed: {e}")
+        frame = self._fresh_frame()
+        mask = pd.Series(True, index=frame.index)
+        if since is not None:
+            mask &= frame["Time"] >= since
+        if until is not None:
+            mask &= frame["Time"] < until
+        result = frame[mask]
+        return result.head(limit) if limit is not None else result
+
+    def stored(self) -> pd.DataFrame:
+        """The reports already stored, newest first, without syncing."""
+        with self._db_lock:
+            self._reload_if_changed()
+            return self._frame
+
+    def latest(self) -> Optional[Dict]:
+        """The newest report as a dict (missing values as None), or None if there is none."""
+        frame = self._fresh_frame()
+        if frame.empty:
+            return None
+        return {k: (None if not isinstance(v, str) and pd.isna(v) else v) for k, v in frame.iloc[0].to_dict().items()}
+
+    def stats(self) -> Dict:
+        with self._db_lock:
+            synced_at = self._meta("synced_at")
+            covered_from = self._meta("covered_from")
+            rows = len(self._frame) if self._frame is not None else None
+        return {
+            "reports": rows,
+            "covered_from": datetime.fromtimestamp(covered_from, self.tz).isoformat() if covered_from else None,
+            "synced_age": round(time.time() - synced_at, 1) if synced_at else None,
+            "syncs": self.syncs,
+            "fetches": self.fetches,
+            "new_reports": self.new_reports,
+            "errors": self.errors,
+            "stale_reads": self.stale_reads,
+        }
@@ -0,0 +1,162 @@
+"""
+StreamingReply shows an LLM answer while it is being generated.
+
+start() queues a placeholder message straight away (before the model has
+produced anything), feed() receives tokens and updates that message with
+editMessageText, and finish() replaces it with the final, formatted answer.
+
+Edits are throttled: at most one every STREAM_EDIT_INTERVAL seconds
+unless STREAM_EDIT_CHARS new characters arrived, and never while the
+previous edit is still queued, so a slow chat simply sees fewer, larger
+updates. Partial text is sent without parse_mode because half a Markdown
+entity does not parse; only the final edit uses MarkdownV2. Text past
+Telegram's 4096 character limit continues in a new message.
+"""
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+from md2tgmd import escape
+
+from .config import STREAM_EDIT_INTERVAL, STREAM_EDIT_CHARS, stream_placeholder_info, send_message_log
+from .printLog import send_log
+from .send_scheduler import MAX_MESSAGE_LENGTH, PRIORITY_REPLY, get_scheduler
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH, measure=len) -> List[str]:
+    """Split text into chunks with measure(chunk) <= limit, preferring line breaks."""
+    chunks = []
+    while measure(text) > limit:
+        cut = min(len(text), limit)
+        while cut > 1 and measure(text[:cut]) > limit:
+            cut = int(cut * 0.9)
+        newline = text.rfind("\n", 0, cut)
+        if newline > cut // 2:
+            cut = newline + 1
+        chunks.append(text[:cut])
+        text = text[cut:]
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+def _response_ok(response) -> bool:
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    # Editing to identical text is rejected, but the message already shows it
+    return bool(body.get("ok")) or "message is not modified" in body.get("description", "")
+
+
+class StreamingReply:
+    def __init__(self, chat_id, interval: float = STREAM_EDIT_INTERVAL, min_chars: int = STREAM_EDIT_CHARS,
+                 placeholder: str = stream_placeholder_info, priority: int = PRIORITY_REPLY) -> None:
+        self.chat_id = chat_id
+        self.interval = interval
+        self.min_chars = min_chars
+        self.placeholder = placeholder
+        self.priority = priority
+
+        self.text = ""
+        self._messages: List[Future] = []   # sendMessage futures, one per Telegram message
+        self._base = 0                      # offset of the last message's text in self.text
+        self._shown = 0                     # length of self.text visible in Telegram
+        self._last_edit = 0.0
+        self._pending: Optional[Future] = None
+        self._failed = False
+
+        self.edits = 0
+        self.started_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+
+    def start(self) -> "StreamingReply":
+        """Queue the placeholder without waiting for it to be sent."""
+        self._messages.append(self._submit("sendMessage", {"chat_id": self.chat_id, "text": self.placeholder}))
+        self._last_edit = time.monotonic()
+        return self
+
+    def _submit(self, method: str, data) -> Future:
+        return get_scheduler().submit(method, self.chat_id, data, priority=self.priority, mergeable=False)
+
+    def _message_id(self, index: int) -> int:
+        response = self._messages[index].result()
+        return response.json()["result"]["message_id"]
+
+    def feed(self, delta: str) -> None:
+        """Append generated text and update the message if it is due."""
+        if not delta:
+            return
+        now = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.text += delta
+        if self._failed or not self.text.strip():
+            return
+        if len(self.text) - self._shown < self.min_chars and now - self._last_edit < self.interval:
+            return
+        if self._pending is not None and not self._pending.done():
+            return
+        try:
+            self._flush(now)
+        except Exception as e:
+            # Streaming is cosmetic; finish() still delivers the answer
+            print(f"Streaming reply to {self.chat_id} stopped: {e}")
+            self._failed = True
+
+    def _flush(self, now: float) -> None:
+        while True:
+            segment = self.text[self._base:]
+            if len(segment) <= MAX_MESSAGE_LENGTH:
+                self._pending = self._submit(
+                    "editMessageText", {"chat_id": self.chat_id, "message_id": self._message_id(-1), "text": segment}
+                )
+                break
+            # Close the current message at a line break and continue in a new one
+            head = split_message(segment)[0]
+            self._submit("editMessageText", {"chat_id": self.chat_id, "message_id": self._message_id(-1), "text": head})
+            self._base += len(head)
+            rest = self.text[self._base:self._base + MAX_MESSAGE_LENGTH]
+            self._messages.append(self._submit("sendMessage", {"chat_id": self.chat_id, "text": rest if rest.strip() else self.placeholder}))
+            if len(self.text) - self._base <= MAX_MESSAGE_LENGTH:
+                self._pending = self._messages[-1]
+                break
+        self._shown = len(self.text)
+        self._last_edit = now
+        self.edits += 1
+
+    def finish(self, final_text: str) -> None:
+        """Replace the streamed text with the final answer, formatted like send_message."""
+        from .telegram import send_message
+
+        chunks = split_message(final_text, measure=lambda chunk: len(escape(chunk)))
+        if self._pending is not None:
+            try:
+                self._pending.result()
+            except Exception:
+                pass
+        for index, chunk in enumerate(chunks):
+            if index >= len(self._messages) or not self._edit_final(index, chunk):
+                send_message(self.chat_id, chunk, priority=self.priority)
+        # The final text can need fewer messages than the stream did
+        for index in range(len(chunks), len(self._messages)):
+            try:
+                self._submit("deleteMessage", {"chat_id": self.chat_id, "message_id": self._message_id(index)})
+            except Exception:
+                pass
+        elapsed = (self.first_token_at or time.monotonic()) - self.started_at
+        print(f"Streamed reply to {self.chat_id}: {len(final_text)} chars, {self.edits} edits, first token after {elapsed:.2f}s")
+        send_log(f"{send_message_log}\n{final_text}")
+
+    def _edit_final(self, index: int, chunk: str) -> bool:
+        try:
+            message_id = self._message_id(index)
+            data = {"chat_id": self.chat_id, "message_id": message_id, "text": escape(chunk), "parse_mode": "MarkdownV2"}
+            if _response_ok(self._submit("editMessageText", data).result()):
+                return True
+            # Fall back to plain text if the Markdown does not parse
+            data = {"chat_id": self.chat_id, "message_id": message_id, "text": chunk}
+            return _response_ok(self._submit("editMessageText", data).result())
+        except Exception as e:
+            print(f"Final edit of streamed reply to {self.chat_id} failed: {e}")
+            return False
@@ -0,0 +1,206 @@
+"""
+Push subscriptions for CWA earthquake early warnings.
+
+/subscribe stores a chat with an optional minimum magnitude and region in
+SQLite (indexed by the magnitude threshold). AlertBroadcaster keeps the
+subscriptions in memory as numpy arrays sorted by threshold and reloads
+them only when the table changed, in this worker or another one. A new
+warning is matched in one pass: a binary search cuts the arrays at the
+warning's magnitude, and a lookup table answering "does this region
+appear in the warning's areas" (computed once per distinct region) is
+indexed by each subscriber's region code. The matching chats are queued
+on the SendScheduler at alert priority, which paces them inside
+Telegram's global and per-chat limits, and each delivery records the
+latency from the quake's originTime.
+
+With several gunicorn workers every worker sees the new warning; the
+first one to record its identifier in the database broadcasts it.
+"""
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from .config import SUBSCRIPTION_DB, ALERT_MAX_AGE, alert_push_info
+from .cwa_service import TAIPEI_TZ, alarm_origin_time, _to_float
+from .metrics import LatencyHistogram
+from .send_scheduler import PRIORITY_ALERT, get_scheduler
+
+# Delivering to thousands of chats at ~30 messages/s takes minutes
+ALERT_LATENCY_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def normalize_region(region: str) -> str:
+    """Compare regions without caring about 台/臺 or spacing."""
+    return "".join(str(region).split()).replace("台", "臺").casefold()
+
+
+class SubscriptionStore:
+    def __init__(self, db_path: str = SUBSCRIPTION_DB) -> None:
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS subscriptions (chat_id INTEGER PRIMARY KEY, min_magnitude REAL NOT NULL, "
+            "region TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS subscriptions_by_magnitude ON subscriptions (min_magnitude)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS alert_broadcasts (identifier TEXT PRIMARY KEY, sent_at REAL NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def subscribe(self, chat_id, min_magnitude: float = 0.0, region: str = "") -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO subscriptions (chat_id, min_magnitude, region, created_at) VALUES (?, ?, ?, ?)",
+                (int(chat_id), float(min_magnitude), normalize_region(region), time.time()),
+            )
+            self._conn.commit()
+            self._writes += 1
+
+    def unsubscribe(self, chat_id) -> bool:
+        """Returns False if the chat was not subscribed."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM subscriptions WHERE chat_id = ?", (int(chat_id),)).rowcount
+            self._conn.commit()
+            self._writes += 1
+        return removed > 0
+
+    def version(self):
+        """Changes whenever the table may have changed, here or in another process."""
+        with self._lock:
+            return self._writes, self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def load(self):
+        """All subscriptions as (chat_id, min_magnitude, region) rows, lowest threshold first."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT chat_id, min_magnitude, region FROM subscriptions ORDER BY min_magnitude"
+            ).fetchall()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0]
+
+    def claim(self, identifier: str) -> bool:
+        """Record that a warning is being broadcast. Only the first caller for an identifier gets True."""
+        now = time.time()
+        with self._lock:
+            claimed = self._conn.execute(
+                "INSERT OR IGNORE INTO alert_broadcasts (identifier, sent_at) VALUES (?, ?)", (identifier, now)
+            ).rowcount
+            self._conn.execute("DELETE FROM alert_broadcasts WHERE sent_at < ?", (now - 7 * 86400,))
+            self._conn.commit()
+        return claimed > 0
+
+
+class _Subscribers:
+    """The subscriptions as parallel arrays sorted by min_magnitude."""
+
+    def __init__(self, rows, version) -> None:
+        self.version = version
+        self.chat_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.min_magnitude = np.array([row[1] for row in rows], dtype=np.float64)
+        self.regions, codes = np.unique(np.array([row[2] for row in rows], dtype=object), return_inverse=True)
+        self.region_codes = codes.astype(np.int32)
+
+    def match(self, magnitude: Optional[float], areas: Iterable[str]) -> np.ndarray:
+        """Chat ids whose threshold is at most `magnitude` (everyone if it is unknown)
+        and whose region is empty or found in `areas`."""
+        end = len(self.chat_ids) if magnitude is None else np.searchsorted(self.min_magnitude, magnitude, side="right")
+        areas = [normalize_region(a) for a in areas]
+        wanted = np.array([not r or any(r in a or a in r for a in areas) for r in self.regions], dtype=bool)
+        if not len(wanted):
+            return self.chat_ids[:0]
+        return self.chat_ids[:end][wanted[self.region_codes[:end]]]
+
+
+class AlertBroadcaster:
+    def __init__(self, store: SubscriptionStore, max_age: float = ALERT_MAX_AGE) -> None:
+        self.store = store
+        self.max_age = max_age
+        self._subscribers: Optional[_Subscribers] = None
+        self._lock = threading.Lock()
+        self.latency = LatencyHistogram(ALERT_LATENCY_BUCKETS)
+        self.alerts = 0
+        self.skipped = 0
+        self.queued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.removed = 0
+
+    def subscribers(self) -> _Subscribers:
+        version = self.store.version()
+        with self._lock:
+            if self._subscribers is None or self._subscribers.version != version:
+                self._subscribers = _Subscribers(self.store.load(), version)
+            return self._subscribers
+
+    def broadcast(self, item: Dict) -> int:
+        """Queue a new early warning for every matching subscriber. Returns how many chats were queued."""
+        identifier = item.get("identifier")
+        origin = alarm_origin_time(item)
+        origin_ts = origin.timestamp() if origin is not None else None
+        if origin_ts is not None and time.time() - origin_ts > self.max_age:
+            # Reported late (e.g. the feed was unreachable); no longer worth pushing
+            self.skipped += 1
+            return 0
+        if not identifier or not self.store.claim(str(identifier)):
+            return 0
+        magnitude = _to_float(item.get("magnitudeValue"))
+        areas = item.get("locationDesc") if isinstance(item.get("locationDesc"), list) else []
+        chat_ids = self.subscribers().match(magnitude, areas)
+        self.alerts += 1
+        if not len(chat_ids):
+            return 0
+
+        depth = _to_float(item.get("depth"))
+        text = alert_push_info.format(
+            time=origin.astimezone(TAIPEI_TZ).strftime("%Y-%m-%d %H:%M:%S") if origin is not None else "—",
+            magnitude=f"{magnitude:.1f}" if magnitude is not None else "—",
+            depth=f"{depth:.0f}" if depth is not None else "—",
+            areas="、".join(str(a) for a in areas) or "—",
+        )
+        scheduler = get_scheduler()
+        for chat_id in chat_ids.tolist():
+            future = scheduler.submit("sendMessage", chat_id, {"chat_id": chat_id, "text": text},
+                                      priority=PRIORITY_ALERT)
+            future.add_done_callback(lambda f, chat_id=chat_id: self._delivered(f, chat_id, origin_ts))
+        self.queued += len(chat_ids)
+        print(f"Earthquake warning {identifier} queued for {len(chat_ids)} subscribed chats")
+        return len(chat_ids)
+
+    def _delivered(self, future, chat_id, origin_ts) -> None:
+        try:
+            response = future.result()
+        except Exception:
+            self.failed += 1
+            return
+        if response.status_code == 403:
+            # The bot was blocked or removed from the chat
+            self.store.unsubscribe(chat_id)
+            self.removed += 1
+        if response.status_code >= 400:
+            self.failed += 1
+            return
+        self.delivered += 1
+        if origin_ts is not None:
+            self.latency.observe(max(0.0, time.time() - origin_ts))
+
+    def stats(self) -> Dict:
+        return {
+            "subscribers": self.store.count(),
+            "alerts": self.alerts,
+            "skipped_stale": self.skipped,
+            "queued": self.queued,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "removed": self.removed,
+            "latency": self.latency.snapshot(),
+        }
+
+
+subscription_store = SubscriptionStore()
+alert_broadcaster = AlertBroadcaster(subscription_store)
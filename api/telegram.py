@@ -1,15 +1,13 @@
 from typing import Dict
 
-import requests
 from md2tgmd import escape
 
-from .config import BOT_TOKEN, defaut_photo_caption, send_message_log, send_photo_log, unnamed_user, unnamed_group
+from .config import defaut_photo_caption, send_message_log, send_photo_log, unnamed_user, unnamed_group
 from .printLog import send_log
+from .send_scheduler import PRIORITY_REPLY, get_scheduler
 
-TELEGRAM_API = f"https://api.telegram.org/bot{BOT_TOKEN}"
 
-
-def send_message(chat_id, text, **kwargs):
+def send_message(chat_id, text, priority=PRIORITY_REPLY, **kwargs):
     """send text message"""
     payload = {
         "chat_id": chat_id,
@@ -17,13 +15,13 @@ def send_message(chat_id, text, **kwargs):
         "parse_mode": "MarkdownV2",
         **kwargs,
     }
-    r = requests.post(f"{TELEGRAM_API}/sendMessage", data=payload)
+    r = get_scheduler().submit("sendMessage", chat_id, payload, priority=priority).result()
     print(f"Sent message: {text} to {chat_id}")
     send_log(f"{send_message_log}\n```json\n{str(r)}```")
     return r
 
 
-def send_imageMessage(chat_id, text, imageID):
+def send_imageMessage(chat_id, text, imageID, priority=PRIORITY_REPLY):
     """send image message"""
     payload = {
         "chat_id": chat_id,
@@ -31,13 +29,13 @@ def send_imageMessage(chat_id, text, imageID):
         "parse_mode": "MarkdownV2",
         "photo": imageID
     }
-    r = requests.post(f"{TELEGRAM_API}/sendPhoto", data=payload)
+    r = get_scheduler().submit("sendPhoto", chat_id, payload, priority=priority).result()
     print(f"Sent imageMessage: {text} to {chat_id}")
     send_log(f"{send_photo_log}\n```json\n{str(r)}```")
     return r
 
 
-def send_photo_file(chat_id, filepath, caption=""):
+def send_photo_file(chat_id, filepath, caption="", priority=PRIORITY_REPLY):
     """Send a local image file as a photo message via Telegram."""
     payload = {
         "chat_id": chat_id,
@@ -46,12 +44,18 @@ def send_photo_file(chat_id, filepath, caption=""):
         payload["caption"] = escape(caption)
         payload["parse_mode"] = "MarkdownV2"
     with open(filepath, "rb") as f:
-        r = requests.post(f"{TELEGRAM_API}/sendPhoto", data=payload, files={"photo": f})
+        r = get_scheduler().submit("sendPhoto", chat_id, payload, files={"photo": f}, priority=priority).result()
     print(f"Sent photo file: {filepath} to {chat_id}")
     send_log(f"{send_photo_log}\n```json\n{str(r)}```")
     return r
 
 
+def is_new_chat(text: str) -> bool:
+    """True for "/new" or "/new@MyBot", the one slash message that is not a command."""
+    parts = text.split(None, 1)
+    return bool(parts) and parts[0].split("@", 1)[0].lower() == "/new"
+
+
 class Update:
     def __init__(self, update: Dict) -> None:
         self.update = update
@@ -63,6 +67,7 @@ class Update:
         self.text = self._text()
         self.photo_caption = self._photo_caption()
         self.file_id = self._file_id()
+        self.photo_sizes = self.update["message"]["photo"] if self.type == "photo" else []
         #self.user_name = update["message"]["from"]["username"]
         self.user_name = update["message"]["from"].get("username", f" [{unnamed_user}](tg://openmessage?user_id={self.from_id})")
         self.group_name = update["message"]["chat"].get("username", f" [{unnamed_group}](tg://openmessage?chat_id={str(self.chat_id)[4:]})")
@@ -76,7 +81,7 @@ class Update:
     def _type(self):
         if "text" in self.update["message"]:
             text = self.update["message"]["text"]
-            if text.startswith("/") and not text.startswith("/new"):
+            if text.startswith("/") and not is_new_chat(text):
                 return "command"
             return "text"
         elif "photo" in self.update["message"]:
@@ -0,0 +1,177 @@
+"""
+TelegramClient is the one place that talks HTTP to the Bot API.
+
+It keeps a pooled keep-alive requests.Session so messages do not pay a
+new TLS handshake each, applies connect/read timeouts, and retries
+transient failures: network errors and 5xx responses are retried with
+jittered exponential backoff, and a 429 waits for the retry_after the
+server asks for. A read timeout is only retried for get* methods: the
+server may already have acted on a sendMessage it did not answer in
+time, and sending it again would post the message twice. Latency, retry
+and error counters are kept per API method.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import BOT_TOKEN, TELEGRAM_API_BASE
+from .metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+class _MethodStats:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+
+    def snapshot(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "latency": self.latency.snapshot(),
+        }
+
+
+def _idempotent(method: str) -> bool:
+    """Calling the method twice has the same effect as once (getFile, getUpdates, getMe, ...)."""
+    return method.startswith("get")
+
+
+class TelegramClient:
+    def __init__(
+        self,
+        token: Optional[str] = BOT_TOKEN,
+        api_base: str = TELEGRAM_API_BASE,
+        pool_size: int = 20,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10.0,
+        max_retry_after: float = 60.0,
+    ) -> None:
+        self.api_url = f"{api_base.rstrip('/')}/bot{token}"
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._stats: Dict[str, _MethodStats] = {}
+        self._lock = threading.Lock()
+
+    def _method_stats(self, method: str) -> _MethodStats:
+        with self._lock:
+            stats = self._stats.get(method)
+            if stats is None:
+                stats = self._stats[method] = _MethodStats()
+            return stats
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: spreads retries of many threads instead of syncing them
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        try:
+            return float(response.json().get("parameters", {}).get("retry_after"))
+        except Exception:
+            value = response.headers.get("Retry-After")
+            return float(value) if value and value.isdigit() else None
+
+    def call(self, method: str, data=None, json=None, files=None, timeout=None) -> requests.Response:
+        """Call a Bot API method and return the final response.
+
+        HTTP errors that are not retried (or run out of retries) are returned
+        as-is, like requests.post did; network errors are raised after the
+        last retry, and a read timeout of a method that is not idempotent is
+        raised at once.
+        """
+        stats = self._method_stats(method)
+        url = f"{self.api_url}/{method}"
+        started = time.monotonic()
+        attempt = 0
+        with self._lock:
+            stats.calls += 1
+        try:
+            while True:
+                if files:
+                    # A retried upload has to start from the beginning of the file
+                    for f in files.values():
+                        if hasattr(f, "seek"):
+                            f.seek(0)
+                try:
+                    response = self.session.post(url, data=data, json=json, files=files, timeout=timeout or self.timeout)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    # Past the connect phase the request may have been delivered
+                    delivered = (isinstance(e, requests.exceptions.Timeout)
+                                 and not isinstance(e, requests.exceptions.ConnectTimeout))
+                    if attempt >= self.max_retries or (delivered and not _idempotent(method)):
+                        with self._lock:
+                            stats.errors += 1
+                        raise
+                    delay = self._backoff(attempt)
+                    logger.warning(f"Telegram {method} failed ({e}), retrying in {delay:.1f}s")
+                else:
+                    status = response.status_code
+                    if status < 400:
+                        return response
+                    if status == 429:
+                        with self._lock:
+                            stats.rate_limited += 1
+                        delay = self._retry_after(response)
+                        if delay is None:
+                            delay = self._backoff(attempt)
+                        if attempt >= self.max_retries or delay > self.max_retry_after:
+                            with self._lock:
+                                stats.errors += 1
+                            return response
+                        logger.warning(f"Telegram {method} rate limited, retrying in {delay:.1f}s")
+                    elif status >= 500 and attempt < self.max_retries:
+                        delay = self._backoff(attempt)
+                        logger.warning(f"Telegram {method} returned {status}, retrying in {delay:.1f}s")
+                    else:
+                        with self._lock:
+                            stats.errors += 1
+                        return response
+                attempt += 1
+                with self._lock:
+                    stats.retries += 1
+                time.sleep(delay)
+        finally:
+            stats.latency.observe(time.monotonic() - started)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            methods = dict(self._stats)
+        return {method: s.snapshot() for method, s in methods.items()}
+
+
+_client: Optional[TelegramClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> TelegramClient:
+    """Return the process-wide shared TelegramClient."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TelegramClient()
+    return _client
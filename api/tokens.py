@@ -0,0 +1,29 @@
+"""
+Cheap token estimates for budgeting prompts without loading a tokenizer.
+
+Wide characters (CJK, kana, hangul, full-width forms) are roughly one
+token each in the models we use; other text averages about four
+characters per token.
+"""
+import re
+
+_WIDE_CHAR_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: wide (CJK) characters ~1 token, other text ~4 characters per token."""
+    if not text:
+        return 0
+    wide = len(_WIDE_CHAR_RE.findall(text))
+    return wide + (len(text) - wide + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text so that estimate_tokens(text) <= max_tokens."""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep = max(0, int(len(text) * max_tokens / tokens))
+    while keep and estimate_tokens(text[:keep]) > max_tokens:
+        keep = int(keep * 0.9)
+    return text[:keep]
@@ -0,0 +1,309 @@
+"""
+VectorIndex is a small on-disk embedding index for retrieval.
+
+Passages (the built-in safety guidance and FAQ, CWA earthquake reports)
+are embedded once and appended to a float16 matrix file; their id, source,
+text and a content hash go to a JSON-lines sidecar. Opening the index
+memory-maps the matrix, so startup parses no vectors and only the pages a
+search touches are read. add() embeds only passages whose text is new; a
+passage re-added under the same id with new text replaces the old row.
+
+Vectors are L2-normalised, so search() is a dot product: brute force in
+float32 blocks, or, once the index holds ivf_min rows, an inverted file
+(spherical k-means lists, probing the nprobe closest). The inverted file
+is rebuilt in a background thread whenever the index has grown by a
+quarter, and searches use brute force until it is ready.
+
+Several processes (gunicorn workers) can share one directory: appends
+happen under an exclusive file lock, after first reading the rows other
+processes appended, so a row number always means the same passage in
+every process. Searches pick up new rows first as well.
+"""
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only one process per index directory
+    fcntl = None
+
+_BLOCK_ROWS = 65536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class _InvertedFile:
+    def __init__(self, centroids: np.ndarray, lists: List[np.ndarray], rows: int) -> None:
+        self.centroids = centroids
+        self.lists = lists
+        self.rows = rows
+
+
+class VectorIndex:
+    def __init__(self, directory: str, embed: Callable[[List[str]], np.ndarray], ivf_min: int = 4096,
+                 ivf_lists: int = 0, ivf_probes: int = 8, batch_size: int = 32) -> None:
+        self.embed = embed
+        self.ivf_min = ivf_min
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self.batch_size = batch_size
+        os.makedirs(directory, exist_ok=True)
+        self._matrix_path = os.path.join(directory, "vectors.f16")
+        self._meta_path = os.path.join(directory, "passages.jsonl")
+        self._lock_path = os.path.join(directory, "index.lock")
+        # Bytes of the sidecar read so far; more means another process appended
+        self._meta_offset = 0
+        self._lock = threading.RLock()
+        self._passages: List[Dict] = []
+        self._row_by_id: Dict[str, int] = {}
+        self._live = np.zeros(0, dtype=bool)
+        self._matrix: Optional[np.ndarray] = None
+        self._dim = 0
+        self._ivf: Optional[_InvertedFile] = None
+        self._ivf_building = False
+
+        self.searches = 0
+        self.ivf_searches = 0
+        self._load()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Lock the index files against other processes. Take self._lock first."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_passages(self) -> bool:
+        """Read the sidecar lines past _meta_offset into self._passages. Returns True if a partial line is left."""
+        try:
+            with open(self._meta_path, "rb") as f:
+                f.seek(self._meta_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        for line in data.split(b"\n")[:-1]:
+            try:
+                self._passages.append(json.loads(line))
+            except ValueError:
+                return True
+            self._meta_offset += len(line) + 1
+        return not data.endswith(b"\n") and bool(data)
+
+    def _load(self) -> None:
+        with self._file_lock(exclusive=True):
+            torn = self._read_passages()  # a partial last line from an interrupted write
+            if not self._passages:
+                for path in (self._matrix_path, self._meta_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                return
+            self._dim = self._passages[0]["dim"]
+            row_bytes = self._dim * 2
+            stored = os.path.getsize(self._matrix_path) // row_bytes if os.path.exists(self._matrix_path) else 0
+            # Vectors are written before their metadata, so either side may be ahead after a crash
+            count = min(len(self._passages), stored)
+            if torn or len(self._passages) != count:
+                del self._passages[count:]
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(p, ensure_ascii=False) + "\n" for p in self._passages)
+                self._meta_offset = os.path.getsize(self._meta_path)
+            if stored != count:
+                with open(self._matrix_path, "r+b") as f:
+                    f.truncate(count * row_bytes)
+            for row, passage in enumerate(self._passages):
+                self._row_by_id[passage["id"]] = row
+            self._remap()
+        print(f"--- Vector index: {len(self)} passages, dim {self._dim} ---")
+
+    def _stale(self) -> bool:
+        try:
+            return os.path.getsize(self._meta_path) > self._meta_offset
+        except OSError:
+            return False
+
+    def _refresh(self) -> None:
+        """Pick up rows other processes appended. Call with self._lock and the file lock held."""
+        if not self._stale():
+            return
+        first = len(self._passages)
+        self._read_passages()
+        for row in range(first, len(self._passages)):
+            self._row_by_id[self._passages[row]["id"]] = row
+        if not self._dim and self._passages:
+            self._dim = self._passages[0]["dim"]
+        self._remap()
+
+    def _remap(self) -> None:
+        rows = len(self._passages)
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float16, mode="r", shape=(rows, self._dim)) if rows else None
+        self._live = np.zeros(rows, dtype=bool)
+        self._live[list(self._row_by_id.values())] = True
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    def add(self, passages: Iterable[Dict]) -> int:
+        """Embed and store passages ({"id", "text", "source"}) that are not indexed yet. Returns how many were added."""
+        with self._lock:
+            with self._file_lock(exclusive=False):
+                self._refresh()
+            pending = []
+            for passage in passages:
+                digest = _text_hash(passage["text"])
+                row = self._row_by_id.get(passage["id"])
+                if row is not None and self._passages[row]["hash"] == digest:
+                    continue
+                pending.append({"id": passage["id"], "source": passage.get("source", ""), "text": passage["text"],
+                                "hash": digest})
+            pending = list({p["id"]: p for p in pending}.values())
+        added = 0
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            vectors = _normalize(self.embed([p["text"] for p in batch])).astype(np.float16)
+            with self._lock, self._file_lock(exclusive=True):
+                # Rows other processes appended meanwhile come first, so our row numbers match the files
+                self._refresh()
+                # Skip passages another process indexed with the same text while we were embedding
+                keep = [i for i, p in enumerate(batch) if self._row_by_id.get(p["id"]) is None
+                        or self._passages[self._row_by_id[p["id"]]]["hash"] != p["hash"]]
+                if not keep:
+                    continue
+                batch, vectors = [batch[i] for i in keep], vectors[keep]
+                if not self._dim:
+                    self._dim = vectors.shape[1]
+                if vectors.shape[1] != self._dim:
+                    raise ValueError(f"embedding dimension {vectors.shape[1]} does not match the index ({self._dim})")
+                rows = len(self._passages)
+                with open(self._matrix_path, "ab") as f:
+                    # Drop vectors whose metadata a crashed process never wrote
+                    if f.tell() != rows * self._dim * 2:
+                        f.truncate(rows * self._dim * 2)
+                    f.write(vectors.tobytes())
+                lines = []
+                for passage in batch:
+                    passage["dim"] = self._dim
+                    lines.append((json.dumps(passage, ensure_ascii=False) + "\n").encode("utf-8"))
+                with open(self._meta_path, "ab") as f:
+                    if f.tell() != self._meta_offset:
+                        f.truncate(self._meta_offset)
+                    f.write(b"".join(lines))
+                self._meta_offset += sum(len(line) for line in lines)
+                for passage in batch:
+                    self._row_by_id[passage["id"]] = len(self._passages)
+                    self._passages.append(passage)
+                self._remap()
+                added += len(batch)
+        if added:
+            self._maybe_build_ivf()
+        return added
+
+    def _maybe_build_ivf(self) -> None:
+        with self._lock:
+            rows = len(self._passages)
+            if rows < self.ivf_min or self._ivf_building:
+                return
+            if self._ivf is not None and rows < self._ivf.rows * 1.25:
+                return
+            self._ivf_building = True
+            matrix = self._matrix
+        threading.Thread(target=self._build_ivf, args=(matrix,), name="vector-ivf", daemon=True).start()
+
+    def _build_ivf(self, matrix: np.ndarray, iterations: int = 10) -> None:
+        try:
+            rows = matrix.shape[0]
+            nlist = self.ivf_lists or max(1, int(np.sqrt(rows)))
+            rng = np.random.default_rng(0)
+            centroids = _normalize(matrix[np.sort(rng.choice(rows, size=min(nlist, rows), replace=False))])
+            for _ in range(iterations):
+                assign = self._assign(matrix, centroids)
+                sums = np.zeros_like(centroids)
+                for start in range(0, rows, _BLOCK_ROWS):
+                    block = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32)
+                    np.add.at(sums, assign[start:start + _BLOCK_ROWS], block)
+                empty = ~sums.any(axis=1)
+                sums[empty] = centroids[empty]  # keep a centroid that lost all its members
+                centroids = _normalize(sums)
+            assign = self._assign(matrix, centroids)
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+            lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(centroids))]
+            with self._lock:
+                self._ivf = _InvertedFile(centroids, lists, rows)
+            print(f"--- Vector index: inverted file built over {rows} rows, {len(centroids)} lists ---")
+        except Exception as e:
+            print(f"Vector index: inverted file build failed: {e}")
+        finally:
+            with self._lock:
+                self._ivf_building = False
+
+    @staticmethod
+    def _assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        assign = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], _BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32)
+            assign[start:start + _BLOCK_ROWS] = np.argmax(block @ centroids.T, axis=1)
+        return assign
+
+    def search(self, query: np.ndarray, k: int = 4) -> List[Tuple[float, Dict]]:
+        """The k passages most similar to the query vector, as (cosine similarity, passage), best first."""
+        with self._lock:
+            if self._stale():
+                with self._file_lock(exclusive=False):
+                    self._refresh()
+            matrix, live, ivf, passages = self._matrix, self._live, self._ivf, self._passages
+            self.searches += 1
+        if matrix is None or k <= 0:
+            return []
+        q = _normalize(query).reshape(-1)
+        if q.shape[0] != matrix.shape[1]:
+            raise ValueError(f"query dimension {q.shape[0]} does not match the index ({matrix.shape[1]})")
+
+        if ivf is not None:
+            self.ivf_searches += 1
+            probes = np.argsort(ivf.centroids @ q)[::-1][:self.ivf_probes]
+            # Rows appended since the build are not in any list yet, so they are always scanned
+            rows = np.concatenate([ivf.lists[i] for i in probes] + [np.arange(ivf.rows, matrix.shape[0])])
+            rows = np.sort(rows[live[rows]])
+            scores = np.asarray(matrix[rows], dtype=np.float32) @ q
+        else:
+            scores = np.empty(matrix.shape[0], dtype=np.float32)
+            for start in range(0, matrix.shape[0], _BLOCK_ROWS):
+                scores[start:start + _BLOCK_ROWS] = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32) @ q
+            scores[~live] = -np.inf
+            rows = np.arange(matrix.shape[0])
+        if not len(rows):
+            return []
+        top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), passages[rows[i]]) for i in top if np.isfinite(scores[i])]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "passages": len(self),
+                "rows": len(self._passages),
+                "dim": self._dim,
+                "ivf_lists": len(self._ivf.lists) if self._ivf is not None else 0,
+                "searches": self.searches,
+                "ivf_searches": self.ivf_searches,
+            }
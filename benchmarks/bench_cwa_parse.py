@@ -0,0 +1,165 @@
+"""
+The columnar CWA significant earthquake parser and renderer versus the
+previous one-quake-at-a-time versions, on E-A0015-001 payloads.
+
+    python -m benchmarks.bench_cwa_parse --quakes 10 100 1000 5000
+    python -m benchmarks.bench_cwa_parse --payload saved_E-A0015-001.json
+
+Payloads are synthetic unless --payload points at a saved API response:
+records shaped like the API's, with a realistic Intensity section. The
+"api" shape uses the keys and JSON numbers the API sends today; "mixed"
+turns --variants of the records into the other case variants the parser
+accepts (lower-case epicenter/magnitude keys, numbers as strings with
+units, missing fields), which takes the slower string extraction path.
+For each payload the parsed frames and the rendered text must be
+identical before the timings (best of --repeat) are reported. The one intended difference:
+the old renderer printed "nan" for a missing location or report link
+(NaN is truthy), where the new one prints "—" / "None" as it meant to.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+LOCATIONS = [
+    "花蓮縣政府南南東方 25.0 公里 (位於臺灣東部海域)",
+    "宜蘭縣政府東南方 74.3 公里 (位於臺灣東部海域)",
+    "臺東縣政府北北東方 31.5 公里 (位於臺東縣海端鄉)",
+    "南投縣政府東南方 32.0 公里 (位於南投縣信義鄉)",
+]
+COUNTIES = ["花蓮縣", "宜蘭縣", "臺東縣", "南投縣", "臺北市", "新北市", "臺中市", "高雄市"]
+
+
+def make_quake(rng: random.Random, number: int, when: datetime, variants: float) -> dict:
+    lat, lon = round(rng.uniform(21.5, 25.5), 2), round(rng.uniform(119.5, 122.5), 2)
+    mag, depth = round(rng.uniform(3.5, 7.2), 1), round(rng.uniform(5, 80), 1)
+    variant = rng.random()
+    if variant >= variants:
+        info = {
+            "OriginTime": when.strftime("%Y-%m-%d %H:%M:%S"), "Source": "中央氣象署", "FocalDepth": depth,
+            "Epicenter": {"Location": rng.choice(LOCATIONS), "EpicenterLatitude": lat, "EpicenterLongitude": lon},
+            "EarthquakeMagnitude": {"MagnitudeType": "芮氏規模", "MagnitudeValue": mag},
+        }
+    elif variant < variants * 2 / 3:
+        info = {
+            "OriginTime": when.strftime("%Y-%m-%d %H:%M:%S"), "depth": f"{depth} km",
+            "epicenter": {"location": rng.choice(LOCATIONS), "epicenterLatitude": str(lat), "epicenterLongitude": str(lon)},
+            "magnitude": {"magnitudeValue": f"M{mag}"},
+        }
+    else:
+        info = {"OriginTime": when.strftime("%Y-%m-%d %H:%M:%S"), "Epicenter": {}, "Magnitude": {"Value": mag}}
+    quake = {
+        "EarthquakeNo": 113000 + number,
+        "ReportType": "地震報告", "ReportColor": "綠色",
+        "ReportContent": f"{when:%m/%d-%H:%M}發生規模{mag}有感地震，最大震度3級。",
+        "ReportImageURI": f"https://scweb.cwa.gov.tw/webdata/OLDEQ/{when:%Y%m}/{number}.png",
+        "EarthquakeInfo": info,
+        "Intensity": {"ShakingArea": [
+            {"AreaDesc": f"最大震度{rng.randint(1, 5)}級地區", "CountyName": county, "AreaIntensity": f"{rng.randint(1, 5)}級",
+             "EqStation": [{"StationName": f"{county}{i}", "StationID": f"S{i:03d}", "SeismicIntensity": "2級",
+                            "StationLatitude": lat, "StationLongitude": lon} for i in range(6)]}
+            for county in rng.sample(COUNTIES, 4)
+        ]},
+    }
+    if rng.random() < 0.8:
+        quake["Web" if rng.random() < 0.7 else "ReportURL"] = f"https://www.cwa.gov.tw/V8/C/E/EQ/EQ{quake['EarthquakeNo']}.html"
+    return quake
+
+
+def make_payload(count: int, variants: float = 0.0, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    quakes = [make_quake(rng, i, start + timedelta(seconds=rng.randrange(366 * 86400)), variants) for i in range(count)]
+    return {"success": "true", "records": {"datasetDescription": "地震報告", "Earthquake": quakes}}
+
+
+def legacy_parse(obj: dict) -> pd.DataFrame:
+    """_parse_significant_earthquakes before it became columnar."""
+    from api.cwa_service import TAIPEI_TZ, _to_float
+
+    records = obj.get("records", {})
+    quakes = records.get("Earthquake", [])
+    rows = []
+    for q in quakes:
+        ei = q.get("EarthquakeInfo", {})
+        epic = ei.get("Epicenter") or ei.get("epicenter") or {}
+        mag_info = ei.get("Magnitude") or ei.get("magnitude") or ei.get("EarthquakeMagnitude") or {}
+        depth_raw = ei.get("FocalDepth") or ei.get("depth") or ei.get("Depth")
+        mag_raw = mag_info.get("MagnitudeValue") or mag_info.get("magnitudeValue") or mag_info.get("Value") or mag_info.get("value")
+        rows.append({
+            "ID": q.get("EarthquakeNo"), "Time": ei.get("OriginTime"),
+            "Lat": _to_float(epic.get("EpicenterLatitude") or epic.get("epicenterLatitude")),
+            "Lon": _to_float(epic.get("EpicenterLongitude") or epic.get("epicenterLongitude")),
+            "Depth": _to_float(depth_raw),
+            "Magnitude": _to_float(mag_raw),
+            "Location": epic.get("Location") or epic.get("location"),
+            "URL": q.get("Web") or q.get("ReportURL"),
+            "Report": q.get("ReportContent"),
+        })
+    df = pd.DataFrame(rows)
+    if not df.empty and "Time" in df.columns:
+        df["Time"] = pd.to_datetime(df["Time"], errors="coerce").dt.tz_localize(TAIPEI_TZ)
+    return df
+
+
+def legacy_render(df: pd.DataFrame) -> list:
+    """fetch_significant_earthquakes' iterrows loop."""
+    lines = []
+    for _, row in df.iterrows():
+        mag_str = f"{row['Magnitude']:.1f}" if pd.notna(row['Magnitude']) else "—"
+        depth_str = f"{row['Depth']:.0f}" if pd.notna(row['Depth']) else "—"
+        lines.append(
+            f"Time: {row['Time'].strftime('%Y-%m-%d %H:%M') if pd.notna(row['Time']) else '—'}\n"
+            f"Location: {row['Location'] or '—'}\n"
+            f"Magnitude: M{mag_str} | Depth: {depth_str} km\n"
+            f"Report: {row['URL'] or 'None'}"
+        )
+    return lines
+
+
+def best_of(repeat: int, fn, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quakes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--payload", default="", help="a saved E-A0015-001 JSON response to use instead")
+    parser.add_argument("--variants", type=float, default=0.3, help="share of records in other case variants (mixed shape)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    from api.cwa_service import _parse_significant_earthquakes, _render_significant
+
+    if args.payload:
+        with open(args.payload, encoding="utf-8") as f:
+            payloads = [("saved", json.load(f))]
+    else:
+        payloads = [(shape, make_payload(n, variants)) for shape, variants in (("api", 0.0), ("mixed", args.variants))
+                    for n in args.quakes]
+
+    print(f"{'shape':>6} {'quakes':>7} {'parse old':>10} {'parse new':>10} {'speedup':>8} "
+          f"{'render old':>11} {'render new':>11} {'speedup':>8}")
+    for shape, payload in payloads:
+        old_parse, old_df = best_of(args.repeat, legacy_parse, payload)
+        new_parse, new_df = best_of(args.repeat, _parse_significant_earthquakes, payload)
+        # ImageURL was added for the significant earthquake store
+        pd.testing.assert_frame_equal(old_df, new_df.drop(columns="ImageURL"), check_dtype=False)
+        old_render, old_text = best_of(args.repeat, legacy_render, old_df)
+        new_render, new_text = best_of(args.repeat, lambda df: list(_render_significant(df)), new_df)
+        old_text = [t.replace("Location: nan\n", "Location: —\n").replace("Report: nan", "Report: None") for t in old_text]
+        assert old_text == new_text, "rendered text differs"
+        print(f"{shape:>6} {len(old_df):>7} {old_parse * 1000:>8.2f}ms {new_parse * 1000:>8.2f}ms {old_parse / new_parse:>7.1f}x "
+              f"{old_render * 1000:>9.2f}ms {new_render * 1000:>9.2f}ms {old_render / new_render:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
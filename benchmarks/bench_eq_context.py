@@ -0,0 +1,99 @@
+"""
+Prompt size (and optionally Ollama latency) of the earthquake context:
+the old one-line-per-quake listing versus build_earthquake_context.
+
+    python -m benchmarks.bench_eq_context --rows 50 500 3000
+    python -m benchmarks.bench_eq_context --rows 3000 --ollama http://localhost:11434 --model gemma3:270m
+
+Search results are synthetic but shaped like the MCP server's rows. With
+--ollama each prompt is sent once (non-streaming, 32 output tokens) and
+Ollama's own prompt_eval_count / prompt_eval_duration / total_duration are
+reported, so the difference is prompt evaluation rather than generation.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+REGIONS = [
+    "花蓮縣政府東南方 20.0 公里 (位於臺灣東部海域)",
+    "宜蘭縣政府東方 35.2 公里 (位於臺灣東北部海域)",
+    "臺東縣政府北方 18.4 公里 (位於臺東縣卑南鄉)",
+    "南投縣政府東南方 25.1 公里 (位於南投縣信義鄉)",
+    "12 km SSE of Hualien City, Taiwan",
+]
+
+
+def make_rows(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    rows = []
+    for _ in range(count):
+        t = start + timedelta(seconds=rng.randrange(366 * 86400))
+        rows.append({
+            "Time": t.strftime("%Y-%m-%d %H:%M:%S"),
+            "Location": rng.choice(REGIONS),
+            "Magnitude": round(min(7.5, 3.0 + rng.expovariate(1.2)), 1),
+            "Depth": round(rng.uniform(2, 120), 1),
+        })
+    return rows
+
+
+def legacy_context(eq_list, header: str) -> str:
+    """The context generate_ai_text built before the compactor."""
+    context = f"{header}\n\n"
+    context += f"Found {len(eq_list)} earthquake(s):\n\n"
+    for i, eq in enumerate(eq_list, 1):
+        context += (f"{i}. Time: {eq.get('Time', 'Unknown')}, Location: {eq.get('Location', 'Unknown')}, "
+                    f"Magnitude: M{eq.get('Magnitude', 'N/A')}, Depth: {eq.get('Depth', 'N/A')} km\n")
+    return context
+
+
+def ollama_latency(url: str, model: str, prompt: str):
+    import requests
+
+    payload = {"model": model, "prompt": prompt, "stream": False, "options": {"num_predict": 32}}
+    started = time.perf_counter()
+    response = requests.post(f"{url.rstrip('/')}/api/generate", json=payload, timeout=600)
+    response.raise_for_status()
+    result = response.json()
+    return {
+        "wall_s": time.perf_counter() - started,
+        "prompt_eval_count": result.get("prompt_eval_count"),
+        "prompt_eval_s": result.get("prompt_eval_duration", 0) / 1e9,
+        "total_s": result.get("total_duration", 0) / 1e9,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[50, 500, 3000])
+    parser.add_argument("--ollama", default="", help="Ollama base URL; omit to measure prompt size only")
+    parser.add_argument("--model", default="gemma3:270m")
+    args = parser.parse_args(argv)
+
+    from api.ai_service import OLLAMA_PROMPT_TEMPLATE
+    from api.eq_context import build_earthquake_context
+    from api.tokens import estimate_tokens
+
+    question = "2024 年台灣發生了哪些地震？"
+    header = "Earthquake Search Results (2024-01-01 to 2024-12-31, M≥3.0):"
+    print(f"{'rows':>6} {'context':>8} {'chars':>8} {'~tokens':>8} {'build ms':>9}"
+          + ("  prompt_eval_count  prompt_eval_s  total_s" if args.ollama else ""))
+    for count in args.rows:
+        rows = make_rows(count)
+        for name, build in (("legacy", lambda: legacy_context(rows, header)),
+                            ("compact", lambda: build_earthquake_context(rows, header=header))):
+            started = time.perf_counter()
+            context = build()
+            build_ms = (time.perf_counter() - started) * 1000
+            prompt = OLLAMA_PROMPT_TEMPLATE.format(context=context, prompt=question)
+            line = f"{count:>6} {name:>8} {len(prompt):>8} {estimate_tokens(prompt):>8} {build_ms:>9.1f}"
+            if args.ollama:
+                r = ollama_latency(args.ollama, args.model, prompt)
+                line += f"  {r['prompt_eval_count']!s:>17}  {r['prompt_eval_s']:>13.2f}  {r['total_s']:>7.2f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
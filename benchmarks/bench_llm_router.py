@@ -0,0 +1,68 @@
+"""
+Tail latency of LLMRouter with and without hedging, against stub LLM
+servers (no model or network needed).
+
+    python -m benchmarks.bench_llm_router --requests 200 --tail-prob 0.1 --tail-delay 3
+
+The primary is an Ollama-style stub with a fast first token but a slow
+tail (--tail-prob of requests wait --tail-delay seconds); the secondary is
+an OpenAI-compatible stub that is steadily slower. "single" routes to the
+primary only, "hedged" adds the secondary with the router's hedging. The
+report shows time-to-first-token and total latency percentiles, how many
+hedges were sent and won, and how many losing streams the stubs saw closed.
+"""
+import argparse
+import time
+
+from .stub_llm import StubLLMServer
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return f"p50 {pick(0.5) * 1000:7.0f} ms  p90 {pick(0.9) * 1000:7.0f} ms  p99 {pick(0.99) * 1000:7.0f} ms"
+
+
+def run(router, count: int):
+    ttft, total = [], []
+    payload = {"model": "stub", "prompt": "hi", "options": {"num_predict": 16}}
+    for _ in range(count):
+        started = time.perf_counter()
+        first = []
+        router.generate("/api/generate", payload, on_token=lambda piece: first or first.append(time.perf_counter()))
+        total.append(time.perf_counter() - started)
+        ttft.append(first[0] - started)
+    return ttft, total
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--tail-prob", type=float, default=0.1)
+    parser.add_argument("--tail-delay", type=float, default=3.0)
+    parser.add_argument("--secondary-ttft", type=float, default=0.15)
+    parser.add_argument("--percentile", type=float, default=0.9)
+    args = parser.parse_args(argv)
+
+    from api.llm_router import LLMBackend, LLMRouter, OpenAICompatibleBackend
+
+    for mode in ("single", "hedged"):
+        primary = StubLLMServer(ttft=0.03, tail_prob=args.tail_prob, tail_delay=args.tail_delay, seed=1).start()
+        secondary = StubLLMServer(kind="openai", ttft=args.secondary_ttft, seed=2).start()
+        backends = [LLMBackend(primary.base_url, name="primary")]
+        if mode == "hedged":
+            backends.append(OpenAICompatibleBackend(secondary.base_url, name="secondary"))
+        router = LLMRouter(backends, hedge_percentile=args.percentile, min_hedge_delay=0.05, max_hedge_delay=1.0)
+        ttft, total = run(router, args.requests)
+        stats = router.stats()
+        time.sleep(0.2)  # let losing streams notice they were closed
+        print(f"{mode:>7} ttft   {_percentiles(ttft)}")
+        print(f"{mode:>7} total  {_percentiles(total)}")
+        print(f"{'':>7} hedges {stats['hedges']}, hedge wins {stats['hedge_wins']}, "
+              f"primary {primary.stats()}, secondary {secondary.stats()}")
+        primary.stop()
+        secondary.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Throughput of the long-polling runner versus the webhook, against the mock
+Telegram server (no network needed).
+
+    python -m benchmarks.bench_poller --updates 2000 --chats 50 --work-ms 20
+
+Each update is handled by a stand-in for handle_message that sleeps for
+--work-ms (the LLM / rendering part) and then replies through
+api.telegram.send_message. The run ends when every reply has reached the
+mock server.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .mock_telegram import MockTelegramServer, make_text_updates
+
+TOKEN = "bench-token"
+
+
+def _setup_env(server: MockTelegramServer) -> None:
+    # Must happen before api.config is imported
+    os.environ["BOT_TOKEN"] = TOKEN
+    os.environ["TELEGRAM_API_BASE"] = server.base_url
+    os.environ.setdefault("IS_DEBUG_MODE", "0")
+    # The mock server has no rate limits, so measure the transport rather than the pacing
+    os.environ.setdefault("TG_GLOBAL_RATE", "100000")
+    os.environ.setdefault("TG_CHAT_RATE", "100000")
+
+
+def _make_handler(work_ms: float):
+    from api.telegram import send_message
+
+    def handler(update):
+        time.sleep(work_ms / 1000)
+        message = update["message"]
+        send_message(message["chat"]["id"], f"echo {message['text']}")
+
+    return handler
+
+
+def bench_poller(server, updates, handler, workers: int) -> float:
+    from api.dispatcher import UpdateDispatcher
+    from api.poller import UpdatePoller
+
+    dispatcher = UpdateDispatcher(handler, workers=workers, max_pending=len(updates) + 1)
+    poller = UpdatePoller(dispatcher, api_base=server.base_url, token=TOKEN, poll_timeout=1)
+    stop = threading.Event()
+    expected = server.call_count("sendMessage") + len(updates)
+
+    start = time.perf_counter()
+    server.push_updates(updates)
+    thread = threading.Thread(target=poller.run, args=(stop,), daemon=True)
+    thread.start()
+    if not server.wait_for_calls("sendMessage", expected):
+        print("poller: timed out waiting for replies", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed
+
+
+def bench_webhook(server, updates, handler, workers: int, connections: int) -> float:
+    import requests
+    from werkzeug.serving import make_server
+    import api.index as index
+    from api.dispatcher import UpdateDispatcher
+
+    index.dispatcher = UpdateDispatcher(handler, workers=workers, max_pending=len(updates) + 1)
+    httpd = make_server("127.0.0.1", 0, index.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_port}/"
+    expected = server.call_count("sendMessage") + len(updates)
+
+    local = threading.local()
+
+    def post(update):
+        # Telegram keeps up to `max_connections` webhook connections open
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        session.post(url, json=update, timeout=30)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        list(pool.map(post, updates))
+    if not server.wait_for_calls("sendMessage", expected):
+        print("webhook: timed out waiting for replies", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    httpd.shutdown()
+    return elapsed
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--work-ms", type=float, default=20.0)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--connections", type=int, default=40, help="concurrent webhook connections")
+    parser.add_argument("--mode", choices=["both", "poller", "webhook"], default="both")
+    args = parser.parse_args(argv)
+
+    server = MockTelegramServer(token=TOKEN).start()
+    _setup_env(server)
+    handler = _make_handler(args.work_ms)
+
+    results = {}
+    next_id = 1
+    if args.mode in ("both", "poller"):
+        updates = make_text_updates(args.updates, args.chats, start_id=next_id)
+        next_id += args.updates
+        results["poller"] = bench_poller(server, updates, handler, args.workers)
+    if args.mode in ("both", "webhook"):
+        updates = make_text_updates(args.updates, args.chats, start_id=next_id)
+        results["webhook"] = bench_webhook(server, updates, handler, args.workers, args.connections)
+    server.stop()
+
+    print(f"{args.updates} updates, {args.chats} chats, {args.work_ms:g} ms work, {args.workers} workers")
+    for mode, elapsed in results.items():
+        print(f"  {mode:8s} {elapsed:7.2f} s  {args.updates / elapsed:8.1f} updates/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+A small in-process stand-in for the Telegram Bot API, used by the
+benchmarks so they run without network access.
+
+    server = MockTelegramServer(token="bench").start()
+    os.environ["TELEGRAM_API_BASE"] = server.base_url   # before importing api.*
+    server.push_updates([...])
+    ...
+    server.stop()
+
+getUpdates honours offset/limit/timeout like the real API and every other
+method answers {"ok": true} with an incrementing message_id. Calls are
+recorded per method, and queue_error() makes the next calls of a method
+fail with a given status (e.g. 429 with retry_after) to exercise retries.
+"""
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+class MockTelegramServer:
+    def __init__(self, token: str = "bench-token", host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, max_hold: float = 1.0) -> None:
+        self.token = token
+        self.latency = latency
+        self.max_hold = max_hold
+        self._updates: List[Dict] = []
+        self._cond = threading.Condition()
+        self._message_id = 0
+        self._errors = defaultdict(deque)
+        self.calls = defaultdict(list)
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch()
+
+            def do_POST(self):
+                self._dispatch()
+
+            def _dispatch(self):
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                ctype = self.headers.get("Content-Type", "")
+                if body and ctype.startswith("application/json"):
+                    params.update(json.loads(body))
+                elif body and ctype.startswith("application/x-www-form-urlencoded"):
+                    params.update({k: v[-1] for k, v in parse_qs(body.decode()).items()})
+                prefix = f"/bot{server.token}/"
+                if not url.path.startswith(prefix):
+                    return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                status, payload = server._handle(url.path[len(prefix):], params)
+                self._reply(status, payload)
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockTelegramServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def push_updates(self, updates: List[Dict]) -> None:
+        with self._cond:
+            self._updates.extend(updates)
+            self._cond.notify_all()
+
+    def queue_error(self, method: str, status: int, retry_after: Optional[int] = None, count: int = 1) -> None:
+        """Make the next `count` calls of `method` fail with `status`."""
+        payload = {"ok": False, "error_code": status, "description": f"Mock error {status}"}
+        if retry_after is not None:
+            payload["parameters"] = {"retry_after": retry_after}
+        for _ in range(count):
+            self._errors[method].append((status, payload))
+
+    def call_count(self, method: str) -> int:
+        return len(self.calls[method])
+
+    def wait_for_calls(self, method: str, count: int, timeout: float = 60.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.call_count(method) >= count:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _handle(self, method: str, params: Dict):
+        self.calls[method].append((time.monotonic(), params))
+        if self._errors[method]:
+            try:
+                return self._errors[method].popleft()
+            except IndexError:
+                pass
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(params)}
+        if self.latency:
+            time.sleep(self.latency)
+        if method == "getFile":
+            file_id = params.get("file_id", "")
+            return 200, {"ok": True, "result": {"file_id": file_id, "file_path": f"photos/{file_id}.jpg"}}
+        with self._cond:
+            self._message_id += 1
+            message_id = self._message_id
+        return 200, {"ok": True, "result": {"message_id": message_id, "chat": {"id": params.get("chat_id")}}}
+
+    def _get_updates(self, params: Dict) -> List[Dict]:
+        offset = int(params.get("offset") or 0)
+        limit = min(100, int(params.get("limit") or 100))
+        hold = min(float(params.get("timeout") or 0), self.max_hold)
+        deadline = time.monotonic() + hold
+        with self._cond:
+            # Confirmed updates are forgotten, like the real server does
+            if offset:
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+            return self._updates[:limit]
+
+
+def make_text_updates(count: int, chats: int, start_id: int = 1) -> List[Dict]:
+    """Build `count` private-chat text updates spread round-robin over `chats` chats."""
+    updates = []
+    for i in range(count):
+        chat_id = 100000 + i % chats
+        updates.append({
+            "update_id": start_id + i,
+            "message": {
+                "message_id": i + 1,
+                "from": {"id": chat_id, "is_bot": False, "first_name": "bench", "username": f"user{chat_id}"},
+                "chat": {"id": chat_id, "type": "private"},
+                "date": int(time.time()),
+                "text": f"message {i}",
+            },
+        })
+    return updates
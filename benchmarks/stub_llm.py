@@ -0,0 +1,144 @@
+"""
+An in-process stand-in for an LLM server, speaking either Ollama's
+streaming API (/api/generate, /api/chat, /api/tags) or an OpenAI-compatible
+/v1/chat/completions stream, so the LLM router can be exercised without a
+model.
+
+    slow = StubLLMServer(ttft=0.05, tail_prob=0.2, tail_delay=5).start()
+    fast = StubLLMServer(kind="openai", ttft=0.2).start()
+    ...
+    slow.stop(); fast.stop()
+
+Each request waits `ttft` seconds (or `tail_delay` with probability
+`tail_prob`) before the first token, then streams `tokens` tokens
+`token_delay` apart; with probability `fail_prob` it answers 500 instead.
+A client that disconnects mid-stream is counted in `aborted`, which is how
+a cancelled hedge shows up on the server side. Responses use chunked
+transfer encoding like Ollama's, so each token reaches the client as soon
+as it is written instead of waiting for a read buffer to fill.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class StubLLMServer:
+    def __init__(self, kind: str = "ollama", host: str = "127.0.0.1", port: int = 0, ttft: float = 0.05,
+                 tail_prob: float = 0.0, tail_delay: float = 5.0, fail_prob: float = 0.0, tokens: int = 20,
+                 token_delay: float = 0.005, seed: int = 0) -> None:
+        self.kind = kind
+        self.ttft = ttft
+        self.tail_prob = tail_prob
+        self.tail_delay = tail_delay
+        self.fail_prob = fail_prob
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.completed = 0
+        self.aborted = 0
+        self.failed = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    return self._json(200, {"models": []})
+                self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server._serve(self, body)
+
+            def _json(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _serve(self, handler, body) -> None:
+        with self._lock:
+            self.requests += 1
+            fail = self._rng.random() < self.fail_prob
+            delay = self.tail_delay if self._rng.random() < self.tail_prob else self.ttft
+        if fail:
+            with self._lock:
+                self.failed += 1
+            return handler._json(500, {"error": "stub failure"})
+        time.sleep(delay)
+        chat = handler.path.endswith("/chat") or handler.path.endswith("/chat/completions")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream" if self.kind == "openai" else "application/x-ndjson")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        try:
+            for i in range(self.tokens):
+                self._write_chunk(handler, self._chunk(f"t{i} ", chat, done=False))
+                time.sleep(self.token_delay)
+            self._write_chunk(handler, self._chunk("", chat, done=True))
+            self._write_chunk(handler, b"")
+        except (BrokenPipeError, ConnectionResetError):
+            with self._lock:
+                self.aborted += 1
+            return
+        finally:
+            handler.close_connection = True
+        with self._lock:
+            self.completed += 1
+
+    @staticmethod
+    def _write_chunk(handler, data: bytes) -> None:
+        """One HTTP/1.1 chunk; an empty one ends the body."""
+        handler.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        handler.wfile.flush()
+
+    def _chunk(self, text: str, chat: bool, done: bool) -> bytes:
+        if self.kind == "openai":
+            if done:
+                return b"data: [DONE]\n\n"
+            return b"data: " + json.dumps({"choices": [{"delta": {"content": text}}]}).encode() + b"\n\n"
+        if chat:
+            chunk = {"message": {"role": "assistant", "content": text}, "done": done}
+        else:
+            chunk = {"response": text, "done": done}
+        if done:
+            chunk.update({"eval_count": self.tokens, "eval_duration": int(self.tokens * self.token_delay * 1e9),
+                          "prompt_eval_duration": int(self.ttft * 1e9)})
+        return json.dumps(chunk).encode() + b"\n"
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "completed": self.completed, "aborted": self.aborted,
+                    "failed": self.failed}